@@ -2,26 +2,104 @@
 Сборка агента: router -> tool -> answer.
 """
 
-from langchain.agents import create_agent
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+import asyncio
+import contextlib
+import copy
+import os
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
 
-from agent.config import reset_dry_run, reset_verbose, set_dry_run, set_verbose
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from agent import memory, recall
+from agent.config import (
+    MEMORY_BACKGROUND_COMPACTION,
+    MEMORY_RECALL_K,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_FILE,
+    get_dry_run,
+    reset_dry_run,
+    reset_verbose,
+    set_dry_run,
+    set_verbose,
+)
+from agent.context import MESSAGE_OVERHEAD_TOKENS, build_context, count_tokens
+from agent.executor import ToolExecutor
+from agent.facts import FactIndex
 from agent.llm_client import get_llm
-from agent.memory import append_message, compact_if_needed, load_conversation, load_memory
+from agent.memory import (
+    append_message,
+    append_usage,
+    compact_if_needed,
+    compact_in_background,
+    load_conversation,
+    load_memory,
+)
+from agent.response_cache import ResponseCache
+from agent.tracing import Tracer, current_span, reset_tracer, set_tracer, span
 from agent.tools import get_all_tools
 
 
+def create_agent(model, tools):
+    """Граф агента LangChain; langchain.agents (langgraph) импортируется при первой сборке."""
+    from langchain.agents import create_agent as _create_agent
+
+    return _create_agent(model, tools)
+
+
 SYSTEM_PROMPT = """Ты — helpful CLI-агент. Отвечай на русском, структурированно (итог + детали/источники).
 Если контекста недостаточно — задай 1 уточняющий вопрос вместо угадывания.
-Доступные инструменты: web_search, http_request, read_file, write_file, list_files, execute_terminal, get_weather, get_crypto_price."""
+Доступные инструменты: web_search, http_request, read_file, write_file, list_files, execute_terminal, get_weather, get_weather_many, get_crypto_price, get_crypto_prices, remember_fact, forget_fact, list_facts, add_todo, update_todo.
+Устойчивые факты о пользователе (имя, город, предпочтения) запоминай через remember_fact, договорённости о делах — через add_todo."""
+
+
+# Длина реплики из архива в промпте (символов)
+RECALL_SNIPPET_CHARS = 500
 
 
-def _conversation_to_messages(conv: list[dict], memory_summary: str) -> list:
-    """Преобразовать историю + summary в сообщения для LLM."""
-    msgs = []
+def _memory_context(
+    memory_summary: str,
+    recalled: list[dict] = (),
+    facts: list[dict] = (),
+    todos: list[dict] = (),
+) -> str:
+    """Текст хвостового SystemMessage: summary, относящиеся к запросу факты/задачи и реплики из архива."""
+    parts = []
     if memory_summary:
-        msgs.append(SystemMessage(content=f"Контекст из памяти:\n{memory_summary}"))
-    msgs.append(SystemMessage(content=SYSTEM_PROMPT))
+        parts.append(f"Контекст из памяти:\n{memory_summary}")
+    if facts:
+        parts.append("Известные факты:\n" + "\n".join(f"- {f['key']}: {f.get('value', '')}" for f in facts))
+    if todos:
+        parts.append("Открытые задачи:\n" + "\n".join(f"- [{t['id']}] {t.get('text', '')}" for t in todos))
+    if recalled:
+        lines = [
+            f"- [{m.get('ts', '')[:10]}] {m.get('role', '?')}: {(m.get('content', '') or '')[:RECALL_SNIPPET_CHARS]}"
+            for m in recalled
+        ]
+        parts.append("Реплики из архива диалога, похожие на запрос:\n" + "\n".join(lines))
+    return "\n\n".join(parts)
+
+
+def _fixed_tokens(memory_summary: str, query: str, *extra: list[dict]) -> int:
+    """Токены частей запроса, которые не зависят от истории (extra — как в _memory_context)."""
+    context = _memory_context(memory_summary, *extra)
+    parts = [SYSTEM_PROMPT, query] + ([context] if context else [])
+    return sum(count_tokens(p) + MESSAGE_OVERHEAD_TOKENS for p in parts)
+
+
+def _conversation_to_messages(conv: list[dict], memory_summary: str, *extra: list[dict]) -> list:
+    """
+    Преобразовать историю + summary в сообщения для LLM.
+
+    Порядок рассчитан на prefix-кэш провайдера: статичный SYSTEM_PROMPT всегда
+    первый (схемы инструментов передаются отдельно и тоже не меняются), затем
+    история, которая между ходами только дописывается. Summary меняется после
+    каждой компакции, а реплики из архива и факты (extra: recalled, facts,
+    todos) — с каждым запросом, поэтому они идут в конце — перед новым
+    запросом — и не сбрасывают кэш для всего, что выше.
+    """
+    msgs = [SystemMessage(content=SYSTEM_PROMPT)]
     for m in conv:
         role = m.get("role", "")
         content = m.get("content", "") or ""
@@ -29,53 +107,484 @@ def _conversation_to_messages(conv: list[dict], memory_summary: str) -> list:
             msgs.append(HumanMessage(content=content))
         elif role == "assistant" or role == "ai":
             msgs.append(AIMessage(content=content))
+    context = _memory_context(memory_summary, *extra)
+    if context:
+        msgs.append(SystemMessage(content=context))
     return msgs
 
 
-def process_query(query: str, *, verbose: bool = False, dry_run: bool = False) -> str:
+def _collect_usage(out_messages: list) -> dict:
+    """Суммарный usage вызовов модели за ход, включая токены из prefix-кэша."""
+    usage = {"model_calls": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0}
+    for m in out_messages:
+        meta = getattr(m, "usage_metadata", None) if isinstance(m, AIMessage) else None
+        if not meta:
+            continue
+        usage["model_calls"] += 1
+        usage["input_tokens"] += meta.get("input_tokens", 0) or 0
+        usage["output_tokens"] += meta.get("output_tokens", 0) or 0
+        details = meta.get("input_token_details") or {}
+        usage["cached_tokens"] += details.get("cache_read", 0) or 0
+    usage["cache_hit_rate"] = (
+        round(usage["cached_tokens"] / usage["input_tokens"], 4) if usage["input_tokens"] else 0.0
+    )
+    return usage
+
+
+def _extract_answer(out_messages: list) -> str:
+    """Последний ответ ассистента (AIMessage с content, без tool_calls)."""
+    for m in reversed(out_messages):
+        if isinstance(m, AIMessage) and m.content:
+            tool_calls = getattr(m, "tool_calls", None) or []
+            if not tool_calls:
+                return m.content
+    return "Ответ не получен."
+
+
+def _tools_used(out_messages: list) -> set[str]:
+    """Имена инструментов, вызванных за ход (история содержит только Human/AI)."""
+    return {m.name for m in out_messages if isinstance(m, ToolMessage) and m.name}
+
+
+def _message_text(message) -> str:
+    """Текст сообщения/чанка: content бывает строкой или списком блоков."""
+    content = message.content
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content or []:
+        if isinstance(block, str):
+            parts.append(block)
+        elif isinstance(block, dict) and block.get("type") == "text":
+            parts.append(block.get("text", ""))
+    return "".join(parts)
+
+
+def _file_stamp(path) -> tuple[int, int] | None:
+    """(size, mtime_ns) файла или None, если файла нет."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+class AgentSession:
     """
-    Обработать запрос пользователя: загрузить контекст, вызвать агента, сохранить в память.
+    Долгоживущая сессия агента.
 
-    Args:
-        query: Текст запроса
-        verbose: Показывать вызовы инструментов
-        dry_run: Режим планирования без выполнения (для write_file, execute_terminal)
+    LLM-клиент, список инструментов и граф create_agent создаются один раз —
+    при первом запросе или явном warm() — и переиспользуются между запросами.
+    Вызовы инструментов из одного хода выполняются параллельно в пределах
+    лимитов ToolExecutor.
+
+    При persist=True история и memory.json держатся в памяти и перечитываются,
+    только если файлы изменились извне (например, после компакции).
+    При persist=False диалог живёт только в памяти сессии и не пишется на диск.
+    isolated=True (fork для задачи batch) — вдобавок без поиска по общему
+    архиву и без общих фактов: факты и задачи сессии живут в её памяти.
+
+    response_cache — кэш готовых ответов (ResponseCache); по умолчанию
+    включается переменной AGENT_RESPONSE_CACHE. tracer — сборщик span'ов
+    хода (--profile); каждый ход записывается корневым span'ом "turn".
     """
-    dry_token = set_dry_run(dry_run)
-    verb_token = set_verbose(verbose)
-    try:
-        mem = load_memory()
-        conv = load_conversation()
-        tools = get_all_tools()
-        llm = get_llm()
-        agent = create_agent(llm, tools)
 
-        msgs = _conversation_to_messages(conv, mem.get("summary", ""))
-        msgs.append(HumanMessage(content=query))
+    def __init__(
+        self,
+        *,
+        verbose: bool = False,
+        dry_run: bool = False,
+        persist: bool = True,
+        response_cache: ResponseCache | None = None,
+        tracer: Tracer | None = None,
+    ):
+        self.verbose = verbose
+        self.tracer = tracer
+        self.dry_run = dry_run
+        self.persist = persist
+        self.isolated = False
+        self._facts: FactIndex | None = None
+        if response_cache is None and RESPONSE_CACHE_ENABLED:
+            response_cache = ResponseCache(RESPONSE_CACHE_FILE)
+        self.response_cache = response_cache
+        self.executor = ToolExecutor()
+        self._components: tuple | None = None
+        self._warm_lock = threading.Lock()
+        self._conversation: list[dict] = []
+        self._memory: dict = {}
+        self._stamp: tuple | None = None
+        self._lock = threading.RLock()
+        self.last_stats: dict = {}
+        self.last_context: dict = {}
+        self.last_usage: dict = {}
+        self.usage_totals = {
+            "turns": 0, "model_calls": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0,
+        }
+
+    def warm(self) -> None:
+        """
+        Собрать LLM, инструменты и граф, если ещё не собраны.
+
+        Здесь загружаются LangChain и OpenAI; REPL вызывает warm() в фоне,
+        пока пользователь набирает первый запрос.
+        """
+        if self._components is not None:
+            return
+        with self._warm_lock:
+            if self._components is None:
+                tools = self.executor.wrap_all(get_all_tools())
+                llm = get_llm()
+                self._components = (tools, llm, create_agent(llm, tools))
+
+    @property
+    def tools(self) -> list:
+        self.warm()
+        return self._components[0]
+
+    @property
+    def llm(self):
+        self.warm()
+        return self._components[1]
+
+    @property
+    def agent(self):
+        self.warm()
+        return self._components[2]
+
+    def fork(self, *, persist: bool | None = None, isolated: bool = False) -> "AgentSession":
+        """
+        Новая сессия с теми же LLM, инструментами и графом, но пустым состоянием диалога.
+
+        Дешёвая операция: ничего не пересоздаётся. Используется, когда нужно
+        изолировать диалоги (например, по одному на задачу в batch-режиме).
+        isolated=True — и от общей памяти: архив не ищется, факты и задачи
+        (в том числе записанные инструментами) — только в памяти сессии.
+        """
+        self.warm()
+        clone = copy.copy(self)
+        clone.persist = self.persist if persist is None else persist
+        clone.isolated = isolated
+        clone._facts = FactIndex() if isolated else None
+        clone._conversation = []
+        clone._memory = {}
+        clone._stamp = None
+        clone._lock = threading.RLock()
+        clone.last_stats = {}
+        clone.last_context = {}
+        clone.last_usage = {}
+        clone.usage_totals = dict.fromkeys(self.usage_totals, 0)
+        return clone
+
+    def _current_stamp(self) -> tuple:
+        return (
+            _file_stamp(memory.CONVERSATION_FILE),
+            _file_stamp(memory.MEMORY_FILE),
+            _file_stamp(memory.facts_log_path()),
+        )
 
-        if verbose:
+    def reload(self) -> None:
+        """
+        Перечитать историю и memory.json с диска.
+
+        Берутся последние MEMORY_MAX_MESSAGES строк (seek с конца по индексу):
+        более старые всё равно ушли бы в компакцию, а стоимость загрузки
+        не растёт с размером файла.
+        """
+        self._memory = load_memory()
+        self._conversation = load_conversation(last=memory.MEMORY_MAX_MESSAGES)
+        self._stamp = self._current_stamp()
+
+    def _sync(self) -> None:
+        """Перечитать состояние, если файлы памяти изменились с прошлого хода."""
+        if not self.persist:
+            return
+        with self._lock:
+            if self._stamp is None or self._stamp != self._current_stamp():
+                self.reload()
+
+    @property
+    def conversation(self) -> list[dict]:
+        """История диалога (актуальная на момент вызова)."""
+        self._sync()
+        return list(self._conversation)
+
+    @property
+    def memory(self) -> dict:
+        """Содержимое memory.json (актуальное на момент вызова)."""
+        self._sync()
+        return dict(self._memory)
+
+    def _remember(self, role: str, content: str) -> None:
+        """Записать сообщение на диск (если persist) и в кэш сессии."""
+        if self.persist:
+            message = append_message(role, content)
+        else:
+            message = {"role": role, "content": content}
+        self._conversation.append(message)
+
+    def _prepare(self, query: str) -> list:
+        """Сообщения для агента: контекст из памяти + новый запрос."""
+        self._sync()
+        # Изолированная сессия не видит общий архив; факты — её собственные (см. _turn)
+        recalled = [] if self.isolated else recall.search(query, MEMORY_RECALL_K)
+        facts, todos = memory.relevant_facts(query)
+        extra = (recalled, facts, todos)
+        with self._lock, span("context.build") as sp:
+            summary = self._memory.get("summary", "")
+            conv, self.last_context = build_context(
+                self._conversation, fixed_tokens=_fixed_tokens(summary, query, *extra)
+            )
+            self.last_context["recalled"] = len(recalled)
+            self.last_context["facts"] = len(facts) + len(todos)
+            sp.set(kept_tokens=self.last_context["kept_tokens"], dropped_tokens=self.last_context["dropped_tokens"])
+        msgs = _conversation_to_messages(conv, summary, *extra)
+        msgs.append(HumanMessage(content=query))
+        if self.verbose:
+            ctx = self.last_context
+            print(
+                f"[context] история: {ctx['kept_messages']} сообщ. / {ctx['kept_tokens']} ток., "
+                f"отброшено: {ctx['dropped_messages']} сообщ. / {ctx['dropped_tokens']} ток., "
+                f"бюджет: {ctx['budget'] or '∞'}, из архива: {ctx['recalled']}, фактов: {ctx['facts']}"
+            )
             print("[agent] Запуск агента...")
+        return msgs
+
+    def _record_usage(self, out_messages: list) -> None:
+        """Учесть usage хода (в т.ч. cached_tokens) и записать его в usage.jsonl."""
+        usage = _collect_usage(out_messages)
+        self.last_usage = usage
+        current_span().set(**{k: usage[k] for k in ("input_tokens", "cached_tokens", "output_tokens")})
+        with self._lock:
+            self.usage_totals["turns"] += 1
+            for key in ("model_calls", "input_tokens", "cached_tokens", "output_tokens"):
+                self.usage_totals[key] += usage[key]
+        if self.verbose and usage["model_calls"]:
+            print(
+                f"[usage] вход: {usage['input_tokens']} ток. "
+                f"(из кэша: {usage['cached_tokens']}, {usage['cache_hit_rate']:.0%}), "
+                f"выход: {usage['output_tokens']}, вызовов модели: {usage['model_calls']}"
+            )
+        if self.persist and usage["model_calls"]:
+            append_usage(usage)
+
+    @contextlib.contextmanager
+    def _turn(self, query: str, dry_run: bool = False):
+        """
+        Контекст хода: dry-run, verbose, трассировщик и корневой span "turn".
+
+        dry_run хода только добавляется к self.dry_run: отключить режим сессии нельзя.
+        """
+        dry_token = set_dry_run(self.dry_run or dry_run)
+        verb_token = set_verbose(self.verbose)
+        trace_token = set_tracer(self.tracer)
+        facts_token = memory.set_session_facts(self._facts)
+        try:
+            with span("turn", query_chars=len(query)) as turn:
+                yield turn
+        finally:
+            memory.reset_session_facts(facts_token)
+            reset_tracer(trace_token)
+            reset_verbose(verb_token)
+            reset_dry_run(dry_token)
+
+    def _cache_lookup(self, query: str) -> tuple[str | None, str | None]:
+        """(ключ, ответ из кэша). Ключ None — кэш не используется для этого хода."""
+        if self.response_cache is None or get_dry_run():
+            return None, None
+        self._sync()
+        with self._lock:
+            # Из истории в ключ идёт только последний обмен, от которого зависит уточнение
+            key = ResponseCache.key(query, self._memory, self._conversation)
+        answer = self.response_cache.get(key)
+        if self.verbose:
+            print(f"[cache] {'попадание' if answer is not None else 'промах'}: {self.response_cache.stats()}")
+        return key, answer
 
-        result = agent.invoke({"messages": msgs})
+    def _commit(self, query: str, answer: str) -> None:
+        """
+        Записать обмен репликами в память, компактировать при необходимости.
+
+        По умолчанию компакция уходит в фоновый поток; новый summary
+        подхватывается следующим ходом (файлы памяти изменятся — _sync перечитает).
+        """
+        with self._lock:
+            self._remember("user", query)
+            self._remember("assistant", answer)
+            if not self.persist:
+                return
+            self._stamp = self._current_stamp()
+            if not MEMORY_BACKGROUND_COMPACTION:
+                if compact_if_needed():
+                    self.reload()
+            elif compact_in_background() and self.verbose:
+                print("[memory] компакция запущена в фоне", flush=True)
+
+    def _finish(self, query: str, result: dict, cache_key: str | None = None) -> str:
+        """Извлечь ответ, учесть usage, сохранить в кэш ответов и в память."""
         out_messages = result.get("messages", [])
+        answer = _extract_answer(out_messages)
+        self._record_usage(out_messages)
+        if cache_key is not None:
+            self.response_cache.put(cache_key, answer, _tools_used(out_messages))
+        self._commit(query, answer)
+        current_span().set(answer_chars=len(answer))
+        return answer
+
+    def ask(self, query: str, *, dry_run: bool = False) -> str:
+        """
+        Обработать запрос: контекст из памяти -> агент -> ответ -> запись в память.
+
+        dry_run=True — dry-run только для этого хода (в дополнение к self.dry_run).
+        """
+        with self._turn(query, dry_run) as turn:
+            cache_key, cached = self._cache_lookup(query)
+            if cached is not None:
+                turn.set(cache="hit")
+                self._commit(query, cached)
+                return cached
+            msgs = self._prepare(query)
+            with span("agent.invoke", messages=len(msgs)):
+                result = self.agent.invoke({"messages": msgs})
+            return self._finish(query, result, cache_key)
 
-        # Берём последний ответ ассистента (AIMessage с content, без tool_calls)
-        answer = ""
-        for m in reversed(out_messages):
-            if isinstance(m, AIMessage) and m.content:
-                tool_calls = getattr(m, "tool_calls", None) or []
-                if not tool_calls:
-                    answer = m.content
-                    break
+    async def aask(self, query: str, *, dry_run: bool = False) -> str:
+        """Асинхронная версия ask: ainvoke агента, файловая память — в отдельном потоке."""
+        with self._turn(query, dry_run) as turn:
+            cache_key, cached = await asyncio.to_thread(self._cache_lookup, query)
+            if cached is not None:
+                turn.set(cache="hit")
+                await asyncio.to_thread(self._commit, query, cached)
+                return cached
+            msgs = await asyncio.to_thread(self._prepare, query)
+            with span("agent.invoke", messages=len(msgs)):
+                result = await self.agent.ainvoke({"messages": msgs})
+            return await asyncio.to_thread(self._finish, query, result, cache_key)
 
-        if not answer:
-            answer = "Ответ не получен."
+    # --- Потоковый режим ---
 
-        append_message("user", query)
-        append_message("assistant", answer)
-        compact_if_needed()
+    _STREAM_MODES = ["messages", "updates", "values"]
 
+    def _stream_event(self, mode: str, payload) -> str:
+        """Разобрать событие stream: вернуть токены ответа, напечатать прогресс инструментов."""
+        if mode == "messages":
+            chunk, meta = payload
+            if meta.get("langgraph_node") == "model" and isinstance(chunk, AIMessage):
+                return _message_text(chunk)
+        elif mode == "updates" and self.verbose:
+            for node, update in (payload or {}).items():
+                for m in (update or {}).get("messages", []):
+                    if node == "model" and getattr(m, "tool_calls", None):
+                        for call in m.tool_calls:
+                            print(f"\n[tool] → {call['name']}({call['args']})", flush=True)
+                    elif isinstance(m, ToolMessage):
+                        print(f"[tool] ← {m.name}: {len(_message_text(m))} символов", flush=True)
+        return ""
+
+    def _stream_done(
+        self,
+        query: str,
+        final: dict,
+        started: float,
+        first_token: float | None,
+        cache_key: str | None,
+    ) -> str:
+        answer = self._finish(query, final, cache_key)
+        total = time.perf_counter() - started
+        self.last_stats = {
+            "ttft_s": (first_token - started) if first_token is not None else total,
+            "total_s": total,
+        }
         return answer
-    finally:
-        reset_dry_run(dry_token)
-        reset_verbose(verb_token)
+
+    def stream(self, query: str, *, dry_run: bool = False) -> Iterator[str]:
+        """
+        Потоковая версия ask: отдаёт токены ответа по мере генерации.
+
+        После исчерпания генератора полный ответ сохранён в память,
+        а self.last_stats содержит ttft_s (время до первого токена) и total_s.
+        dry_run — как в ask.
+        """
+        with self._turn(query, dry_run) as turn:
+            started = time.perf_counter()
+            cache_key, cached = self._cache_lookup(query)
+            if cached is not None:
+                turn.set(cache="hit")
+                self._commit(query, cached)
+                elapsed = time.perf_counter() - started
+                self.last_stats = {"ttft_s": elapsed, "total_s": elapsed}
+                yield cached
+                return
+            first_token = None
+            final: dict = {}
+            msgs = self._prepare(query)
+            with span("agent.stream", messages=len(msgs)):
+                for mode, payload in self.agent.stream({"messages": msgs}, stream_mode=self._STREAM_MODES):
+                    if mode == "values":
+                        final = payload
+                        continue
+                    text = self._stream_event(mode, payload)
+                    if text:
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                        yield text
+            answer = self._stream_done(query, final, started, first_token, cache_key)
+            if first_token is None:
+                # Модель не стримила токены — отдаём ответ целиком
+                yield answer
+
+    async def astream(self, query: str, *, dry_run: bool = False) -> AsyncIterator[str]:
+        """Асинхронная версия stream (agent.astream)."""
+        with self._turn(query, dry_run) as turn:
+            started = time.perf_counter()
+            cache_key, cached = await asyncio.to_thread(self._cache_lookup, query)
+            if cached is not None:
+                turn.set(cache="hit")
+                await asyncio.to_thread(self._commit, query, cached)
+                elapsed = time.perf_counter() - started
+                self.last_stats = {"ttft_s": elapsed, "total_s": elapsed}
+                yield cached
+                return
+            first_token = None
+            final: dict = {}
+            msgs = await asyncio.to_thread(self._prepare, query)
+            with span("agent.stream", messages=len(msgs)):
+                async for mode, payload in self.agent.astream({"messages": msgs}, stream_mode=self._STREAM_MODES):
+                    if mode == "values":
+                        final = payload
+                        continue
+                    text = self._stream_event(mode, payload)
+                    if text:
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                        yield text
+            answer = await asyncio.to_thread(self._stream_done, query, final, started, first_token, cache_key)
+            if first_token is None:
+                yield answer
+
+
+def process_query(query: str, *, verbose: bool = False, dry_run: bool = False) -> str:
+    """
+    Обработать запрос пользователя: загрузить контекст, вызвать агента, сохранить в память.
+
+    Одноразовая обёртка над AgentSession; для нескольких запросов подряд
+    создавайте сессию один раз и вызывайте AgentSession.ask.
+
+    Args:
+        query: Текст запроса
+        verbose: Показывать вызовы инструментов
+        dry_run: Режим планирования без выполнения (для write_file, execute_terminal)
+    """
+    return AgentSession(verbose=verbose, dry_run=dry_run).ask(query)
+
+
+async def aprocess_query(query: str, *, verbose: bool = False, dry_run: bool = False) -> str:
+    """
+    Асинхронная версия process_query: агент вызывается через ainvoke,
+    инструменты — через свои async-реализации.
+
+    Args:
+        query: Текст запроса
+        verbose: Показывать вызовы инструментов
+        dry_run: Режим планирования без выполнения (для write_file, execute_terminal)
+    """
+    return await AgentSession(verbose=verbose, dry_run=dry_run).aask(query)
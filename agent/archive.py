@@ -0,0 +1,276 @@
+"""
+Сегментированный архив диалога: всё, что вытеснила компакция, хранится
+для аудита и поиска (agent.recall).
+
+Каталог архива:
+- 000007.jsonl — активный сегмент, в него дописываются сообщения;
+- 000001.jsonl.zst (.gz) — запечатанные сегменты, сжатые целиком;
+- manifest.json — список запечатанных сегментов с диапазоном времени
+  (from_ts/to_ts), числом сообщений и размерами, номер активного сегмента.
+
+Когда активный сегмент превышает segment_bytes, он сжимается (zstd, если
+установлен zstandard, иначе gzip), попадает в манифест и удаляется; номер
+сегмента сохраняется, поэтому ссылка (сегмент, смещение) не меняется при
+запечатывании. Запись — под блокировкой памяти (agent.memory), файлы
+запечатанных сегментов и манифест пишутся атомарно.
+
+iter_messages читает архив потоком и по манифесту пропускает сегменты вне
+запрошенного диапазона времени, не распаковывая их.
+"""
+
+import contextlib
+import gzip
+import io
+import json
+import os
+import uuid
+from collections.abc import Iterator
+from datetime import datetime, timezone
+from pathlib import Path
+
+from agent.storage import atomic_write
+
+MANIFEST = "manifest.json"
+# Архив из одного файла (до сегментов): переносится в каталог при первой дозаписи
+LEGACY_FILE = "archive.jsonl"
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def resolve_codec(codec: str) -> str:
+    """auto -> zstd, если установлен zstandard, иначе gzip."""
+    if codec == "auto":
+        return "zstd" if _zstd() is not None else "gzip"
+    if codec == "zstd" and _zstd() is None:
+        return "gzip"
+    return codec
+
+
+_SUFFIX = {"zstd": ".zst", "gzip": ".gz"}
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return _zstd().ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+@contextlib.contextmanager
+def _open_sealed(path: Path, codec: str):
+    """Потоковое чтение запечатанного сегмента (итерация по строкам)."""
+    if codec == "zstd":
+        with open(path, "rb") as f:
+            yield io.BufferedReader(_zstd().ZstdDecompressor().stream_reader(f))
+    else:
+        with gzip.open(path, "rb") as f:
+            yield f
+
+
+def segment_name(seq: int) -> str:
+    return f"{seq:06d}.jsonl"
+
+
+def load_manifest(root: Path) -> dict:
+    """Манифест архива; пустой, если архива ещё нет."""
+    try:
+        data = json.loads((root / MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {"id": "", "active": 1, "segments": []}
+    data.setdefault("segments", [])
+    data.setdefault("active", 1)
+    data.setdefault("id", "")
+    return data
+
+
+def _save_manifest(root: Path, manifest: dict, durable: bool) -> None:
+    payload = json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8")
+    atomic_write(root / MANIFEST, payload, durable=durable)
+
+
+def _prepare(root: Path, durable: bool) -> dict:
+    """Создать каталог и манифест, перенести старый archive.jsonl, убрать хвосты сбоев."""
+    root.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(root)
+    if not manifest["id"]:
+        manifest["id"] = uuid.uuid4().hex[:12]
+        legacy = root.parent / LEGACY_FILE
+        if legacy.exists():
+            os.replace(legacy, root / segment_name(manifest["active"]))
+        _save_manifest(root, manifest, durable)
+    for seg in manifest["segments"]:
+        # Сбой после записи манифеста, но до удаления несжатого файла
+        with contextlib.suppress(FileNotFoundError):
+            (root / segment_name(seg["seq"])).unlink()
+    return manifest
+
+
+def append(root: Path, messages: list[dict], *, segment_bytes: int, codec: str, durable: bool = False) -> None:
+    """
+    Дописать сообщения в активный сегмент; при превышении segment_bytes — запечатать его.
+
+    Вызывается под блокировкой памяти.
+    """
+    if not messages:
+        return
+    manifest = _prepare(root, durable)
+    data = b"".join((json.dumps(m, ensure_ascii=False) + "\n").encode("utf-8") for m in messages)
+    path = root / segment_name(manifest["active"])
+    with open(path, "ab+") as f:
+        offset = f.seek(0, os.SEEK_END)
+        if offset:
+            f.seek(offset - 1)
+            if f.read(1) != b"\n":
+                data = b"\n" + data  # оборванная строка после сбоя останется отдельной и будет пропущена
+        f.write(data)
+        f.flush()
+        if durable:
+            os.fsync(f.fileno())
+        size = f.tell()
+    if size >= segment_bytes:
+        seal(root, manifest, codec=codec, durable=durable)
+
+
+def _time_range(raw: bytes) -> tuple[str, str, int]:
+    first = last = ""
+    count = 0
+    for line in raw.splitlines():
+        try:
+            message = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            continue
+        count += 1
+        ts = message.get("ts", "") if isinstance(message, dict) else ""
+        if ts:
+            first = min(first, ts) if first else ts
+            last = max(last, ts)
+    return first, last, count
+
+
+def seal(root: Path, manifest: dict, *, codec: str, durable: bool = False) -> dict | None:
+    """
+    Сжать активный сегмент и начать новый. Вызывается под блокировкой памяти.
+
+    Порядок: сжатый файл, затем манифест, затем удаление несжатого — при
+    сбое на любом шаге сообщения остаются ровно в одном сегменте манифеста
+    или в активном.
+    """
+    seq = manifest["active"]
+    path = root / segment_name(seq)
+    try:
+        raw = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    if not raw:
+        return None
+    codec = resolve_codec(codec)
+    compressed = _compress(raw, codec)
+    name = segment_name(seq) + _SUFFIX[codec]
+    atomic_write(root / name, compressed, durable=durable)
+    from_ts, to_ts, count = _time_range(raw)
+    segment = {
+        "seq": seq,
+        "file": name,
+        "codec": codec,
+        "messages": count,
+        "from_ts": from_ts,
+        "to_ts": to_ts,
+        "raw_bytes": len(raw),
+        "bytes": len(compressed),
+        "sealed_at": datetime.now(timezone.utc).isoformat(),
+    }
+    manifest["segments"].append(segment)
+    manifest["active"] = seq + 1
+    _save_manifest(root, manifest, durable)
+    path.unlink()
+    return segment
+
+
+def segments(root: Path) -> list[dict]:
+    """Запечатанные сегменты из манифеста и активный (codec None, без диапазона времени)."""
+    manifest = load_manifest(root)
+    result = list(manifest["segments"])
+    active = root / segment_name(manifest["active"])
+    with contextlib.suppress(FileNotFoundError):
+        result.append({"seq": manifest["active"], "file": active.name, "codec": None,
+                       "raw_bytes": active.stat().st_size})
+    return result
+
+
+def _sealed(root: Path, seq: int) -> dict | None:
+    """Запись манифеста для сегмента seq (активный мог быть запечатан, пока его читали)."""
+    return next((s for s in load_manifest(root)["segments"] if s["seq"] == seq), None)
+
+
+def read_segment(root: Path, segment: dict) -> bytes:
+    """Несжатое содержимое сегмента целиком."""
+    try:
+        return (root / segment_name(segment["seq"])).read_bytes()
+    except FileNotFoundError:
+        sealed = segment if segment.get("codec") else _sealed(root, segment["seq"])
+    if sealed is None:
+        return b""
+    with _open_sealed(root / sealed["file"], sealed["codec"]) as f:
+        return f.read()
+
+
+def _iter_lines(root: Path, segment: dict) -> Iterator[bytes]:
+    if segment.get("codec") is None:
+        try:
+            f = open(root / segment["file"], "rb")
+        except FileNotFoundError:
+            sealed = _sealed(root, segment["seq"])
+            if sealed is not None:
+                yield from _iter_lines(root, sealed)
+            return
+        with f:
+            yield from f
+        return
+    with _open_sealed(root / segment["file"], segment["codec"]) as f:
+        yield from f
+
+
+def _ts(value: datetime | str | None) -> str:
+    if value is None or isinstance(value, str):
+        return value or ""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def iter_messages(
+    root: Path,
+    since: datetime | str | None = None,
+    until: datetime | str | None = None,
+) -> Iterator[dict]:
+    """
+    Сообщения архива от старых к новым, потоком.
+
+    С since/until отдаются сообщения с ts в [since, until]; запечатанные
+    сегменты, диапазон которых по манифесту не пересекается с запрошенным,
+    не открываются. Сообщения без ts при фильтре по времени пропускаются.
+    """
+    since, until = _ts(since), _ts(until)
+    filtered = bool(since or until)
+    for segment in segments(root):
+        if filtered and segment.get("codec") is not None:
+            if not segment.get("to_ts") or (since and segment["to_ts"] < since) \
+                    or (until and segment["from_ts"] > until):
+                continue
+        for line in _iter_lines(root, segment):
+            try:
+                message = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            if not isinstance(message, dict):
+                continue
+            if filtered:
+                ts = message.get("ts", "")
+                if not ts or (since and ts < since) or (until and ts > until):
+                    continue
+            yield message
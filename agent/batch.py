@@ -0,0 +1,181 @@
+"""
+Пакетный режим: задачи из JSONL через пул воркеров, результаты в JSONL.
+"""
+
+import itertools
+import json
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import TextIO
+
+from agent.agent import AgentSession
+
+
+def load_tasks(path: Path) -> list[dict]:
+    """
+    Прочитать задачи из JSONL.
+
+    Каждая строка — {"id": ..., "task": "..."} (или "query" вместо "task").
+    Без id используется номер строки. Пустые строки пропускаются.
+    """
+    tasks = []
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{lineno}: некорректный JSON: {e}") from e
+            if not isinstance(data, dict):
+                raise ValueError(f"{path}:{lineno}: ожидался JSON-объект")
+            text = data.get("task") or data.get("query")
+            if not text:
+                raise ValueError(f"{path}:{lineno}: нет поля task")
+            tasks.append({"id": str(data.get("id", lineno)), "task": text})
+    return tasks
+
+
+def load_checkpoint(path: Path) -> set[str]:
+    """Множество id уже выполненных задач (по строке на id)."""
+    if not path.exists():
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def _run_one(session: AgentSession, task: dict, shared: bool) -> dict:
+    """Выполнить задачу; ошибки превращаются в результат, а не роняют пул."""
+    started = time.perf_counter()
+    worker = session if shared else session.fork(persist=False, isolated=True)
+    try:
+        answer = worker.ask(task["task"])
+        result = {"id": task["id"], "ok": True, "answer": answer}
+    except Exception as e:
+        result = {"id": task["id"], "ok": False, "error": str(e)}
+    result["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+class _ResultWriter:
+    """Запись результата и отметки в checkpoint — строго после записи результата."""
+
+    def __init__(self, out: TextIO, checkpoint: TextIO | None):
+        self._out = out
+        self._checkpoint = checkpoint
+        self._lock = threading.Lock()
+
+    def write(self, result: dict) -> None:
+        with self._lock:
+            self._out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self._out.flush()
+            if self._checkpoint is not None:
+                self._checkpoint.write(result["id"] + "\n")
+                self._checkpoint.flush()
+
+
+def run_batch(
+    session: AgentSession,
+    tasks: list[dict],
+    out: TextIO,
+    *,
+    workers: int = 4,
+    ordered: bool = True,
+    checkpoint: Path | None = None,
+    shared: bool = False,
+) -> dict:
+    """
+    Выполнить задачи пулом из workers потоков.
+
+    Args:
+        session: Сессия с прогретыми LLM/графом; при shared=False каждая задача
+            получает изолированный fork без записи в память на диске,
+            без общего архива и общих фактов
+        tasks: Задачи из load_tasks
+        out: Куда писать результаты (JSONL)
+        workers: Число параллельных воркеров
+        ordered: True — результаты в порядке входа, False — в порядке завершения
+        checkpoint: Файл с id выполненных задач; уже выполненные пропускаются
+        shared: Общая память диалога для всех задач (через session)
+
+    Returns:
+        Статистика: total, skipped, ok, failed, elapsed_s.
+    """
+    done = load_checkpoint(checkpoint) if checkpoint else set()
+    pending = [t for t in tasks if t["id"] not in done]
+    stats = {"total": len(tasks), "skipped": len(tasks) - len(pending), "ok": 0, "failed": 0}
+    started = time.perf_counter()
+
+    ckpt_file = open(checkpoint, "a", encoding="utf-8") if checkpoint else None
+    try:
+        writer = _ResultWriter(out, ckpt_file)
+        buffered: dict[int, dict] = {}
+        next_index = 0
+        queue = iter(enumerate(pending))
+        in_flight: dict = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+
+            def fill() -> None:
+                # В полёте не больше workers задач: при Ctrl-C очередь не запускается
+                for i, task in itertools.islice(queue, max(1, workers) - len(in_flight)):
+                    in_flight[pool.submit(_run_one, session, task, shared)] = i
+
+            fill()
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    index = in_flight.pop(fut)
+                    result = fut.result()
+                    stats["ok" if result["ok"] else "failed"] += 1
+                    if not ordered:
+                        writer.write(result)
+                        continue
+                    buffered[index] = result
+                    while next_index in buffered:
+                        writer.write(buffered.pop(next_index))
+                        next_index += 1
+                fill()
+    finally:
+        if ckpt_file is not None:
+            ckpt_file.close()
+
+    stats["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def main_batch(
+    session: AgentSession,
+    batch_file: str,
+    *,
+    output: str | None,
+    workers: int,
+    order: str,
+    checkpoint: str | None,
+    shared: bool,
+) -> int:
+    """Точка входа CLI для --batch: пути по умолчанию рядом с входным файлом."""
+    batch_path = Path(batch_file)
+    out_path = Path(output) if output else batch_path.with_suffix(".results.jsonl")
+    ckpt_path = Path(checkpoint) if checkpoint else out_path.with_name(out_path.name + ".done")
+
+    tasks = load_tasks(batch_path)
+    with open(out_path, "a", encoding="utf-8") as out:
+        stats = run_batch(
+            session,
+            tasks,
+            out,
+            workers=workers,
+            ordered=(order == "input"),
+            checkpoint=ckpt_path,
+            shared=shared,
+        )
+    print(
+        f"[batch] задач: {stats['total']}, пропущено (checkpoint): {stats['skipped']}, "
+        f"успешно: {stats['ok']}, ошибок: {stats['failed']}, время: {stats['elapsed_s']}s -> {out_path}",
+        file=sys.stderr,
+    )
+    return 0 if stats["failed"] == 0 else 1
@@ -0,0 +1,121 @@
+"""
+Микро-батчинг запросов к внешним API.
+
+Вызовы, пришедшие в пределах окна (несколько миллисекунд), объединяются
+в один запрос: первый вызов («ведущий») ждёт окно, собирая ключи
+остальных, затем выполняет fetch по объединению ключей; остальные ждут
+его результат. Так параллельные вызовы инструмента из исполнителя
+(например, курсы нескольких монет) превращаются в один HTTP-запрос.
+
+Синхронные вызовы (потоки исполнителя) и async-вызовы (один event loop)
+собираются в отдельные батчи: результат async-батча — Future своего цикла.
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+from collections.abc import Callable, Iterable
+from typing import Any
+
+
+class _Batch:
+    def __init__(self, size: int):
+        self.keys: list[set] = [set() for _ in range(size)]
+        self.done = threading.Event()
+        self.future: asyncio.Future | None = None
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+    def add(self, parts: tuple[Iterable, ...]) -> None:
+        for keys, part in zip(self.keys, parts):
+            keys.update(part)
+
+    def fits(self, parts: tuple[Iterable, ...], max_keys: int) -> bool:
+        """Поместятся ли ключи вызова в батч (по каждому измерению не больше max_keys)."""
+        return all(len(keys.union(part)) <= max_keys for keys, part in zip(self.keys, parts))
+
+
+class MicroBatcher:
+    """
+    Объединение одновременных вызовов fetch(*наборы_ключей) в один.
+
+    Ключи вызова — несколько наборов (например, монеты и валюты); батч
+    запрашивает объединение каждого набора. window — окно сбора в секундах
+    (0 — без ожидания: объединяются только вызовы, пришедшие, пока ведущий
+    ещё не начал запрос). max_keys — предел ключей в одном измерении батча.
+    """
+
+    def __init__(self, window: float, max_keys: int = 100):
+        self.window = window
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._pending: _Batch | None = None
+        self._apending: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _Batch]" = weakref.WeakKeyDictionary()
+        self._stats = {"calls": 0, "batches": 0}
+
+    def _join(self, pending: _Batch | None, parts: tuple) -> tuple[_Batch, bool]:
+        """Присоединиться к открытому батчу или открыть новый. Под self._lock; True — ведущий."""
+        self._stats["calls"] += 1
+        if pending is not None and pending.fits(parts, self.max_keys):
+            pending.add(parts)
+            return pending, False
+        batch = _Batch(len(parts))
+        batch.add(parts)
+        self._stats["batches"] += 1
+        return batch, True
+
+    def run(self, fetch: Callable[..., Any], *parts: Iterable) -> Any:
+        """Результат fetch по объединённым ключам батча (синхронно, из любого потока)."""
+        with self._lock:
+            batch, leader = self._join(self._pending, parts)
+            if leader:
+                self._pending = batch
+        if not leader:
+            batch.done.wait()
+        else:
+            if self.window > 0:
+                time.sleep(self.window)
+            with self._lock:
+                if self._pending is batch:
+                    self._pending = None
+            try:
+                batch.result = fetch(*batch.keys)
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        if batch.error is not None:
+            raise batch.error
+        return batch.result
+
+    async def arun(self, fetch: Callable[..., Any], *parts: Iterable) -> Any:
+        """Async-версия run: fetch — корутинная функция, батч — в пределах текущего event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            batch, leader = self._join(self._apending.get(loop), parts)
+            if leader:
+                batch.future = loop.create_future()
+                self._apending[loop] = batch
+        if not leader:
+            return await asyncio.shield(batch.future)
+        try:
+            if self.window > 0:
+                await asyncio.sleep(self.window)
+            with self._lock:
+                if self._apending.get(loop) is batch:
+                    del self._apending[loop]
+            batch.future.set_result(await fetch(*batch.keys))
+        except BaseException as e:
+            if self._apending.get(loop) is batch:
+                del self._apending[loop]
+            # Ведущий отменён или fetch упал — ожидающие получают ту же ошибку
+            batch.future.set_exception(e if isinstance(e, Exception) else RuntimeError("батч отменён"))
+            batch.future.exception()  # не выводить «exception was never retrieved»
+            raise
+        return batch.future.result()
+
+    def stats(self) -> dict:
+        """Число вызовов и выполненных батчей (запросов к API)."""
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,155 @@
+"""
+Тонкий клиент резидентного демона (--connect).
+
+Запросы уходят в Unix-сокет демона (agent.server), ответ печатается по мере
+генерации. Модуль не импортирует LangChain: старт клиента — доли секунды.
+"""
+
+import json
+import socket
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+
+from agent.config import SERVER_SOCKET
+
+
+class DaemonError(RuntimeError):
+    """Демон недоступен или вернул ошибку."""
+
+
+class AgentClient:
+    """Соединение с демоном; запросы одного клиента выполняются по очереди."""
+
+    def __init__(self, path: Path = SERVER_SOCKET, *, session: str | None = None, dry_run: bool = False):
+        self.path = Path(path)
+        self.session = session
+        self.dry_run = dry_run
+        self.last_stats: dict = {}
+        self._sock: socket.socket | None = None
+        self._reader = None
+
+    def connect(self) -> "AgentClient":
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(self.path))
+        except OSError as e:
+            sock.close()
+            raise DaemonError(
+                f"демон не запущен ({self.path}): {e}. Запустите: python -m agent.run --serve"
+            ) from e
+        self._sock = sock
+        self._reader = sock.makefile("r", encoding="utf-8")
+        return self
+
+    def close(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = self._reader = None
+
+    def __enter__(self) -> "AgentClient":
+        return self.connect()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _call(self, message: dict) -> Iterator[dict]:
+        """Отправить запрос и отдавать ответы демона до завершающего (не token)."""
+        if self._sock is None:
+            self.connect()
+        try:
+            self._sock.sendall((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+            for line in self._reader:
+                reply = json.loads(line)
+                yield reply
+                if reply.get("type") != "token":
+                    return
+        except OSError as e:
+            raise DaemonError(f"соединение с демоном прервано: {e}") from e
+        raise DaemonError("демон закрыл соединение")
+
+    def ask(self, query: str) -> Iterator[str]:
+        """Токены ответа по мере генерации; после исчерпания — last_stats хода."""
+        request = {"op": "ask", "query": query, "session": self.session, "dry_run": self.dry_run}
+        for reply in self._call(request):
+            kind = reply.get("type")
+            if kind == "token":
+                yield reply.get("text", "")
+            elif kind == "done":
+                self.last_stats = reply.get("stats") or {}
+            else:
+                raise DaemonError(reply.get("message", f"неожиданный ответ: {reply}"))
+
+    def ping(self) -> dict:
+        return next(self._call({"op": "ping"}))
+
+    def shutdown(self) -> None:
+        """Попросить демон остановиться (начатые ходы доделываются)."""
+        for _ in self._call({"op": "shutdown"}):
+            pass
+
+
+def _answer(client: AgentClient, query: str, stream: bool) -> None:
+    for token in client.ask(query):
+        print(token, end="", flush=True)
+    print()
+    if stream and client.last_stats:
+        stats = client.last_stats
+        print(
+            f"[stream] первый токен: {stats['ttft_s']:.2f}s, всего: {stats['total_s']:.2f}s",
+            file=sys.stderr,
+        )
+
+
+def main_client(args) -> int:
+    """--connect / --stop: выполнить запрос(ы) через демон; код возврата для CLI."""
+    client = AgentClient(args.socket or SERVER_SOCKET, session=args.session, dry_run=args.dry_run)
+    try:
+        client.connect()
+    except DaemonError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+
+    try:
+        if args.stop:
+            try:
+                client.shutdown()
+            except DaemonError as e:
+                print(f"Ошибка: {e}", file=sys.stderr)
+                return 1
+            print("Демон останавливается.", file=sys.stderr)
+            return 0
+
+        if args.task:
+            try:
+                _answer(client, args.task, args.stream)
+            except KeyboardInterrupt:
+                return 130
+            except DaemonError as e:
+                print(f"\nОшибка: {e}", file=sys.stderr)
+                return 1
+            return 0
+
+        print("CLI AI Agent (через демон). Введите запрос (пусто + Enter для выхода).")
+        while True:
+            try:
+                line = input("\n> ").strip()
+            except (KeyboardInterrupt, EOFError):
+                print("\nВыход.")
+                return 0
+            if not line:
+                print("Выход.")
+                return 0
+            try:
+                _answer(client, line, args.stream)
+            except KeyboardInterrupt:
+                # Ответ на прерванный запрос ещё идёт — переподключаемся
+                print("\nПрервано.")
+                client.close()
+            except DaemonError as e:
+                print(f"Ошибка: {e}", file=sys.stderr)
+                client.close()
+    finally:
+        client.close()
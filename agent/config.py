@@ -19,6 +19,11 @@ WORKSPACE_DIR = Path(os.getenv("AGENT_WORKSPACE", str(_BASE_DIR / "workspace")))
 MEMORY_DIR = Path(os.getenv("AGENT_MEMORY_DIR", str(_BASE_DIR / "memory")))
 CONVERSATION_FILE = MEMORY_DIR / "conversation.jsonl"
 MEMORY_FILE = MEMORY_DIR / "memory.json"
+USAGE_FILE = MEMORY_DIR / "usage.jsonl"
+RESPONSE_CACHE_FILE = MEMORY_DIR / "response_cache.json"
+HTTP_CACHE_DIR = MEMORY_DIR / "http_cache"
+GEOCODE_CACHE_FILE = MEMORY_DIR / "geocode_cache.json"
+COINGECKO_COINS_FILE = MEMORY_DIR / "coingecko_coins.json"
 
 # Модель OpenAI
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5-mini-2025-08-07")
@@ -30,15 +35,98 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 HTTP_TIMEOUT = int(os.getenv("AGENT_HTTP_TIMEOUT", "30"))
 HTTP_MAX_BYTES = int(os.getenv("AGENT_HTTP_MAX_BYTES", str(1024 * 1024)))  # 1MB
 HTTP_MAX_REDIRECTS = int(os.getenv("AGENT_HTTP_MAX_REDIRECTS", "5"))
+# Пулы keep-alive соединений (http_client.py): сколько хостов держать и соединений на хост
+HTTP_POOL_HOSTS = int(os.getenv("AGENT_HTTP_POOL_HOSTS", "16"))
+HTTP_POOL_MAXSIZE = int(os.getenv("AGENT_HTTP_POOL_MAXSIZE", "8"))
+# HTTP-кэш GET-ответов http_request на диске (http_cache.py): лимит размера, 0 — выключен
+HTTP_CACHE_MAX_MB = float(os.getenv("AGENT_HTTP_CACHE_MAX_MB", "64"))
+
+# Внешние API (переопределяются для self-hosted Open-Meteo, прокси или локальных заглушек)
+OPEN_METEO_GEOCODE_URL = os.getenv("AGENT_OPEN_METEO_GEOCODE_URL", "https://geocoding-api.open-meteo.com/v1/search")
+OPEN_METEO_FORECAST_URL = os.getenv("AGENT_OPEN_METEO_FORECAST_URL", "https://api.open-meteo.com/v1/forecast")
+COINGECKO_API_URL = os.getenv("AGENT_COINGECKO_API_URL", "https://api.coingecko.com/api/v3").rstrip("/")
+# Погода: координаты городов кэшируются на диске надолго (города не переезжают),
+# текущая погода по координатам — в памяти на несколько минут (секунды)
+WEATHER_GEOCODE_TTL = int(os.getenv("AGENT_WEATHER_GEOCODE_TTL", str(30 * 24 * 3600)))
+WEATHER_FORECAST_TTL = int(os.getenv("AGENT_WEATHER_FORECAST_TTL", "300"))
+# Максимум городов в одном вызове get_weather_many
+WEATHER_MAX_CITIES = int(os.getenv("AGENT_WEATHER_MAX_CITIES", "50"))
+# Крипта: курсы кэшируются в памяти на CRYPTO_PRICE_TTL секунд; одновременные запросы
+# курсов за CRYPTO_BATCH_WINDOW_MS мс объединяются в один; индекс символов монет
+# (/coins/list) хранится на диске и обновляется раз в CRYPTO_COIN_INDEX_TTL секунд
+CRYPTO_PRICE_TTL = int(os.getenv("AGENT_CRYPTO_PRICE_TTL", "30"))
+CRYPTO_BATCH_WINDOW_MS = float(os.getenv("AGENT_CRYPTO_BATCH_WINDOW_MS", "5"))
+CRYPTO_COIN_INDEX_TTL = int(os.getenv("AGENT_CRYPTO_COIN_INDEX_TTL", str(24 * 3600)))
+# Максимум монет и валют в одном вызове get_crypto_prices
+CRYPTO_MAX_COINS = int(os.getenv("AGENT_CRYPTO_MAX_COINS", "50"))
 
 # Terminal лимиты
 TERMINAL_TIMEOUT = int(os.getenv("AGENT_TERMINAL_TIMEOUT", "30"))
 TERMINAL_MAX_OUTPUT_CHARS = int(os.getenv("AGENT_TERMINAL_MAX_OUTPUT_CHARS", "10000"))
 
+# Параллельное выполнение инструментов: общий предел и лимиты по инструментам
+# (AGENT_TOOL_CONCURRENCY="web_search=2,execute_terminal=1")
+TOOL_MAX_CONCURRENCY = int(os.getenv("AGENT_TOOL_MAX_CONCURRENCY", "8"))
+
+
+def _parse_limits(raw: str) -> dict[str, int]:
+    """Разобрать строку вида "name=N,name2=M" в словарь (значения >= 1)."""
+    limits = {}
+    for part in raw.split(","):
+        name, sep, value = part.partition("=")
+        if sep and name.strip() and value.strip().isdigit():
+            limits[name.strip()] = max(1, int(value))
+    return limits
+
+
+TOOL_CONCURRENCY_LIMITS = _parse_limits(
+    os.getenv("AGENT_TOOL_CONCURRENCY", "web_search=2,write_file=1,execute_terminal=1")
+)
+
+# Кэш ответов (opt-in): TTL в секундах по инструментам, default — для ответов без инструментов
+RESPONSE_CACHE_ENABLED = os.getenv("AGENT_RESPONSE_CACHE", "").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("AGENT_RESPONSE_CACHE_MAX_ENTRIES", "500"))
+RESPONSE_CACHE_DEFAULT_TTL = int(os.getenv("AGENT_RESPONSE_CACHE_DEFAULT_TTL", "3600"))
+RESPONSE_CACHE_TOOL_TTLS = _parse_limits(os.getenv(
+    "AGENT_RESPONSE_CACHE_TTL",
+    "get_crypto_price=30,get_crypto_prices=30,get_weather=600,get_weather_many=600,web_search=10800,http_request=300,read_file=60,list_files=60",
+))
+
+# Бюджет токенов на запрос к модели (system prompt + summary + история + запрос); 0 — без ограничения
+CONTEXT_TOKEN_BUDGET = int(os.getenv("AGENT_CONTEXT_TOKEN_BUDGET", "8000"))
+
 # Параметры компакции памяти
 MEMORY_MAX_MESSAGES = int(os.getenv("AGENT_MEMORY_MAX_MESSAGES", "100"))
 MEMORY_MAX_SIZE_KB = int(os.getenv("AGENT_MEMORY_MAX_SIZE_KB", "1024"))
 MEMORY_KEEP_RECENT = int(os.getenv("AGENT_MEMORY_KEEP_RECENT", "10"))
+# Надёжность записи памяти: fsync после каждой дозаписи; group commit — дозаписи
+# конкурентных писателей собираются в пачку за N мс с одним fsync (0 — выключено)
+MEMORY_FSYNC = os.getenv("AGENT_MEMORY_FSYNC", "").lower() in ("1", "true", "yes")
+MEMORY_GROUP_COMMIT_MS = float(os.getenv("AGENT_MEMORY_GROUP_COMMIT_MS", "0"))
+# Иерархическое резюме: когда резюме одного уровня в сумме превышают лимит токенов,
+# они сливаются в одно резюме следующего уровня; на верхнем уровне — сливаются между собой
+MEMORY_SUMMARY_LEVEL_TOKENS = int(os.getenv("AGENT_MEMORY_SUMMARY_LEVEL_TOKENS", "400"))
+MEMORY_SUMMARY_MAX_LEVELS = int(os.getenv("AGENT_MEMORY_SUMMARY_MAX_LEVELS", "3"))
+# Архив вытесненных компакцией сообщений: размер активного сегмента до запечатывания,
+# сжатие запечатанных сегментов (auto — zstd при установленном zstandard, иначе gzip)
+MEMORY_ARCHIVE_SEGMENT_KB = int(os.getenv("AGENT_MEMORY_ARCHIVE_SEGMENT_KB", "1024"))
+MEMORY_ARCHIVE_CODEC = os.getenv("AGENT_MEMORY_ARCHIVE_CODEC", "auto")
+# Поиск по архиву вытесненных сообщений: сколько релевантных реплик добавлять в промпт
+# (0 — выключено); векторы — hashing-trick эмбеддинги поверх BM25 (нужен numpy)
+MEMORY_RECALL_K = int(os.getenv("AGENT_MEMORY_RECALL_K", "3"))
+MEMORY_RECALL_VECTORS = os.getenv("AGENT_MEMORY_RECALL_VECTORS", "").lower() in ("1", "true", "yes")
+# Факты и задачи: снимок в memory.json раз в N операций журнала facts.log;
+# сколько относящихся к запросу фактов/задач добавлять в промпт (0 — не добавлять)
+MEMORY_FACTS_SNAPSHOT_EVERY = int(os.getenv("AGENT_MEMORY_FACTS_SNAPSHOT_EVERY", "200"))
+MEMORY_FACTS_INJECT = int(os.getenv("AGENT_MEMORY_FACTS_INJECT", "8"))
+# Компакция в фоновом потоке (ответ не ждёт генерации резюме)
+MEMORY_BACKGROUND_COMPACTION = os.getenv("AGENT_MEMORY_BACKGROUND_COMPACTION", "1").lower() in ("1", "true", "yes")
+
+# Резидентный режим (--serve / --connect): путь Unix-сокета, выход по простою (0 — никогда),
+# максимум именованных сессий в памяти демона
+SERVER_SOCKET = Path(os.getenv("AGENT_SOCKET", str(MEMORY_DIR / "agent.sock")))
+SERVER_IDLE_TIMEOUT = int(os.getenv("AGENT_SERVER_IDLE_TIMEOUT", "0"))
+SERVER_MAX_SESSIONS = int(os.getenv("AGENT_SERVER_MAX_SESSIONS", "64"))
 
 # Режим dry-run (устанавливается в run.py перед вызовом агента)
 _dry_run_ctx: contextvars.ContextVar[bool] = contextvars.ContextVar("dry_run", default=False)
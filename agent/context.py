@@ -0,0 +1,103 @@
+"""
+Контекстное окно: подсчёт токенов и отбор истории под бюджет.
+"""
+
+import functools
+
+from agent.config import CONTEXT_TOKEN_BUDGET, OPENAI_MODEL
+
+# Служебные токены на сообщение в chat-формате (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@functools.lru_cache(maxsize=1)
+def _encoder():
+    """Токенизатор модели (tiktoken) или None, если он недоступен офлайн."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(OPENAI_MODEL)
+    except KeyError:
+        pass
+    except Exception:
+        # tiktoken скачивает словари при первом использовании — без сети работаем по оценке
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Число токенов в тексте; без tiktoken — оценка ~4 байта UTF-8 на токен."""
+    if not text:
+        return 0
+    enc = _encoder()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def message_tokens(message: dict) -> int:
+    """
+    Токены сообщения истории с учётом служебных.
+
+    Берётся сохранённое в conversation.jsonl поле tokens; если его нет (старые
+    записи) — считается один раз и кэшируется в самом словаре.
+    """
+    tokens = message.get("tokens")
+    if not isinstance(tokens, int):
+        tokens = count_tokens(message.get("content", "") or "")
+        message["tokens"] = tokens
+    return tokens + MESSAGE_OVERHEAD_TOKENS
+
+
+def build_context(
+    conversation: list[dict],
+    *,
+    fixed_tokens: int = 0,
+    budget: int | None = None,
+) -> tuple[list[dict], dict]:
+    """
+    Отобрать историю под бюджет токенов, начиная с самых новых сообщений.
+
+    Args:
+        conversation: История (старые -> новые)
+        fixed_tokens: Токены, которые уйдут в запрос в любом случае
+            (system prompt, summary, текущий запрос)
+        budget: Бюджет на весь запрос; None — из config, 0 — без ограничения
+
+    Returns:
+        (сообщения в хронологическом порядке, статистика: budget, kept_messages,
+        kept_tokens, dropped_messages, dropped_tokens)
+    """
+    if budget is None:
+        budget = CONTEXT_TOKEN_BUDGET
+    available = budget - fixed_tokens if budget > 0 else None
+
+    used = 0
+    start = len(conversation)
+    for i in range(len(conversation) - 1, -1, -1):
+        cost = message_tokens(conversation[i])
+        if available is not None and used + cost > available:
+            break
+        used += cost
+        start = i
+    kept = conversation[start:]
+    # Не начинаем историю с ответа ассистента без его вопроса
+    while kept and kept[0].get("role") in ("assistant", "ai"):
+        used -= message_tokens(kept[0])
+        kept = kept[1:]
+
+    dropped = conversation[: len(conversation) - len(kept)]
+    stats = {
+        "budget": budget,
+        "fixed_tokens": fixed_tokens,
+        "kept_messages": len(kept),
+        "kept_tokens": used,
+        "dropped_messages": len(dropped),
+        "dropped_tokens": sum(message_tokens(m) for m in dropped),
+    }
+    return kept, stats
@@ -0,0 +1,107 @@
+"""
+Параллельное выполнение вызовов инструментов из одного хода модели.
+
+Граф create_agent отправляет каждый tool_call отдельной задачей (Send),
+и LangGraph выполняет задачи одного шага параллельно: в пуле потоков для
+invoke и через asyncio.gather для ainvoke. Результаты возвращаются как
+ToolMessage с tool_call_id, поэтому порядок ответов совпадает с порядком
+вызовов, а время хода определяется самым медленным инструментом.
+
+ToolExecutor ограничивает этот параллелизм: общий предел одновременно
+выполняющихся инструментов и лимиты на отдельные инструменты (например,
+один execute_terminal за раз). Потоки пула и asyncio-задачи копируют
+contextvars, так что dry-run (agent.config.get_dry_run) виден внутри
+инструментов так же, как при последовательном выполнении.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import functools
+import threading
+import weakref
+from typing import TYPE_CHECKING
+
+from agent.config import TOOL_CONCURRENCY_LIMITS, TOOL_MAX_CONCURRENCY
+
+if TYPE_CHECKING:
+    from langchain_core.tools import BaseTool
+
+_ALL = "*"
+
+
+class ToolExecutor:
+    """Ограничения параллельного выполнения инструментов."""
+
+    def __init__(
+        self,
+        max_concurrency: int | None = None,
+        limits: dict[str, int] | None = None,
+    ):
+        self.max_concurrency = max_concurrency or TOOL_MAX_CONCURRENCY
+        self.limits = dict(TOOL_CONCURRENCY_LIMITS if limits is None else limits)
+        self._semaphores = self._make(threading.BoundedSemaphore)
+        # asyncio.Semaphore привязан к event loop — отдельный набор на каждый loop
+        self._async_semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _make(self, factory) -> dict:
+        sems = {name: factory(n) for name, n in self.limits.items()}
+        sems[_ALL] = factory(self.max_concurrency)
+        return sems
+
+    def _async_semaphores_for_loop(self) -> dict:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            sems = self._async_semaphores.get(loop)
+            if sems is None:
+                sems = self._make(asyncio.Semaphore)
+                self._async_semaphores[loop] = sems
+        return sems
+
+    @contextlib.contextmanager
+    def _slot(self, name: str):
+        # Сначала лимит инструмента, затем общий: ожидание своей очереди
+        # не должно занимать слот общего пула.
+        with contextlib.ExitStack() as stack:
+            if name in self._semaphores:
+                stack.enter_context(self._semaphores[name])
+            stack.enter_context(self._semaphores[_ALL])
+            yield
+
+    @contextlib.asynccontextmanager
+    async def _aslot(self, name: str):
+        sems = self._async_semaphores_for_loop()
+        async with contextlib.AsyncExitStack() as stack:
+            if name in sems:
+                await stack.enter_async_context(sems[name])
+            await stack.enter_async_context(sems[_ALL])
+            yield
+
+    def wrap(self, tool: BaseTool) -> BaseTool:
+        """Вернуть копию инструмента, выполнение которой проходит через лимиты."""
+        name = tool.name
+        updates = {}
+
+        func = getattr(tool, "func", None)
+        if func is not None:
+            @functools.wraps(func)
+            def limited(*args, **kwargs):
+                with self._slot(name):
+                    return func(*args, **kwargs)
+            updates["func"] = limited
+
+        coroutine = getattr(tool, "coroutine", None)
+        if coroutine is not None:
+            @functools.wraps(coroutine)
+            async def alimited(*args, **kwargs):
+                async with self._aslot(name):
+                    return await coroutine(*args, **kwargs)
+            updates["coroutine"] = alimited
+
+        return tool.model_copy(update=updates) if updates else tool
+
+    def wrap_all(self, tools: list) -> list:
+        """Применить wrap ко всем инструментам, сохранив порядок."""
+        return [self.wrap(t) for t in tools]
@@ -0,0 +1,128 @@
+"""
+Факты и задачи памяти: индекс по ключу и операции журнала изменений.
+
+Состояние — снимок (facts/todos в memory.json) плюс журнал facts.log, где
+каждая строка — одна операция (set_fact, del_fact, set_todo, del_todo).
+Операции идемпотентны: повторное применение хвоста журнала к снимку, который
+его уже включает, даёт то же состояние. Чтение, запись и снимки — в
+agent.memory; здесь только структура данных без ввода-вывода.
+"""
+
+from agent.terms import tokenize
+
+TODO_STATUSES = ("open", "done")
+
+
+def _fact_terms(record: dict) -> set[str]:
+    return set(tokenize(f"{record.get('key', '')} {record.get('value', '')}"))
+
+
+def _todo_terms(record: dict) -> set[str]:
+    return set(tokenize(record.get("text", "")))
+
+
+class FactIndex:
+    """
+    Факты по ключу и задачи по id: upsert/удаление за O(1).
+
+    Для отбора по запросу держится инвертированный индекс терм -> записи,
+    он обновляется вместе с записями.
+    """
+
+    def __init__(self, facts: list[dict] = (), todos: list[dict] = ()):
+        self.facts: dict[str, dict] = {}
+        self.todos: dict[str, dict] = {}
+        self._terms: dict[str, set[tuple[str, str]]] = {}
+        self._next_todo = 1
+        for fact in facts:
+            if fact.get("key"):
+                self._put("fact", str(fact["key"]), dict(fact))
+        for i, todo in enumerate(todos, 1):
+            # В старых memory.json у задач нет id — берётся номер в списке
+            todo_id = str(todo.get("id") or f"t{i}")
+            self._put("todo", todo_id, {**todo, "id": todo_id, "status": todo.get("status", "open")})
+
+    def _table(self, kind: str) -> dict[str, dict]:
+        return self.facts if kind == "fact" else self.todos
+
+    def _index_terms(self, kind: str, key: str, record: dict, add: bool) -> None:
+        terms = _fact_terms(record) if kind == "fact" else _todo_terms(record)
+        for term in terms:
+            if add:
+                self._terms.setdefault(term, set()).add((kind, key))
+            else:
+                refs = self._terms.get(term)
+                if refs is not None:
+                    refs.discard((kind, key))
+                    if not refs:
+                        del self._terms[term]
+
+    def _put(self, kind: str, key: str, record: dict) -> None:
+        old = self._table(kind).get(key)
+        if old is not None:
+            self._index_terms(kind, key, old, add=False)  # позиция записи в списке сохраняется
+        self._table(kind)[key] = record
+        self._index_terms(kind, key, record, add=True)
+        if kind == "todo" and key[1:].isdigit():
+            self._next_todo = max(self._next_todo, int(key[1:]) + 1)
+
+    def _remove(self, kind: str, key: str) -> bool:
+        old = self._table(kind).pop(key, None)
+        if old is None:
+            return False
+        self._index_terms(kind, key, old, add=False)
+        return True
+
+    def next_todo_id(self) -> str:
+        return f"t{self._next_todo}"
+
+    def apply(self, op: dict) -> None:
+        """Применить операцию журнала; неизвестные операции пропускаются."""
+        name = op.get("op")
+        ts = op.get("ts", "")
+        if name == "set_fact" and op.get("key"):
+            key = str(op["key"])
+            self._put("fact", key, {"key": key, "value": op.get("value", ""), "updated_at": ts})
+        elif name == "del_fact":
+            self._remove("fact", str(op.get("key", "")))
+        elif name == "set_todo" and op.get("id"):
+            todo_id = str(op["id"])
+            self._put("todo", todo_id, {
+                "id": todo_id,
+                "text": op.get("text", ""),
+                "status": op.get("status", "open"),
+                "updated_at": ts,
+            })
+        elif name == "del_todo":
+            self._remove("todo", str(op.get("id", "")))
+
+    def fact_list(self) -> list[dict]:
+        return [dict(f) for f in self.facts.values()]
+
+    def todo_list(self) -> list[dict]:
+        return [dict(t) for t in self.todos.values()]
+
+    def relevant(self, query: str, limit: int) -> tuple[list[dict], list[dict]]:
+        """
+        Факты и открытые задачи, разделяющие термы с запросом.
+
+        Порядок — по числу совпавших термов, при равенстве — свежие первыми.
+        Returns:
+            (факты, задачи), вместе не больше limit записей.
+        """
+        if limit <= 0:
+            return [], []
+        hits: dict[tuple[str, str], int] = {}
+        for term in set(tokenize(query)):
+            for ref in self._terms.get(term, ()):
+                hits[ref] = hits.get(ref, 0) + 1
+        candidates = []
+        for (kind, key), score in hits.items():
+            record = self._table(kind)[key]
+            if kind == "todo" and record.get("status") != "open":
+                continue
+            candidates.append((score, record.get("updated_at", ""), kind, record))
+        candidates.sort(key=lambda c: (c[0], c[1]), reverse=True)
+        facts = [dict(r) for _, _, kind, r in candidates[:limit] if kind == "fact"]
+        todos = [dict(r) for _, _, kind, r in candidates[:limit] if kind == "todo"]
+        return facts, todos
@@ -0,0 +1,178 @@
+"""
+Тело ответа http_request: чтение с лимитом, декодирование, выдержки.
+
+BodyReader пишет поток чанков в заранее выделенный bytearray через
+memoryview, без склейки bytes (она квадратична по размеру тела), и
+сообщает, когда читать дальше не нужно: лимит достигнут или получено всё,
+что объявлено в Content-Length. Вызывающий прекращает чтение и закрывает
+ответ — остаток тела по сети не передаётся.
+
+decode_text декодирует по charset из Content-Type инкрементальным
+декодером: у обрезанного тела неполный последний символ отбрасывается,
+а не превращается в U+FFFD.
+
+json_excerpt и html_text — выдержки по типу содержимого: значение по пути
+в JSON и видимый текст HTML без разметки, скриптов и стилей.
+"""
+
+import codecs
+import json
+import re
+from html.parser import HTMLParser
+
+# Начальный размер буфера, когда длина тела неизвестна; дальше — удвоение до лимита
+INITIAL_BUFFER = 64 * 1024
+
+
+def declared_length(headers) -> int | None:
+    """
+    Длина тела из Content-Length, если она совпадает с длиной после распаковки.
+
+    При Content-Encoding (gzip и т.п.) заголовок описывает сжатое тело — None.
+    """
+    if headers.get("content-encoding", "identity").lower() != "identity":
+        return None
+    try:
+        length = int(headers.get("content-length", ""))
+    except ValueError:
+        return None
+    return length if length >= 0 else None
+
+
+class BodyReader:
+    """
+    Тело ответа не длиннее limit байт в одном буфере.
+
+    При известной длине буфер выделяется сразу под min(limit, длина),
+    иначе растёт удвоением. feed() копирует чанк в буфер один раз.
+    """
+
+    def __init__(self, limit: int, content_length: int | None = None):
+        self.limit = max(0, limit)
+        self.expected = content_length
+        capacity = self.limit if content_length is None else min(self.limit, content_length)
+        if content_length is None:
+            capacity = min(capacity, INITIAL_BUFFER)
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self.size = 0
+        self.truncated = content_length is not None and content_length > self.limit
+
+    @property
+    def complete(self) -> bool:
+        """Читать дальше не нужно: лимит достигнут или получена объявленная длина."""
+        if self.size >= self.limit:
+            return True
+        return self.expected is not None and self.size >= self.expected
+
+    def _grow(self, needed: int) -> None:
+        capacity = min(self.limit, max(needed, 2 * len(self._buf)))
+        self._view.release()
+        self._buf.extend(bytes(capacity - len(self._buf)))
+        self._view = memoryview(self._buf)
+
+    def feed(self, chunk: bytes) -> bool:
+        """Дописать чанк; False — чтение можно прекращать."""
+        room = self.limit - self.size
+        n = len(chunk)
+        if n > room:
+            n = room
+            self.truncated = True
+        end = self.size + n
+        if end > len(self._buf):
+            self._grow(end)
+        self._view[self.size:end] = memoryview(chunk)[:n]
+        self.size = end
+        if self.size >= self.limit and (self.expected is None or self.expected > self.limit):
+            # Лимит заполнен, а конец тела не подтверждён — считаем обрезанным
+            self.truncated = True
+        return not self.complete
+
+    def getvalue(self) -> memoryview:
+        """Прочитанное тело без копирования."""
+        return self._view[:self.size]
+
+
+def charset(content_type: str, default: str = "utf-8") -> str:
+    """Кодировка из Content-Type; неизвестная или не указанная — default."""
+    match = re.search(r"charset\s*=\s*[\"']?([\w.:-]+)", content_type or "", re.IGNORECASE)
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return default
+
+
+def decode_text(data, content_type: str, truncated: bool = False) -> str:
+    """Декодировать тело; у обрезанного неполный последний символ отбрасывается."""
+    decoder = codecs.getincrementaldecoder(charset(content_type))(errors="replace")
+    return decoder.decode(data, final=not truncated)
+
+
+def json_excerpt(text: str, path: str):
+    """
+    Значение по пути в JSON: "data.items.0.name" или "$.data.items[0].name".
+
+    Raises:
+        ValueError: тело не JSON.
+        KeyError: пути нет в документе.
+    """
+    value = json.loads(text)
+    path = path.strip().removeprefix("$").lstrip(".")
+    for part in re.findall(r"[^.\[\]]+", path):
+        if isinstance(value, list):
+            if not part.lstrip("-").isdigit() or not -len(value) <= int(part) < len(value):
+                raise KeyError(part)
+            value = value[int(part)]
+        elif isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            raise KeyError(part)
+    return value
+
+
+class _TextExtractor(HTMLParser):
+    _SKIP = {"script", "style", "noscript", "template", "svg", "head"}
+    _BLOCK = {"p", "div", "br", "li", "ul", "ol", "tr", "table", "section", "article",
+              "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "title", "header", "footer"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: list[str] = []
+        self._skip = 0
+        self._title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._title = True
+        elif tag in self._SKIP:
+            self._skip += 1
+        if tag in self._BLOCK:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._title = False
+        elif tag in self._SKIP and self._skip:
+            self._skip -= 1
+        if tag in self._BLOCK:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        # Заголовок страницы полезен, остальное содержимое <head> — нет
+        if not self._skip or self._title:
+            self.parts.append(data)
+
+
+def html_text(text: str) -> str:
+    """Видимый текст HTML: без тегов, скриптов и стилей, пробелы схлопнуты."""
+    parser = _TextExtractor()
+    parser.feed(text)
+    parser.close()
+    lines = (" ".join(line.split()) for line in "".join(parser.parts).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def is_html(content_type: str) -> bool:
+    return (content_type or "").split(";")[0].strip().lower() in ("text/html", "application/xhtml+xml")
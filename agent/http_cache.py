@@ -0,0 +1,345 @@
+"""
+Дисковый HTTP-кэш GET-запросов http_request по RFC 9111 (частный кэш).
+
+Запись — пара файлов в HTTP_CACHE_DIR: <ключ>.meta (JSON: URL, статус,
+заголовки, время запроса и ответа, значения заголовков из Vary) и тело
+<ключ>.<версия>.body. Тело читается через mmap: до декодирования оно не
+копируется в память процесса. Файлы пишутся атомарно, старое тело
+удаляется после записи новой meta — читатель видит целую запись.
+
+Свежесть — по Cache-Control: max-age (s-maxage не учитывается, кэш
+частный) или по Expires относительно Date; возраст — с учётом Age и
+задержки ответа. Эвристическая свежесть не применяется: ответ только с
+ETag/Last-Modified хранится, но перед выдачей перепроверяется условным
+запросом (If-None-Match / If-Modified-Since). 304 обновляет заголовки
+записи, тело отдаётся из кэша без повторной загрузки.
+
+Не кэшируются: no-store в запросе или ответе, Vary: *, запросы с Range
+или собственными условными заголовками, тела, обрезанные по лимиту.
+no-cache в ответе, no-cache/max-age=0 (или Pragma: no-cache) в запросе —
+запись перепроверяется. Размер ограничен HTTP_CACHE_MAX_MB: при
+превышении удаляются давно не использованные записи (LRU; порядок между
+запусками — по mtime meta-файла, он обновляется при каждом попадании).
+"""
+
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass, field
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+from agent.config import HTTP_CACHE_DIR, HTTP_CACHE_MAX_MB
+from agent.storage import atomic_write
+
+# Статусы, которые можно хранить (RFC 9110, 15.1 — кэшируемые по умолчанию)
+CACHEABLE_STATUSES = frozenset({200, 203, 300, 301, 308, 404, 410})
+
+# С этими заголовками запрос идёт мимо кэша: клиент сам управляет выдачей
+_BYPASS_REQUEST_HEADERS = ("range", "if-none-match", "if-modified-since", "if-match", "if-unmodified-since", "if-range")
+
+# Не сохраняются: hop-by-hop, cookie и описание сжатого тела (тело хранится распакованным)
+_UNSTORED_HEADERS = frozenset({
+    "connection", "keep-alive", "transfer-encoding", "set-cookie",
+    "content-encoding", "content-length",
+})
+
+
+def _lower(headers) -> dict[str, str]:
+    return {str(k).lower(): str(v) for k, v in (headers or {}).items()}
+
+
+def parse_cache_control(value: str) -> dict[str, str | None]:
+    """Директивы Cache-Control: имя -> аргумент (None без аргумента)."""
+    directives: dict[str, str | None] = {}
+    for part in (value or "").split(","):
+        name, sep, arg = part.strip().partition("=")
+        if name:
+            directives[name.strip().lower()] = arg.strip().strip('"') if sep else None
+    return directives
+
+
+def _seconds(value) -> int | None:
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _http_date(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+@dataclass
+class Entry:
+    """Сохранённый ответ (содержимое meta-файла)."""
+
+    url: str
+    status: int
+    headers: dict[str, str]
+    body: str
+    size: int
+    request_time: float
+    response_time: float
+    vary: dict[str, str] = field(default_factory=dict)
+
+    def freshness_lifetime(self) -> float:
+        cc = parse_cache_control(self.headers.get("cache-control", ""))
+        max_age = _seconds(cc.get("max-age"))
+        if max_age is not None:
+            return max_age
+        if "expires" in self.headers:
+            expires = _http_date(self.headers["expires"])
+            if expires is None:
+                return 0.0  # некорректный Expires — уже устарел
+            date = _http_date(self.headers.get("date")) or self.response_time
+            return max(0.0, expires - date)
+        return 0.0
+
+    def age(self, now: float) -> float:
+        """Текущий возраст ответа (RFC 9111, 4.2.3)."""
+        date = _http_date(self.headers.get("date")) or self.response_time
+        apparent = max(0.0, self.response_time - date)
+        corrected = (_seconds(self.headers.get("age")) or 0) + (self.response_time - self.request_time)
+        return max(apparent, corrected) + (now - self.response_time)
+
+    def is_fresh(self, request_cc: dict, now: float | None = None) -> bool:
+        """Можно ли отдать без перепроверки."""
+        if "no-cache" in parse_cache_control(self.headers.get("cache-control", "")) or "no-cache" in request_cc:
+            return False
+        now = time.time() if now is None else now
+        age = self.age(now)
+        max_age = _seconds(request_cc.get("max-age"))
+        if max_age is not None and age > max_age:
+            return False
+        return self.freshness_lifetime() > age
+
+    def validators(self) -> dict[str, str]:
+        """Заголовки условного запроса для перепроверки."""
+        out = {}
+        if "etag" in self.headers:
+            out["If-None-Match"] = self.headers["etag"]
+        if "last-modified" in self.headers:
+            out["If-Modified-Since"] = self.headers["last-modified"]
+        return out
+
+
+@dataclass
+class Lookup:
+    """Результат поиска в кэше для одного запроса."""
+
+    url: str
+    key: str
+    headers: dict[str, str]
+    directives: dict[str, str | None]
+    entry: Entry | None = None
+    fresh: bool = False
+    previous_body: str = ""
+
+    def request_headers(self, headers: dict | None) -> dict:
+        """Заголовки запроса к серверу: исходные плюс валидаторы записи."""
+        if self.entry is None:
+            return dict(headers or {})
+        return {**(headers or {}), **self.entry.validators()}
+
+
+class HttpCache:
+    """Кэш в каталоге root не больше max_bytes байт (meta + тела)."""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._lru: OrderedDict[str, int] | None = None  # ключ -> размер, от давно использованных к свежим
+        self._total = 0
+        self._stats = dict.fromkeys(("hits", "misses", "revalidations", "stores", "evictions"), 0)
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+    def _meta_path(self, key: str) -> Path:
+        return self.root / f"{key}.meta"
+
+    def _load_lru(self) -> OrderedDict:
+        """Размеры записей по файлам каталога (один раз за процесс). Под self._lock."""
+        if self._lru is None:
+            sizes: dict[str, int] = {}
+            used: dict[str, float] = {}
+            with contextlib.suppress(FileNotFoundError):
+                for entry in os.scandir(self.root):
+                    key, _, suffix = entry.name.partition(".")
+                    if not suffix.endswith(("meta", "body")):
+                        continue
+                    with contextlib.suppress(OSError):
+                        st = entry.stat()
+                        sizes[key] = sizes.get(key, 0) + st.st_size
+                        if suffix == "meta":
+                            used[key] = st.st_mtime
+            self._lru = OrderedDict(sorted(((k, sizes[k]) for k in used), key=lambda kv: used[kv[0]]))
+            self._total = sum(self._lru.values())
+        return self._lru
+
+    def lookup(self, url: str, headers: dict | None = None) -> Lookup | None:
+        """
+        Найти запись для GET url.
+
+        Returns:
+            None — запрос не должен использовать кэш (no-store, Range, свои
+            условные заголовки); иначе Lookup, где entry — подходящая запись
+            или None, fresh — можно отдать без запроса к серверу.
+        """
+        request = _lower(headers)
+        if any(name in request for name in _BYPASS_REQUEST_HEADERS):
+            return None
+        directives = parse_cache_control(request.get("cache-control", ""))
+        if "cache-control" not in request and "no-cache" in request.get("pragma", "").lower():
+            directives["no-cache"] = None
+        if "no-store" in directives:
+            return None
+        key = self._key(url)
+        lookup = Lookup(url=url, key=key, headers=request, directives=directives)
+        try:
+            entry = Entry(**json.loads(self._meta_path(key).read_text(encoding="utf-8")))
+        except (OSError, ValueError, TypeError):
+            return lookup
+        lookup.previous_body = entry.body
+        if entry.url != url or any(request.get(name, "") != value for name, value in entry.vary.items()):
+            return lookup
+        lookup.entry = entry
+        lookup.fresh = entry.is_fresh(directives)
+        return lookup
+
+    @contextlib.contextmanager
+    def read(self, entry: Entry, limit: int, *, revalidated: bool = False) -> Iterator[tuple[memoryview, bool]]:
+        """
+        Тело записи через mmap: (не больше limit байт, обрезано ли).
+
+        memoryview действителен только внутри with. OSError — тело пропало
+        (запись вытеснена другим процессом), запрос нужно выполнить заново.
+        """
+        path = self.root / entry.body
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size != entry.size:
+                raise FileNotFoundError(path)
+            self._used(self._key(entry.url), "revalidations" if revalidated else "hits")
+            if size == 0:
+                yield memoryview(b""), False
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view, \
+                    view[:limit] as body:
+                yield body, size > limit
+
+    def _used(self, key: str, counter: str) -> None:
+        with contextlib.suppress(OSError):
+            os.utime(self._meta_path(key))
+        with self._lock:
+            self._stats[counter] += 1
+            lru = self._load_lru()
+            if key in lru:
+                lru.move_to_end(key)
+
+    def refresh(self, lookup: Lookup, response_headers, request_time: float) -> Entry:
+        """Обновить запись по ответу 304 (RFC 9111, 4.3.4) и вернуть её."""
+        entry = lookup.entry
+        for name, value in _lower(response_headers).items():
+            if name not in _UNSTORED_HEADERS:
+                entry.headers[name] = value
+        entry.request_time, entry.response_time = request_time, time.time()
+        self._write_meta(lookup.key, entry)
+        return entry
+
+    def store(self, lookup: Lookup, status: int, response_headers, body, *,
+              truncated: bool, request_time: float) -> bool:
+        """Сохранить ответ, если он кэшируемый. Считается промахом кэша."""
+        with self._lock:
+            self._stats["misses"] += 1
+        headers = _lower(response_headers)
+        cc = parse_cache_control(headers.get("cache-control", ""))
+        vary = [v.strip().lower() for v in headers.get("vary", "").split(",") if v.strip()]
+        if truncated or status not in CACHEABLE_STATUSES or "no-store" in cc or "*" in vary:
+            return False
+        entry = Entry(
+            url=lookup.url,
+            status=status,
+            headers={k: v for k, v in headers.items() if k not in _UNSTORED_HEADERS},
+            body=f"{lookup.key}.{uuid.uuid4().hex[:8]}.body",
+            size=len(body),
+            request_time=request_time,
+            response_time=time.time(),
+            vary={name: lookup.headers.get(name, "") for name in vary},
+        )
+        if not (entry.freshness_lifetime() > 0 or entry.validators()) or entry.size > self.max_bytes:
+            return False
+        self.root.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.root / entry.body, body, fsync=False)
+        size = self._write_meta(lookup.key, entry)
+        if lookup.previous_body and lookup.previous_body != entry.body:
+            with contextlib.suppress(OSError):
+                (self.root / lookup.previous_body).unlink()
+        with self._lock:
+            self._stats["stores"] += 1
+            lru = self._load_lru()
+            self._total += size + entry.size - lru.get(lookup.key, 0)
+            lru[lookup.key] = size + entry.size
+            lru.move_to_end(lookup.key)
+            victims = []
+            while self._total > self.max_bytes and len(lru) > 1:
+                key, freed = lru.popitem(last=False)
+                self._total -= freed
+                self._stats["evictions"] += 1
+                victims.append(key)
+        for key in victims:
+            self._remove(key)
+        return True
+
+    def _write_meta(self, key: str, entry: Entry) -> int:
+        payload = json.dumps(asdict(entry), ensure_ascii=False).encode("utf-8")
+        atomic_write(self._meta_path(key), payload, fsync=False)
+        return len(payload)
+
+    def _remove(self, key: str) -> None:
+        meta = self._meta_path(key)
+        try:
+            body = json.loads(meta.read_text(encoding="utf-8")).get("body", "")
+        except (OSError, ValueError):
+            body = ""
+        for path in (meta, self.root / body if body else None):
+            if path is not None:
+                with contextlib.suppress(OSError):
+                    path.unlink()
+
+    def stats(self) -> dict:
+        """Счётчики попаданий, промахов, перепроверок и текущий размер."""
+        with self._lock:
+            lru = self._load_lru()
+            return {**self._stats, "entries": len(lru), "bytes": self._total}
+
+
+_caches: dict[Path, HttpCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache() -> HttpCache | None:
+    """Кэш каталога HTTP_CACHE_DIR; None, если кэш выключен (HTTP_CACHE_MAX_MB=0)."""
+    if HTTP_CACHE_MAX_MB <= 0:
+        return None
+    root = Path(HTTP_CACHE_DIR)
+    with _caches_lock:
+        cache = _caches.get(root)
+        if cache is None:
+            cache = _caches[root] = HttpCache(root, int(HTTP_CACHE_MAX_MB * 1024 * 1024))
+        return cache
@@ -0,0 +1,165 @@
+"""
+Общий HTTP-клиент сетевых инструментов: keep-alive пулы соединений по хостам.
+
+Синхронные инструменты ходят через один requests.Session на процесс: его
+HTTPAdapter держит до HTTP_POOL_HOSTS пулов urllib3 (по одному на хост) и до
+HTTP_POOL_MAXSIZE соединений в каждом. Пулы потокобезопасны, поэтому сессия
+общая для всех потоков исполнителя инструментов. Async-версии используют
+httpx.AsyncClient — один на event loop (соединения httpx привязаны к циклу).
+
+Повторный запрос к тому же хосту идёт по открытому соединению, без DNS,
+TCP и TLS рукопожатий. Ответы gzip/deflate распаковываются прозрачно, brotli
+и zstd — если установлены brotli/zstandard (Accept-Encoding выставляют сами
+requests/httpx по доступным декодерам). Cookie не сохраняются: запросы
+разных инструментов не влияют друг на друга, как и с отдельными вызовами.
+
+Метрики: stats() — число запросов, новых соединений, TLS-рукопожатий и
+запросов по уже открытому соединению; текущий span трассировки получает
+conn=new/reused.
+"""
+
+import asyncio
+import threading
+import weakref
+
+from agent.config import HTTP_MAX_REDIRECTS, HTTP_POOL_HOSTS, HTTP_POOL_MAXSIZE, HTTP_TIMEOUT
+from agent.tracing import current_span
+
+_lock = threading.Lock()
+_session = None
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, object]" = weakref.WeakKeyDictionary()
+
+_STAT_KEYS = ("requests", "connections", "tls_handshakes", "reused")
+_stats = dict.fromkeys(_STAT_KEYS, 0)
+_stats_lock = threading.Lock()
+
+
+def _count(new: bool, tls: bool) -> None:
+    """Учесть отправку запроса: по новому соединению или по открытому."""
+    with _stats_lock:
+        _stats["requests"] += 1
+        if new:
+            _stats["connections"] += 1
+            _stats["tls_handshakes"] += tls
+        else:
+            _stats["reused"] += 1
+    current_span().set(conn="new" if new else "reused")
+
+
+def stats() -> dict:
+    """Счётчики пулов с момента старта (или reset_stats)."""
+    with _stats_lock:
+        result = dict(_stats)
+    sent = result["requests"]
+    result["reuse_rate"] = round(result["reused"] / sent, 4) if sent else 0.0
+    return result
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        _stats.update(dict.fromkeys(_STAT_KEYS, 0))
+
+
+def _build_session():
+    import requests
+    from http.cookiejar import DefaultCookiePolicy
+    from requests.adapters import HTTPAdapter
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class CountedPool(HTTPConnectionPool):
+        def _make_request(self, conn, *args, **kwargs):
+            # Соединение без сокета подключится (и пройдёт TLS) внутри запроса
+            _count(new=conn.sock is None, tls=self.scheme == "https")
+            return super()._make_request(conn, *args, **kwargs)
+
+    class CountedTLSPool(CountedPool, HTTPSConnectionPool):
+        pass
+
+    class PooledAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {"http": CountedPool, "https": CountedTLSPool}
+
+    session = requests.Session()
+    session.max_redirects = HTTP_MAX_REDIRECTS
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = PooledAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def session():
+    """Общий requests.Session (создаётся при первом вызове)."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def request(method: str, url: str, **kwargs):
+    """
+    Синхронный запрос через общий пул; параметры — как у requests.request.
+
+    По умолчанию timeout=HTTP_TIMEOUT. Ответ с stream=True нужно закрыть
+    (with или close()), чтобы соединение вернулось в пул.
+    """
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    return session().request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+async def _trace_hook(request) -> None:
+    """Подписать запрос httpx на события httpcore, чтобы отличить новое соединение от открытого."""
+    state = {"new": False, "tls": False}
+
+    async def trace(event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.complete":
+            state["new"] = True
+        elif event == "connection.start_tls.complete":
+            state["tls"] = True
+        elif event.endswith("send_request_headers.started"):
+            _count(new=state["new"], tls=state["tls"])
+
+    request.extensions["trace"] = trace
+
+
+def _build_async_client():
+    import httpx
+
+    connections = HTTP_POOL_HOSTS * HTTP_POOL_MAXSIZE
+    return httpx.AsyncClient(
+        timeout=HTTP_TIMEOUT,
+        follow_redirects=True,
+        max_redirects=HTTP_MAX_REDIRECTS,
+        limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+        event_hooks={"request": [_trace_hook]},
+    )
+
+
+def async_client():
+    """
+    Общий httpx.AsyncClient текущего event loop.
+
+    Вызывается из корутины. Клиент живёт, пока жив цикл; закрывать его
+    после запроса не нужно — для этого есть aclose().
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _clients.get(loop)
+        if client is None or client.is_closed:
+            client = _clients[loop] = _build_async_client()
+    return client
+
+
+async def aclose() -> None:
+    """Закрыть клиент текущего event loop (при остановке демона)."""
+    with _lock:
+        client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -2,18 +2,61 @@
 Адаптер для OpenAI через LangChain.
 """
 
-from langchain_openai import ChatOpenAI
+from langchain_core.callbacks import BaseCallbackHandler
 
 from agent.config import OPENAI_API_KEY, OPENAI_MODEL
+from agent.tracing import start_span
 
 
-def get_llm(**kwargs) -> ChatOpenAI:
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Span "llm.call" на каждый вызов модели (с токенами), если трассировка включена."""
+
+    def __init__(self):
+        self._open = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        opened = start_span("llm.call", messages=sum(len(batch) for batch in messages))
+        if opened is not None:
+            self._open[run_id] = opened
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        entry = self._open.pop(run_id, None)
+        if entry is None:
+            return
+        tracer, span = entry
+        for gens in response.generations:
+            for gen in gens:
+                usage = getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+                if usage:
+                    span.set(
+                        input_tokens=usage.get("input_tokens", 0),
+                        output_tokens=usage.get("output_tokens", 0),
+                        cached_tokens=(usage.get("input_token_details") or {}).get("cache_read", 0),
+                    )
+        tracer.finish_span(span)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        entry = self._open.pop(run_id, None)
+        if entry is not None:
+            tracer, span = entry
+            span.set(error=type(error).__name__)
+            tracer.finish_span(span)
+
+
+def get_llm(**kwargs):
     """
     Возвращает экземпляр ChatOpenAI для использования в агенте.
+
+    langchain_openai (и openai) импортируются здесь, при первом вызове:
+    это самая тяжёлая часть старта (~0.5 с).
     """
+    from langchain_openai import ChatOpenAI
+
     return ChatOpenAI(
         model=OPENAI_MODEL,
         api_key=OPENAI_API_KEY or None,  # None -> из env OPENAI_API_KEY
         temperature=0,
+        stream_usage=True,  # usage (в т.ч. cached tokens) и в потоковом режиме
+        callbacks=[TracingCallbackHandler()],
         **kwargs,
     )
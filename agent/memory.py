@@ -1,105 +1,619 @@
 """
 Работа с памятью: conversation.jsonl, memory.json, компакция.
+
+Рядом с conversation.jsonl лежит индекс conversation.jsonl.idx: по 8 байт
+(uint64 LE) на строку — смещение конца строки. Число сообщений — размер
+индекса / 8, последние N строк читаются seek'ом с конца. Индекс сверяется
+с файлом по размеру (последнее смещение == размер файла) и перестраивается,
+если файл изменили в обход append_message.
+
+Факты и задачи — снимок в memory.json и журнал изменений facts.log
+(agent.facts): upsert/удаление дописывают одну строку, снимок делается
+раз в MEMORY_FACTS_SNAPSHOT_EVERY операций. Изолированная сессия (задача
+batch без --shared-memory) держит свои факты в памяти: set_session_facts
+направляет операции и чтение в её FactIndex, facts.log не затрагивается.
+
+Запись (дозапись, перестройка индекса, компакция, memory.json) идёт под
+межпроцессной блокировкой memory.lock, полная перезапись файлов — атомарно
+(agent.storage), так что несколько агентов могут делить один AGENT_MEMORY_DIR.
 """
 
+import contextvars
 import json
+import os
+import struct
+import sys
+import threading
+from collections.abc import Iterator
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
+from pathlib import Path
 
+from agent import archive
 from agent.config import (
     CONVERSATION_FILE,
+    MEMORY_ARCHIVE_CODEC,
+    MEMORY_ARCHIVE_SEGMENT_KB,
+    MEMORY_FACTS_INJECT,
+    MEMORY_FACTS_SNAPSHOT_EVERY,
     MEMORY_FILE,
+    MEMORY_FSYNC,
+    MEMORY_GROUP_COMMIT_MS,
     MEMORY_KEEP_RECENT,
     MEMORY_MAX_MESSAGES,
     MEMORY_MAX_SIZE_KB,
+    MEMORY_SUMMARY_LEVEL_TOKENS,
+    MEMORY_SUMMARY_MAX_LEVELS,
+    USAGE_FILE,
     ensure_dirs,
 )
+from agent.context import count_tokens
+from agent.facts import TODO_STATUSES, FactIndex
 from agent.llm_client import get_llm
+from agent.storage import GroupCommit, atomic_write, lock_for
+from agent.summaries import add_summary, chunk_summary, from_legacy, render
+from agent.tracing import traced
+
+
+_ENTRY = struct.Struct("<Q")
+_TAIL_CHECK_BYTES = 64
+
+
+def _index_path(path: Path) -> Path:
+    return path.with_name(path.name + ".idx")
+
+
+def _lock():
+    """Блокировка записи в память (между потоками и процессами)."""
+    return lock_for(CONVERSATION_FILE.with_name("memory.lock"))
+
+
+def _compaction_lock():
+    """Не даёт двум процессам одновременно генерировать резюме."""
+    return lock_for(CONVERSATION_FILE.with_name("compaction.lock"))
+
+
+def _end_offset(index: Path, k: int) -> int:
+    """Смещение конца k-й строки (с нуля) из индекса."""
+    with open(index, "rb") as f:
+        f.seek(k * _ENTRY.size)
+        (end,) = _ENTRY.unpack(f.read(_ENTRY.size))
+    return end
+
+
+def _index_valid(path: Path, size: int) -> bool:
+    """Индекс соответствует файлу: последнее смещение == размер файла."""
+    try:
+        isize = os.path.getsize(_index_path(path))
+    except OSError:
+        return size == 0
+    if isize % _ENTRY.size:
+        return False
+    if isize == 0:
+        return size == 0
+    return _end_offset(_index_path(path), isize // _ENTRY.size - 1) == size
+
+
+def _rebuild_index(path: Path) -> None:
+    """Построить индекс заново одним проходом по файлу."""
+    with _lock():
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if _index_valid(path, size):
+            return  # уже перестроил другой писатель
+        ends = []
+        offset = 0
+        if path.exists():
+            with open(path, "rb") as f:
+                for line in f:
+                    offset += len(line)
+                    ends.append(offset)
+        atomic_write(_index_path(path), b"".join(_ENTRY.pack(e) for e in ends))
+
+
+def _write_lines(path: Path, messages: list[dict], tail: bytes = b"") -> None:
+    """
+    Атомарно переписать файл: messages и уже сериализованные строки tail.
+
+    Новый файл пишется рядом и подменяется через os.replace; индекс строится
+    заново. Вызывается под _lock().
+    """
+    lines = [(json.dumps(m, ensure_ascii=False) + "\n").encode("utf-8") for m in messages]
+    lines += tail.splitlines(keepends=True)
+    ends = []
+    offset = 0
+    for line in lines:
+        offset += len(line)
+        ends.append(offset)
+    atomic_write(path, b"".join(lines), durable=MEMORY_FSYNC)
+    atomic_write(_index_path(path), b"".join(_ENTRY.pack(e) for e in ends), durable=MEMORY_FSYNC)
+
+
+def _append_lines(lines: list[bytes]) -> None:
+    """
+    Дописать строки в conversation.jsonl и смещения их концов в индекс.
+
+    Одна блокировка на пачку; fsync — при AGENT_MEMORY_FSYNC или group commit.
+    """
+    with _lock():
+        with open(CONVERSATION_FILE, "ab+") as f:
+            offset = f.seek(0, os.SEEK_END)
+            if offset:
+                f.seek(offset - 1)
+                if f.read(1) != b"\n":
+                    lines = [b"\n" + lines[0]] + lines[1:]  # файл правили вручную без перевода строки в конце
+            f.write(b"".join(lines))
+            f.flush()
+            if MEMORY_FSYNC or MEMORY_GROUP_COMMIT_MS > 0:
+                os.fsync(f.fileno())
+        if not _index_valid(CONVERSATION_FILE, offset):
+            _rebuild_index(CONVERSATION_FILE)  # уже включает новые строки
+            return
+        ends = []
+        for line in lines:
+            offset += len(line)
+            ends.append(offset)
+        with open(_index_path(CONVERSATION_FILE), "ab") as f:
+            f.write(b"".join(_ENTRY.pack(e) for e in ends))
+
+
+def archive_dir() -> Path:
+    """Каталог сегментированного архива вытесненных компакцией сообщений (agent.archive)."""
+    return CONVERSATION_FILE.with_name("archive")
+
+
+def _archive(messages: list[dict]) -> None:
+    """Дописать вытесненные сообщения в архив. Вызывается под _lock()."""
+    archive.append(
+        archive_dir(),
+        messages,
+        segment_bytes=MEMORY_ARCHIVE_SEGMENT_KB * 1024,
+        codec=MEMORY_ARCHIVE_CODEC,
+        durable=MEMORY_FSYNC,
+    )
+
+
+def iter_archive(
+    since: datetime | str | None = None,
+    until: datetime | str | None = None,
+) -> Iterator[dict]:
+    """Сообщения архива потоком, с фильтром по времени (см. agent.archive.iter_messages)."""
+    return archive.iter_messages(archive_dir(), since, until)
+
+
+_group_commit: GroupCommit | None = None
+_group_commit_guard = threading.Lock()
+
+
+def _committer() -> GroupCommit:
+    global _group_commit
+    with _group_commit_guard:
+        if _group_commit is None:
+            _group_commit = GroupCommit(_append_lines, MEMORY_GROUP_COMMIT_MS / 1000)
+        return _group_commit
+
+
+def _parse_lines(data: bytes) -> list[dict]:
+    result = []
+    for line in data.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            result.append(json.loads(line))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            continue
+    return result
+
+
+@dataclass
+class _Cached:
+    """
+    Разобранное содержимое файла и его отпечаток.
+
+    consumed — до какого байта разобраны целые строки; tail — последние байты
+    перед consumed: если они на месте, файл только дописывали.
+    """
+
+    ino: int
+    size: int
+    mtime_ns: int
+    consumed: int
+    tail: bytes
+    messages: list = field(default_factory=list)
+
+
+_cache: dict[Path, _Cached] = {}
+_cache_lock = threading.Lock()
+
+_background: threading.Thread | None = None
+_background_lock = threading.Lock()
+
 
+def _read_tail_bytes(f, size: int) -> bytes:
+    start = max(0, size - _TAIL_CHECK_BYTES)
+    f.seek(start)
+    return f.read(size - start)
 
-def append_message(role: str, content: str) -> None:
-    """Добавить сообщение в conversation.jsonl."""
+
+@traced("memory.append_message")
+def append_message(role: str, content: str) -> dict:
+    """
+    Добавить сообщение в conversation.jsonl.
+
+    Рядом с текстом сохраняется число токенов (tokens), чтобы при сборке
+    контекста не считать его повторно. Смещение конца строки дописывается
+    в индекс. При AGENT_MEMORY_GROUP_COMMIT_MS > 0 дозаписи конкурентных
+    писателей объединяются в пачки с одним fsync. Возвращает записанное сообщение.
+    """
     ensure_dirs()
-    line = json.dumps({
+    message = {
         "role": role,
         "content": content,
+        "tokens": count_tokens(content),
         "ts": datetime.now(timezone.utc).isoformat(),
-    }, ensure_ascii=False) + "\n"
+    }
+    line = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
     CONVERSATION_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(CONVERSATION_FILE, "a", encoding="utf-8") as f:
-        f.write(line)
+    if MEMORY_GROUP_COMMIT_MS > 0:
+        _committer().submit(line)
+    else:
+        _append_lines([line])
+    return message
+
+
+@traced("memory.append_usage")
+def append_usage(usage: dict) -> None:
+    """Добавить usage хода (токены, в т.ч. из prefix-кэша) в usage.jsonl."""
+    ensure_dirs()
+    record = {**usage, "ts": datetime.now(timezone.utc).isoformat()}
+    with open(USAGE_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+@traced("memory.load_conversation")
+def load_conversation(last: int | None = None) -> list[dict]:
+    """
+    Загрузить историю диалога из conversation.jsonl.
 
+    Разобранные сообщения кэшируются в процессе: если файл только дописан
+    (тот же inode, прежний хвост на месте), разбираются лишь новые строки.
 
-def load_conversation() -> list[dict]:
-    """Загрузить историю диалога из conversation.jsonl."""
-    if not CONVERSATION_FILE.exists():
+    Args:
+        last: Вернуть только последние last строк (seek с конца по индексу,
+            без чтения всего файла)
+    """
+    path = CONVERSATION_FILE
+    try:
+        st = os.stat(path)
+    except OSError:
         return []
-    result = []
-    with open(CONVERSATION_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                result.append(json.loads(line))
-            except json.JSONDecodeError:
-                continue
-    return result
+    if last is not None:
+        return _load_last(path, st, last)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if not _cache_fresh(cached, st):
+            cached = _cache[path] = _refresh(path, st, cached)
+        return list(cached.messages)
 
 
-def load_memory() -> dict:
-    """Загрузить memory.json."""
-    if not MEMORY_FILE.exists():
-        return {
-            "summary": "",
-            "facts": [],
-            "todos": [],
-            "updated_at": "",
-        }
+def _cache_fresh(cached: _Cached | None, st: os.stat_result) -> bool:
+    return cached is not None and (cached.ino, cached.size, cached.mtime_ns) == (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _refresh(path: Path, st: os.stat_result, cached: _Cached | None) -> _Cached:
+    """
+    Дочитать файл после кэша или разобрать заново.
+
+    Разбираются только целые строки: недописанная строка другого процесса
+    дочитается в следующий раз. Последняя строка без перевода строки
+    принимается, если это корректный JSON (файл правили вручную).
+    """
+    with open(path, "rb") as f:
+        if (
+            cached is not None
+            and cached.ino == st.st_ino
+            and st.st_size >= cached.size
+            and _read_tail_bytes(f, cached.consumed) == cached.tail
+        ):
+            start, messages = cached.consumed, list(cached.messages)
+        else:
+            start, messages = 0, []
+        f.seek(start)
+        data = f.read(st.st_size - start)
+        complete = data.rfind(b"\n") + 1
+        messages += _parse_lines(data[:complete])
+        rest = _parse_lines(data[complete:])
+        if rest:
+            messages += rest
+            complete = len(data)
+        consumed = start + complete
+        tail = _read_tail_bytes(f, consumed)
+    return _Cached(st.st_ino, st.st_size, st.st_mtime_ns, consumed, tail, messages)
+
+
+def _load_last(path: Path, st: os.stat_result, last: int) -> list[dict]:
+    """Последние last строк: из кэша, если он актуален, иначе seek по индексу."""
+    if last <= 0:
+        return []
+    with _cache_lock:
+        cached = _cache.get(path)
+        if _cache_fresh(cached, st):
+            return cached.messages[-last:]
+    if not _index_valid(path, st.st_size):
+        _rebuild_index(path)
+    index = _index_path(path)
+    count = os.path.getsize(index) // _ENTRY.size
+    start = 0 if count <= last else _end_offset(index, count - last - 1)
+    with open(path, "rb") as f:
+        f.seek(start)
+        return _parse_lines(f.read(st.st_size - start))
+
+
+def _read_memory_file() -> dict:
+    """Содержимое memory.json как есть; пустой словарь, если файла нет или он битый."""
     try:
         with open(MEMORY_FILE, "r", encoding="utf-8") as f:
             data = json.load(f)
     except (json.JSONDecodeError, OSError):
-        return {"summary": "", "facts": [], "todos": [], "updated_at": ""}
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+@traced("memory.load_memory")
+def load_memory() -> dict:
+    """
+    Загрузить memory.json.
+
+    summary — готовый текст для промпта, summaries — узлы иерархического
+    резюме (agent.summaries); у старых файлов без узлов плоский summary
+    становится одним узлом уровня 0. facts и todos — снимок из memory.json
+    с применённым журналом facts.log.
+    """
+    data = _read_memory_file()
+    summary = data.get("summary", "")
+    summaries = data.get("summaries")
+    with _facts_lock:
+        index = _refresh_facts()
+        facts, todos = index.fact_list(), index.todo_list()
     return {
-        "summary": data.get("summary", ""),
-        "facts": data.get("facts", []),
-        "todos": data.get("todos", []),
+        "summary": summary,
+        "summaries": summaries if isinstance(summaries, list) else from_legacy(summary),
+        "facts": facts,
+        "todos": todos,
         "updated_at": data.get("updated_at", ""),
     }
 
 
+@traced("memory.update_memory")
 def update_memory(
     summary: str,
     facts: list[dict],
     todos: list[dict],
+    summaries: list[dict] | None = None,
 ) -> None:
-    """Обновить memory.json."""
+    """
+    Обновить memory.json (атомарно, под блокировкой памяти).
+
+    Без summaries узлы резюме сохраняются, если summary не изменился, иначе
+    заменяются одним узлом с новым текстом. facts и todos становятся новым
+    снимком: журнал facts.log после записи очищается.
+    """
     ensure_dirs()
-    data = {
-        "summary": summary,
-        "facts": facts,
-        "todos": todos,
-        "updated_at": datetime.now(timezone.utc).isoformat(),
-    }
-    with open(MEMORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with _lock():
+        if summaries is None:
+            current = load_memory()
+            summaries = current["summaries"] if current["summary"] == summary else from_legacy(summary)
+        data = {
+            "summary": summary,
+            "summaries": summaries,
+            "facts": facts,
+            "todos": todos,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        payload = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+        atomic_write(MEMORY_FILE, payload, durable=MEMORY_FSYNC)
+        # Сбой до очистки безопасен: операции журнала идемпотентны
+        if facts_log_path().exists():
+            atomic_write(facts_log_path(), b"", durable=MEMORY_FSYNC)
+
+
+# --- Факты и задачи: снимок в memory.json + журнал facts.log ---
+
+
+def facts_log_path() -> Path:
+    """Журнал изменений фактов и задач поверх снимка в memory.json."""
+    return CONVERSATION_FILE.with_name("facts.log")
+
+
+def _stamp(path: Path) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+@dataclass
+class _FactsCached:
+    """Состояние фактов процесса: снимок memory.json и разобранная часть журнала."""
+
+    path: Path
+    snapshot: tuple | None
+    log_ino: int | None
+    consumed: int
+    entries: int
+    index: FactIndex
+
+
+_facts_cached: _FactsCached | None = None
+_facts_lock = threading.RLock()
+# Факты изолированной сессии (в памяти); None — общие факты из memory.json + facts.log
+_session_facts: contextvars.ContextVar[FactIndex | None] = contextvars.ContextVar("session_facts", default=None)
+
+
+def set_session_facts(index: FactIndex | None) -> contextvars.Token:
+    """Направить факты и задачи текущего контекста в index (None — общие на диске)."""
+    return _session_facts.set(index)
+
+
+def reset_session_facts(token: contextvars.Token) -> None:
+    _session_facts.reset(token)
+
+
+def _facts_index() -> FactIndex:
+    """Факты текущего контекста: сессии или общие. Под _facts_lock."""
+    index = _session_facts.get()
+    return _refresh_facts() if index is None else index
+
+
+def _refresh_facts() -> FactIndex:
+    """
+    Актуальный FactIndex; вызывается под _facts_lock.
+
+    Если memory.json не менялся, а журнал только дописывался — применяются
+    лишь новые строки журнала, иначе состояние строится заново.
+    """
+    global _facts_cached
+    cached = _facts_cached
+    snapshot = _stamp(MEMORY_FILE)
+    log = _stamp(facts_log_path())
+    log_ino, log_size = (log[0], log[1]) if log else (None, 0)
+    if (
+        cached is None
+        or cached.path != MEMORY_FILE
+        or cached.snapshot != snapshot
+        or (cached.consumed and cached.log_ino != log_ino)
+        or log_size < cached.consumed
+    ):
+        data = _read_memory_file()
+        index = FactIndex(data.get("facts", []), data.get("todos", []))
+        cached = _facts_cached = _FactsCached(MEMORY_FILE, snapshot, log_ino, 0, 0, index)
+    if log_size > cached.consumed:
+        with open(facts_log_path(), "rb") as f:
+            cached.log_ino = os.fstat(f.fileno()).st_ino
+            f.seek(cached.consumed)
+            data = f.read(log_size - cached.consumed)
+        complete = data.rfind(b"\n") + 1
+        ops = _parse_lines(data[:complete])
+        for op in ops:
+            cached.index.apply(op)
+        cached.consumed += complete
+        cached.entries += len(ops)
+    return cached.index
+
+
+def _log_fact_op(op: dict) -> None:
+    """Дописать операцию в журнал (под блокировкой памяти); при длинном журнале — снимок."""
+    index = _session_facts.get()
+    if index is not None:
+        with _facts_lock:
+            index.apply({**op, "ts": datetime.now(timezone.utc).isoformat()})
+        return
+    ensure_dirs()
+    op = {**op, "ts": datetime.now(timezone.utc).isoformat()}
+    line = (json.dumps(op, ensure_ascii=False) + "\n").encode("utf-8")
+    with _lock():
+        with open(facts_log_path(), "ab+") as f:
+            offset = f.seek(0, os.SEEK_END)
+            if offset:
+                f.seek(offset - 1)
+                if f.read(1) != b"\n":
+                    line = b"\n" + line  # оборванная строка после сбоя будет пропущена
+            f.write(line)
+            f.flush()
+            if MEMORY_FSYNC:
+                os.fsync(f.fileno())
+        with _facts_lock:
+            _refresh_facts()
+            due = _facts_cached.entries >= MEMORY_FACTS_SNAPSHOT_EVERY
+        if due:
+            mem = load_memory()
+            update_memory(mem["summary"], mem["facts"], mem["todos"], summaries=mem["summaries"])
+
+
+@traced("memory.set_fact")
+def set_fact(key: str, value: str) -> None:
+    """Добавить или заменить факт по ключу."""
+    _log_fact_op({"op": "set_fact", "key": key, "value": value})
+
+
+@traced("memory.delete_fact")
+def delete_fact(key: str) -> bool:
+    """Удалить факт. Returns: False, если такого ключа нет."""
+    with _lock():
+        with _facts_lock:
+            if key not in _facts_index().facts:
+                return False
+        _log_fact_op({"op": "del_fact", "key": key})
+    return True
 
 
+@traced("memory.add_todo")
+def add_todo(text: str) -> str:
+    """Добавить открытую задачу. Returns: id задачи."""
+    with _lock():
+        with _facts_lock:
+            todo_id = _facts_index().next_todo_id()
+        _log_fact_op({"op": "set_todo", "id": todo_id, "text": text, "status": "open"})
+    return todo_id
+
+
+@traced("memory.set_todo_status")
+def set_todo_status(todo_id: str, status: str) -> bool:
+    """Сменить статус задачи (open/done). Returns: False, если задачи нет."""
+    if status not in TODO_STATUSES:
+        raise ValueError(f"статус задачи: {', '.join(TODO_STATUSES)}")
+    with _lock():
+        with _facts_lock:
+            todo = _facts_index().todos.get(todo_id)
+        if todo is None:
+            return False
+        _log_fact_op({"op": "set_todo", "id": todo_id, "text": todo.get("text", ""), "status": status})
+    return True
+
+
+def get_facts() -> tuple[list[dict], list[dict]]:
+    """Все факты и задачи (снимок + журнал)."""
+    with _facts_lock:
+        index = _facts_index()
+        return index.fact_list(), index.todo_list()
+
+
+@traced("memory.relevant_facts")
+def relevant_facts(query: str, limit: int | None = None) -> tuple[list[dict], list[dict]]:
+    """Факты и открытые задачи, относящиеся к запросу (по общим термам)."""
+    with _facts_lock:
+        return _facts_index().relevant(query, MEMORY_FACTS_INJECT if limit is None else limit)
+
+
+def conversation_stats() -> dict:
+    """
+    Число строк и размер conversation.jsonl за O(1).
+
+    Счётчики — индекс (строк = размер индекса / 8) и os.stat файла; если
+    последнее смещение индекса не совпадает с размером файла (файл меняли
+    в обход append_message), индекс перестраивается.
+    """
+    try:
+        size = os.stat(CONVERSATION_FILE).st_size
+    except OSError:
+        return {"messages": 0, "bytes": 0}
+    if not _index_valid(CONVERSATION_FILE, size):
+        _rebuild_index(CONVERSATION_FILE)
+    return {"messages": os.path.getsize(_index_path(CONVERSATION_FILE)) // _ENTRY.size, "bytes": size}
+
+
+@traced("memory.should_compact")
 def _should_compact() -> bool:
-    """Проверить, нужна ли компакция."""
-    if not CONVERSATION_FILE.exists():
-        return False
-    lines = 0
-    size = 0
-    with open(CONVERSATION_FILE, "rb") as f:
-        for line in f:
-            lines += 1
-            size += len(line)
-            if lines >= MEMORY_MAX_MESSAGES or size >= MEMORY_MAX_SIZE_KB * 1024:
-                return True
-    return False
+    """Проверить, нужна ли компакция (без чтения conversation.jsonl)."""
+    stats = conversation_stats()
+    return stats["messages"] >= MEMORY_MAX_MESSAGES or stats["bytes"] >= MEMORY_MAX_SIZE_KB * 1024
 
 
+@traced("memory.generate_summary")
 def _generate_summary(messages: list[dict]) -> str:
     """Сгенерировать краткое резюме диалога через LLM."""
     if not messages:
@@ -121,31 +635,130 @@ def _generate_summary(messages: list[dict]) -> str:
         return "Диалог сжат (резюме не сгенерировано)."
 
 
-def compact_if_needed() -> None:
+@traced("memory.merge_summaries")
+def _merge_summaries(texts: list[str], level: int) -> str | None:
+    """Слить резюме соседних частей диалога в одно; None — оставить как есть до следующей компакции."""
+    parts = "\n\n".join(f"Часть {i}:\n{text}" for i, text in enumerate(texts, 1))
+    prompt = f"""Объедини резюме последовательных частей диалога в одно (3-5 предложений на русском). Сохрани ключевые факты, решения и открытые вопросы; детали, потерявшие значение, опусти.
+
+{parts}
+
+Общее резюме:"""
+    try:
+        resp = get_llm().invoke(prompt)
+    except Exception:
+        return None
+    return (resp.content or "").strip() or None
+
+
+@traced("memory.compact_if_needed")
+def compact_if_needed() -> bool:
     """
     Если conversation.jsonl превышает лимиты — сгенерировать summary,
     очистить старые сообщения, оставить только summary + последние K реплик.
+
+    Резюме вытесненного куска добавляется в иерархию (agent.summaries):
+    переполненные уровни сливаются, так что summary в промпте ограничен.
+    Сами сообщения дописываются в архив (agent.archive) для аудита и
+    поиска (agent.recall).
+
+    Snapshot-and-swap: резюме генерируется по снимку файла без блокировок,
+    а сообщения, дописанные за это время, переносятся в новый файл при
+    замене. Если компакция уже идёт (в фоне или в другом процессе), вызов
+    ничего не делает.
+
+    Returns:
+        True, если компакция была выполнена (файлы памяти переписаны).
     """
-    if not _should_compact():
-        return
-    messages = load_conversation()
-    if len(messages) <= MEMORY_KEEP_RECENT:
-        return
+    compaction = _compaction_lock()
+    if not compaction.acquire(blocking=False):
+        return False
+    try:
+        if not _should_compact():
+            return False
+        with _lock(), open(CONVERSATION_FILE, "rb") as f:
+            ino = os.fstat(f.fileno()).st_ino
+            data = f.read()
+        snapshot = data[:data.rfind(b"\n") + 1]
+        messages = _parse_lines(snapshot)
+        if len(messages) <= MEMORY_KEEP_RECENT:
+            return False
 
-    to_summarize = messages[:-MEMORY_KEEP_RECENT]
-    summary = _generate_summary(to_summarize)
-    keep = messages[-MEMORY_KEEP_RECENT:]
+        evicted = messages[:-MEMORY_KEEP_RECENT]
+        keep = messages[-MEMORY_KEEP_RECENT:]
+        # Узлы резюме меняет только компакция, а она одна (compaction.lock) —
+        # слияние уровней тоже идёт вне блокировки памяти
+        summaries = add_summary(
+            load_memory()["summaries"],
+            chunk_summary(_generate_summary(evicted), evicted),
+            _merge_summaries,
+            level_tokens=MEMORY_SUMMARY_LEVEL_TOKENS,
+            max_levels=MEMORY_SUMMARY_MAX_LEVELS,
+        )
 
-    mem = load_memory()
-    old_summary = mem.get("summary", "")
-    combined = f"{old_summary}\n{summary}".strip() if old_summary else summary
+        with _lock():
+            with open(CONVERSATION_FILE, "rb") as f:
+                st = os.fstat(f.fileno())
+                if st.st_ino != ino or st.st_size < len(snapshot):
+                    return False  # файл переписали в обход компакции — снимок устарел
+                f.seek(len(snapshot))
+                appended = f.read()
+
+            mem = load_memory()
+            # Сначала архив и summary: при сбое между шагами сообщения останутся
+            # и в истории, но не потеряются
+            _archive(evicted)
+            update_memory(
+                summary=render(summaries),
+                facts=mem.get("facts", []),
+                todos=mem.get("todos", []),
+                summaries=summaries,
+            )
+            _write_lines(CONVERSATION_FILE, keep, appended)
+        return True
+    finally:
+        compaction.release()
+
+
+def _compact_in_thread() -> None:
+    try:
+        compact_if_needed()
+    except Exception as e:
+        print(f"[memory] ошибка фоновой компакции: {e}", file=sys.stderr)
 
-    update_memory(
-        summary=combined,
-        facts=mem.get("facts", []),
-        todos=mem.get("todos", []),
-    )
 
-    with open(CONVERSATION_FILE, "w", encoding="utf-8") as f:
-        for m in keep:
-            f.write(json.dumps(m, ensure_ascii=False) + "\n")
+def compact_in_background() -> bool:
+    """
+    Запустить компакцию в фоновом потоке, если лимиты превышены и она ещё не идёт.
+
+    Ответ пользователю не ждёт резюме: следующий ход подхватит новый summary,
+    когда файлы будут подменены. Returns: True, если поток запущен.
+    """
+    global _background
+    with _background_lock:
+        if _background is not None and _background.is_alive():
+            return False
+        if not _should_compact():
+            return False
+        _background = threading.Thread(target=_compact_in_thread, name="memory-compaction", daemon=True)
+        _background.start()
+        return True
+
+
+def compaction_running() -> bool:
+    """Идёт ли фоновая компакция."""
+    thread = _background
+    return thread is not None and thread.is_alive()
+
+
+def flush_compaction(timeout: float | None = None) -> bool:
+    """
+    Дождаться фоновой компакции (например, перед выходом процесса).
+
+    Returns:
+        True, если компакция не идёт или завершилась за timeout.
+    """
+    thread = _background
+    if thread is not None:
+        thread.join(timeout)
+    return not compaction_running()
@@ -0,0 +1,354 @@
+"""
+Поиск по архиву диалога: сообщения, вытесненные компакцией (agent.archive).
+
+Резюме хранит лишь суть старых ходов; детали остаются в архиве, и под
+текущий запрос из него подтягиваются несколько самых релевантных реплик.
+
+Индекс — инвертированный BM25 в памяти процесса. Он строится инкрементально:
+как и кэш load_conversation, запоминает, сколько байт каждого сегмента
+архива уже разобрано, и при следующем поиске индексирует только дописанные
+строки; запечатанный сегмент распаковывается один раз. Документы хранятся
+как (сегмент, смещение строки): номер сегмента не меняется при сжатии, так
+что найденные реплики читаются seek'ом из активного сегмента или из
+распакованного запечатанного (последние держатся в небольшом кэше).
+
+Чтобы не токенизировать весь архив при каждом запуске процесса, индекс
+сохраняется рядом с сегментами (recall.idx): заголовок JSON — id архива,
+разобранные байты сегментов, словарь термов — и затем сырые массивы.
+Файл переписывается, когда в индекс целиком попал новый запечатанный
+сегмент, так что при старте разбирается лишь хвост активного сегмента.
+
+С AGENT_MEMORY_RECALL_VECTORS=1 и установленным numpy к BM25 добавляются
+локальные эмбеддинги (hashing trick, без сети и моделей) с косинусным
+поиском; результаты двух ранжирований объединяются (reciprocal rank fusion).
+"""
+
+import bisect
+import heapq
+import json
+import math
+import threading
+import zlib
+from array import array
+from collections import Counter, OrderedDict
+from operator import itemgetter
+from pathlib import Path
+
+from agent import archive, memory
+from agent.config import MEMORY_RECALL_K, MEMORY_RECALL_VECTORS
+from agent.storage import atomic_write
+from agent.terms import tokenize
+from agent.tracing import traced
+
+# Параметры BM25
+_K1 = 1.2
+_B = 0.75
+# Кандидатов из каждого ранжирования на k результатов (для слияния)
+_CANDIDATES_PER_RESULT = 10
+_RRF_K = 60
+# Частый терм досчитывается бинарным поиском, если его список длиннее числа кандидатов
+# в столько раз; набор кандидатов просматривает не больше _SCAN_LIMIT последних документов
+_LOOKUP_RATIO = 16
+_SCAN_LIMIT = 4096
+_VECTOR_DIM = 256
+# Сколько распакованных запечатанных сегментов держать для чтения найденных реплик
+_SEALED_CACHE = 4
+# Сохранённый индекс в каталоге архива
+INDEX_FILE = "recall.idx"
+_INDEX_VERSION = 1
+
+
+def _numpy():
+    """numpy или None — векторный поиск опционален."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class _Vectors:
+    """Hashing-trick эмбеддинги термов и биграмм, нормированные; косинус = скалярное произведение."""
+
+    def __init__(self, np):
+        self.np = np
+        self.matrix = np.zeros((1024, _VECTOR_DIM), dtype=np.float32)
+        self.count = 0
+
+    def embed(self, terms: list[str]):
+        vec = self.np.zeros(_VECTOR_DIM, dtype=self.np.float32)
+        features = terms + [f"{a} {b}" for a, b in zip(terms, terms[1:])]
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vec[h % _VECTOR_DIM] += 1.0 if h & 0x80000000 else -1.0
+        norm = float(self.np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+    def add(self, terms: list[str]) -> None:
+        if self.count == len(self.matrix):
+            grown = self.np.zeros((len(self.matrix) * 2, _VECTOR_DIM), dtype=self.np.float32)
+            grown[: self.count] = self.matrix
+            self.matrix = grown
+        self.matrix[self.count] = self.embed(terms)
+        self.count += 1
+
+    def search(self, terms: list[str], limit: int) -> list[int]:
+        query = self.embed(terms)
+        if not self.count or not query.any():
+            return []
+        sims = self.matrix[: self.count] @ query
+        limit = min(limit, self.count)
+        top = self.np.argpartition(-sims, limit - 1)[:limit]
+        return [int(i) for i in sorted(top, key=lambda i: -sims[i]) if sims[i] > 0]
+
+
+class _Index:
+    """Инвертированный индекс BM25 по сегментам одного архива."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.lock = threading.Lock()
+        self._reset("")
+
+    def _reset(self, archive_id: str) -> None:
+        self.archive_id = archive_id
+        self.consumed: dict[int, int] = {}  # сегмент -> разобрано байт
+        self.segs = array("I")  # сегмент документа
+        self.offsets = array("Q")  # начало строки документа в сегменте
+        self.lengths = array("I")  # число термов документа
+        self.total_length = 0
+        self.postings: dict[str, tuple[array, array]] = {}  # терм -> (документы, частоты)
+        self._sealed: OrderedDict[int, bytes] = OrderedDict()  # распакованные сегменты
+        self._persisted: set[int] = set()  # запечатанные сегменты, уже попавшие в INDEX_FILE
+        np = _numpy() if MEMORY_RECALL_VECTORS else None
+        self.vectors = _Vectors(np) if np is not None else None
+
+    def refresh(self) -> None:
+        """Доиндексировать строки, дописанные в архив с прошлого вызова."""
+        archive_id = archive.load_manifest(self.root)["id"]
+        if archive_id != self.archive_id:
+            self._reset(archive_id)  # архив пересоздан — индексируем заново
+            self._load()
+        segments = archive.segments(self.root)
+        for segment in segments:
+            seq = segment["seq"]
+            done = self.consumed.get(seq, 0)
+            size = segment["raw_bytes"]
+            if size < done:
+                self._reset(archive_id)  # сегмент переписан в обход архива
+                return self.refresh()
+            if size == done:
+                continue
+            if segment["codec"] is not None:
+                data = self._segment(segment)[done:]
+            else:
+                try:
+                    with open(self.root / segment["file"], "rb") as f:
+                        f.seek(done)
+                        data = f.read(size - done)
+                except FileNotFoundError:
+                    continue  # запечатан после чтения манифеста — подхватим в следующий раз
+            data = data[: data.rfind(b"\n") + 1]  # недописанная строка подождёт
+            pos = done
+            for line in data.splitlines(keepends=True):
+                self._add(seq, pos, line)
+                pos += len(line)
+            self.consumed[seq] = pos
+        sealed = {
+            s["seq"] for s in segments
+            if s["codec"] is not None and self.consumed.get(s["seq"]) == s["raw_bytes"]
+        }
+        if not sealed <= self._persisted:
+            self._save(sealed)
+
+    def _load(self) -> None:
+        """Поднять индекс из INDEX_FILE, если он построен по этому же архиву."""
+        if self.vectors is not None:
+            return  # эмбеддинги не сохраняются — их строит только полная индексация
+        try:
+            with open(self.root / INDEX_FILE, "rb") as f:
+                header = json.loads(f.readline())
+                blob = f.read()
+        except (OSError, ValueError):
+            return
+        if header.get("version") != _INDEX_VERSION or header.get("id") != self.archive_id:
+            return
+        try:
+            view = memoryview(blob)
+            arrays = []
+            for typecode, count in zip("IQIII", header["counts"]):
+                part = array(typecode)
+                size = count * part.itemsize
+                part.frombytes(view[:size])
+                view = view[size:]
+                arrays.append(part)
+            if len(view):
+                raise ValueError("лишние байты")
+            segs, offsets, lengths, docs, tfs = arrays
+            postings, start = {}, 0
+            for term, df in header["terms"]:
+                postings[term] = (docs[start: start + df], tfs[start: start + df])
+                start += df
+            if start != len(docs) or not len(segs) == len(offsets) == len(lengths):
+                raise ValueError("несогласованные длины")
+        except (KeyError, TypeError, ValueError):
+            return  # файл повреждён — индексируем заново
+        self.consumed = {int(seq): done for seq, done in header["consumed"].items()}
+        self.segs, self.offsets, self.lengths = segs, offsets, lengths
+        self.total_length = header["total_length"]
+        self.postings = postings
+        self._persisted = set(header["sealed"])
+
+    def _save(self, sealed: set[int]) -> None:
+        """Переписать INDEX_FILE текущим состоянием индекса."""
+        terms = [[term, len(docs)] for term, (docs, _) in self.postings.items()]
+        docs, tfs = array("I"), array("I")
+        for posting_docs, posting_tfs in self.postings.values():
+            docs.extend(posting_docs)
+            tfs.extend(posting_tfs)
+        arrays = (self.segs, self.offsets, self.lengths, docs, tfs)
+        header = {
+            "version": _INDEX_VERSION,
+            "id": self.archive_id,
+            "consumed": self.consumed,
+            "sealed": sorted(sealed),
+            "total_length": self.total_length,
+            "counts": [len(a) for a in arrays],
+            "terms": terms,
+        }
+        payload = json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n"
+        atomic_write(self.root / INDEX_FILE, payload + b"".join(a.tobytes() for a in arrays), fsync=False)
+        self._persisted = sealed
+
+    def _segment(self, segment: dict) -> bytes:
+        """Распакованный запечатанный сегмент (кэш на _SEALED_CACHE сегментов)."""
+        seq = segment["seq"]
+        data = self._sealed.get(seq)
+        if data is None:
+            data = self._sealed[seq] = archive.read_segment(self.root, segment)
+            while len(self._sealed) > _SEALED_CACHE:
+                self._sealed.popitem(last=False)
+        self._sealed.move_to_end(seq)
+        return data
+
+    def _add(self, seq: int, offset: int, line: bytes) -> None:
+        try:
+            message = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return
+        if not isinstance(message, dict):
+            return
+        terms = tokenize(message.get("content", "") or "")
+        doc = len(self.offsets)
+        self.segs.append(seq)
+        self.offsets.append(offset)
+        self.lengths.append(len(terms))
+        self.total_length += len(terms)
+        for term, tf in Counter(terms).items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = (array("I"), array("I"))
+            posting[0].append(doc)
+            posting[1].append(tf)
+        if self.vectors is not None:
+            self.vectors.add(terms)
+
+    def bm25(self, terms: list[str], limit: int) -> list[int]:
+        """
+        Top-limit документов по BM25, term-at-a-time от редких термов к частым.
+
+        Кандидаты набираются по редким термам, пока их не станет limit;
+        следующие (частые, с малым idf) термы новых документов не добавляют,
+        а досчитывают оценки кандидатов — бинарным поиском по списку, если
+        он намного длиннее числа кандидатов. Терм, с которого начинается
+        набор, просматривается по последним _SCAN_LIMIT документам (свежие
+        реплики важнее), так что поиск не зависит от длины архива.
+        """
+        n = len(self.offsets)
+        if not n:
+            return []
+        avg = self.total_length / n or 1.0
+        lengths = self.lengths
+        base, slope = _K1 * (1 - _B), _K1 * _B / avg
+        postings = [self.postings[t] for t in set(terms) if t in self.postings]
+        scores: dict[int, float] = {}
+        for docs, tfs in sorted(postings, key=lambda p: len(p[0])):
+            df = len(docs)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            if len(scores) < limit:
+                start = max(df - _SCAN_LIMIT, 0)
+                for doc, tf in zip(docs[start:], tfs[start:]):
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf * (_K1 + 1) / (tf + base + slope * lengths[doc])
+            elif len(scores) * _LOOKUP_RATIO < df:
+                for doc in scores:
+                    i = bisect.bisect_left(docs, doc)
+                    if i < df and docs[i] == doc:
+                        tf = tfs[i]
+                        scores[doc] += idf * tf * (_K1 + 1) / (tf + base + slope * lengths[doc])
+            else:
+                for doc, tf in zip(docs, tfs):
+                    if doc in scores:
+                        scores[doc] += idf * tf * (_K1 + 1) / (tf + base + slope * lengths[doc])
+        return [doc for doc, _ in heapq.nlargest(limit, scores.items(), key=itemgetter(1))]
+
+    def search(self, query: str, k: int) -> list[tuple[int, float]]:
+        """Номера документов и оценки, лучшие первыми."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        limit = k * _CANDIDATES_PER_RESULT
+        rankings = [self.bm25(terms, limit)]
+        if self.vectors is not None:
+            rankings.append(self.vectors.search(terms, limit))
+        fused: dict[int, float] = {}
+        for ranking in rankings:
+            for rank, doc in enumerate(ranking):
+                fused[doc] = fused.get(doc, 0.0) + 1.0 / (_RRF_K + rank + 1)
+        return heapq.nlargest(k, fused.items(), key=itemgetter(1))
+
+    def read(self, doc: int) -> dict:
+        seq, offset = self.segs[doc], self.offsets[doc]
+        try:
+            with open(self.root / archive.segment_name(seq), "rb") as f:
+                f.seek(offset)
+                return json.loads(f.readline())
+        except FileNotFoundError:
+            pass
+        segment = next(s for s in archive.segments(self.root) if s["seq"] == seq)
+        data = self._segment(segment)
+        end = data.find(b"\n", offset)
+        return json.loads(data[offset: end if end >= 0 else len(data)])
+
+
+_indexes: dict[Path, _Index] = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_for(path: Path) -> _Index:
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = _Index(path)
+        return index
+
+
+@traced("recall.search")
+def search(query: str, k: int = MEMORY_RECALL_K) -> list[dict]:
+    """
+    Найти в архиве до k реплик, релевантных запросу.
+
+    Returns:
+        Сообщения архива (role, content, ts, ...) с полем score, лучшие первыми.
+    """
+    if k <= 0 or not query.strip():
+        return []
+    index = _index_for(memory.archive_dir())
+    with index.lock:
+        index.refresh()
+        found = index.search(query, k)
+        results = []
+        for doc, score in found:
+            message = index.read(doc)
+            message["score"] = round(score, 6)
+            results.append(message)
+    return results
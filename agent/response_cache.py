@@ -0,0 +1,205 @@
+"""
+Кэш ответов агента на диске: повторные запросы без LLM и инструментов.
+
+Ключ — нормализованный запрос + отпечаток памяти (summary, facts, todos)
+и последнего обмена репликами перед запросом: уточнение вроде «а в евро?»
+после разных реплик — разные записи, а более ранняя история ключ не
+меняет. Повтор того же вопроса подряд смотрит на обмен перед первым
+вопросом, так что повтор в REPL и повторный --task попадают в кэш.
+Время жизни записи — минимальный TTL среди инструментов, использованных
+при ответе (курс крипты устаревает за секунды, поиск — за часы). Ответы,
+в которых участвовали write_file, execute_terminal или запись фактов и задач,
+не кэшируются. Файл перезаписывается атомарно под межпроцессной блокировкой
+(несколько агентов с --cache или batch и демон делят один файл); перед
+записью под той же блокировкой подмешиваются записи, сохранённые другими
+процессами, чтобы они не терялись.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from agent.config import (
+    RESPONSE_CACHE_DEFAULT_TTL,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TOOL_TTLS,
+)
+from agent.storage import atomic_write, lock_for
+
+# Инструменты с побочными эффектами — ответ с ними никогда не кэшируется
+UNCACHEABLE_TOOLS = frozenset({
+    "write_file", "execute_terminal", "remember_fact", "forget_fact", "add_todo", "update_todo",
+})
+
+
+def normalize_query(query: str) -> str:
+    """Нормализовать запрос: регистр, ё/е, пробелы, пунктуация по краям."""
+    text = query.lower().replace("ё", "е")
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.strip(" ?!.,;:")
+
+
+def memory_fingerprint(mem: dict) -> str:
+    """Отпечаток памяти, от которой зависит ответ."""
+    payload = json.dumps(
+        [mem.get("summary", ""), mem.get("facts", []), mem.get("todos", [])],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def last_exchange(history: list[dict], query: str) -> list[dict]:
+    """
+    Последний обмен репликами (запрос пользователя и ответ) перед query.
+
+    Обмены с тем же вопросом пропускаются: повтор подряд видит тот же
+    контекст, что и первый вопрос.
+    """
+    target = normalize_query(query)
+    end = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        if history[i].get("role") != "user":
+            continue
+        if normalize_query(history[i].get("content", "")) != target:
+            return history[i:end]
+        end = i
+    return []
+
+
+def history_fingerprint(history: list[dict]) -> str:
+    """Отпечаток истории диалога (роли и тексты реплик)."""
+    digest = hashlib.sha256()
+    for message in history:
+        digest.update(f"{message.get('role', '')}\0{message.get('content', '')}\0".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ResponseCache:
+    """LRU-кэш ответов с TTL по инструментам, хранится в JSON-файле."""
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        max_entries: int | None = None,
+        tool_ttls: dict[str, int] | None = None,
+        default_ttl: int | None = None,
+    ):
+        self.path = Path(path)
+        self.max_entries = max_entries or RESPONSE_CACHE_MAX_ENTRIES
+        self.tool_ttls = dict(RESPONSE_CACHE_TOOL_TTLS if tool_ttls is None else tool_ttls)
+        self.default_ttl = RESPONSE_CACHE_DEFAULT_TTL if default_ttl is None else default_ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "bypassed": 0, "evictions": 0}
+        self._load()
+
+    def _read(self) -> OrderedDict[str, dict]:
+        """Непросроченные записи из файла (пусто, если файла нет или он повреждён)."""
+        entries: OrderedDict[str, dict] = OrderedDict()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return entries
+        now = time.time()
+        # В файле записи лежат от давно использованных к недавним
+        for key, entry in data.get("entries", []):
+            if entry.get("expires_at", 0) > now:
+                entries[key] = entry
+        return entries
+
+    def _load(self) -> None:
+        self._entries = self._read()
+
+    def _save(self, merge: bool = True) -> None:
+        """
+        Записать кэш в файл. Под self._lock.
+
+        merge=True — сначала подмешать записи, которые другие процессы
+        сохранили с прошлого чтения (свои записи считаются более свежими).
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with lock_for(self.path.with_name(self.path.name + ".lock")):
+            if merge:
+                merged = self._read()
+                for key in self._entries:
+                    merged.pop(key, None)
+                merged.update(self._entries)
+                while len(merged) > self.max_entries:
+                    merged.popitem(last=False)
+                self._entries = merged
+            data = json.dumps({"entries": list(self._entries.items())}, ensure_ascii=False).encode("utf-8")
+            atomic_write(self.path, data, fsync=False)
+
+    @staticmethod
+    def key(query: str, mem: dict, history: list[dict] = ()) -> str:
+        """Ключ кэша для запроса в контексте памяти и последнего обмена репликами."""
+        context = history_fingerprint(last_exchange(list(history), query))
+        raw = f"{memory_fingerprint(mem)}\n{context}\n{normalize_query(query)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, tools_used: set[str]) -> int:
+        """TTL ответа: минимальный среди использованных инструментов."""
+        ttls = [self.tool_ttls.get(name, self.default_ttl) for name in tools_used]
+        return min(ttls, default=self.default_ttl)
+
+    def get(self, key: str) -> str | None:
+        """Ответ из кэша или None (промах/истёк)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if entry["expires_at"] <= time.time():
+                del self._entries[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry["answer"]
+
+    def put(self, key: str, answer: str, tools_used: set[str]) -> bool:
+        """Сохранить ответ; False, если ответ кэшировать нельзя."""
+        if tools_used & UNCACHEABLE_TOOLS:
+            with self._lock:
+                self._stats["bypassed"] += 1
+            return False
+        ttl = self.ttl_for(tools_used)
+        if ttl <= 0:
+            return False
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "tools": sorted(tools_used),
+                "expires_at": time.time() + ttl,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+            self._stats["stores"] += 1
+            self._save()
+        return True
+
+    def clear(self) -> None:
+        """Удалить все записи."""
+        with self._lock:
+            self._entries.clear()
+            self._save(merge=False)
+
+    def stats(self) -> dict:
+        """Счётчики попаданий/промахов и текущий размер."""
+        with self._lock:
+            total = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "hit_rate": round(self._stats["hits"] / total, 4) if total else 0.0,
+            }
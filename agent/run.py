@@ -1,12 +1,51 @@
 """
-CLI: REPL по умолчанию, режим одной команды --task, флаги --verbose и --dry-run.
+CLI: REPL по умолчанию, режим одной команды --task, пакетный режим --batch,
+резидентный демон --serve и его клиент --connect,
+флаги --verbose, --dry-run, --stream и --profile.
 """
 
+from __future__ import annotations
+
 import argparse
 import sys
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from agent.agent import AgentSession
+    from agent.tracing import Tracer
+
+# Модули агента (а через них LangChain и OpenAI) импортируются после разбора
+# аргументов: --help и ошибки в аргументах не ждут загрузки зависимостей.
+
 
-from agent.agent import process_query
-from agent.config import ensure_dirs
+def _answer(session: AgentSession, query: str, stream: bool) -> None:
+    """Выполнить запрос и напечатать ответ (целиком или потоком токенов)."""
+    if not stream:
+        print(session.ask(query))
+    else:
+        for token in session.stream(query):
+            print(token, end="", flush=True)
+        print()
+        stats = session.last_stats
+        print(
+            f"[stream] первый токен: {stats['ttft_s']:.2f}s, всего: {stats['total_s']:.2f}s",
+            file=sys.stderr,
+        )
+    if session.tracer is not None:
+        roots = session.tracer.roots()
+        if roots:
+            print(f"[profile]\n{session.tracer.report(roots[-1])}", file=sys.stderr)
+
+
+def _export_trace(tracer: Tracer, path: str, fmt: str) -> None:
+    """Сохранить собранные span'ы в JSONL или Chrome trace."""
+    if fmt == "chrome":
+        tracer.export_chrome(Path(path))
+    else:
+        tracer.export_jsonl(Path(path))
+    print(f"[profile] trace: {path} ({fmt}, span'ов: {len(tracer.spans)})", file=sys.stderr)
 
 
 def main() -> int:
@@ -29,14 +68,192 @@ def main() -> int:
         action="store_true",
         help="Показывать план, запрашивать подтверждение перед terminal/file write",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Печатать ответ по мере генерации (с временем до первого токена)",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Кэшировать ответы на повторные запросы (также AGENT_RESPONSE_CACHE=1)",
+    )
+    profile = parser.add_argument_group("профилирование")
+    profile.add_argument(
+        "--profile",
+        action="store_true",
+        help="Печатать разбивку времени каждого хода (память, LLM, инструменты, компакция)",
+    )
+    profile.add_argument(
+        "--trace-out",
+        type=str,
+        metavar="FILE",
+        help="Сохранить span'ы в файл при выходе (включает --profile)",
+    )
+    profile.add_argument(
+        "--trace-format",
+        choices=("jsonl", "chrome"),
+        default="jsonl",
+        help="Формат --trace-out: JSONL или Chrome trace (chrome://tracing, Perfetto)",
+    )
+    batch = parser.add_argument_group("пакетный режим")
+    batch.add_argument(
+        "--batch",
+        type=str,
+        metavar="FILE",
+        help='Выполнить задачи из JSONL ({"id": ..., "task": "..."} на строку)',
+    )
+    batch.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Число параллельных воркеров (по умолчанию 4)",
+    )
+    batch.add_argument(
+        "--output",
+        type=str,
+        metavar="FILE",
+        help="Файл результатов JSONL (по умолчанию <batch>.results.jsonl)",
+    )
+    batch.add_argument(
+        "--order",
+        choices=("input", "completion"),
+        default="input",
+        help="Порядок результатов: как во входном файле или по завершении",
+    )
+    batch.add_argument(
+        "--checkpoint",
+        type=str,
+        metavar="FILE",
+        help="Файл id выполненных задач для продолжения после сбоя (по умолчанию <output>.done)",
+    )
+    batch.add_argument(
+        "--shared-memory",
+        action="store_true",
+        help="Общая память диалога для всех задач (по умолчанию каждая задача изолирована)",
+    )
+    daemon = parser.add_argument_group("резидентный режим")
+    daemon.add_argument(
+        "--serve",
+        action="store_true",
+        help="Запустить демон: прогретая сессия отвечает клиентам --connect через Unix-сокет",
+    )
+    daemon.add_argument(
+        "--connect",
+        action="store_true",
+        help="Выполнить --task (или REPL) через запущенный демон",
+    )
+    daemon.add_argument(
+        "--stop",
+        action="store_true",
+        help="Остановить запущенный демон",
+    )
+    daemon.add_argument(
+        "--socket",
+        type=str,
+        metavar="PATH",
+        help="Путь Unix-сокета демона (по умолчанию AGENT_SOCKET или memory/agent.sock)",
+    )
+    daemon.add_argument(
+        "--session",
+        type=str,
+        metavar="NAME",
+        help="Именованная сессия в памяти демона (по умолчанию — основная память на диске)",
+    )
+    daemon.add_argument(
+        "--idle-timeout",
+        type=float,
+        metavar="SECONDS",
+        help="Завершить демон после простоя без клиентов (по умолчанию AGENT_SERVER_IDLE_TIMEOUT, 0 — никогда)",
+    )
     args = parser.parse_args()
+    if args.serve and (args.connect or args.stop or args.task or args.batch):
+        parser.error("--serve нельзя совмещать с --connect, --stop, --task и --batch")
+
+    if args.connect or args.stop:
+        from agent.client import main_client
+
+        return main_client(args)
+
+    from agent.agent import AgentSession
+    from agent.config import RESPONSE_CACHE_FILE, ensure_dirs
+    from agent.response_cache import ResponseCache
+    from agent.tracing import Tracer
 
     ensure_dirs()
 
+    tracer = Tracer() if (args.profile or args.trace_out) else None
+    try:
+        session = AgentSession(
+            verbose=args.verbose,
+            dry_run=args.dry_run,
+            response_cache=ResponseCache(RESPONSE_CACHE_FILE) if args.cache else None,
+            tracer=tracer,
+        )
+        if args.batch or args.task or args.serve:
+            session.warm()
+    except Exception as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+
+    try:
+        return _run(args, session)
+    finally:
+        _flush_memory()
+        if tracer is not None and args.trace_out:
+            _export_trace(tracer, args.trace_out, args.trace_format)
+
+
+def _flush_memory() -> None:
+    """Перед выходом дождаться фоновой компакции, чтобы резюме не потерялось."""
+    from agent.memory import compaction_running, flush_compaction
+
+    if compaction_running():
+        print("[memory] завершаю фоновую компакцию...", file=sys.stderr)
+    try:
+        flush_compaction()
+    except KeyboardInterrupt:
+        pass
+
+
+def _warm_quietly(session: AgentSession) -> None:
+    try:
+        session.warm()
+    except Exception:
+        pass
+
+
+def _run(args: argparse.Namespace, session: AgentSession) -> int:
+    """Выполнить выбранный режим: --serve, --batch, --task или REPL."""
+    if args.serve:
+        from agent.config import SERVER_IDLE_TIMEOUT, SERVER_SOCKET
+        from agent.server import main_serve
+
+        idle = SERVER_IDLE_TIMEOUT if args.idle_timeout is None else args.idle_timeout
+        return main_serve(session, Path(args.socket) if args.socket else SERVER_SOCKET, idle_timeout=idle)
+
+    if args.batch:
+        from agent.batch import main_batch
+
+        try:
+            return main_batch(
+                session,
+                args.batch,
+                output=args.output,
+                workers=args.workers,
+                order=args.order,
+                checkpoint=args.checkpoint,
+                shared=args.shared_memory,
+            )
+        except KeyboardInterrupt:
+            return 130
+        except (OSError, ValueError) as e:
+            print(f"Ошибка: {e}", file=sys.stderr)
+            return 1
+
     if args.task:
         try:
-            answer = process_query(args.task, verbose=args.verbose, dry_run=args.dry_run)
-            print(answer)
+            _answer(session, args.task, args.stream)
         except KeyboardInterrupt:
             return 130
         except Exception as e:
@@ -44,7 +261,9 @@ def main() -> int:
             return 1
         return 0
 
-    # REPL режим
+    # REPL режим: LLM и граф собираются в фоне, пока вводится первый запрос.
+    # Ошибка сборки (например, нет ключа) всплывёт при первом запросе.
+    threading.Thread(target=_warm_quietly, args=(session,), daemon=True).start()
     print("CLI AI Agent. Введите запрос (пусто + Enter для выхода).")
     while True:
         try:
@@ -54,10 +273,9 @@ def main() -> int:
             return 0
         if not line:
             print("Выход.")
-            break
+            return 0
         try:
-            answer = process_query(line, verbose=args.verbose, dry_run=args.dry_run)
-            print(answer)
+            _answer(session, line, args.stream)
         except KeyboardInterrupt:
             print("\nПрервано.")
         except Exception as e:
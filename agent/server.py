@@ -0,0 +1,261 @@
+"""
+Резидентный режим: демон (--serve) держит прогретую сессию агента и
+отвечает клиентам (--connect) через Unix-сокет.
+
+Протокол — JSON по строке в каждую сторону. Запросы клиента:
+    {"op": "ask", "query": "...", "session": null | "имя", "dry_run": false}
+    {"op": "ping"}
+    {"op": "shutdown"}
+Ответы демона на ask: {"type": "token", "text": "..."} по мере генерации,
+затем {"type": "done", "stats": {...}} или {"type": "error", "message": "..."}.
+
+session=null — основная сессия с памятью на диске (как у обычного CLI);
+имя — отдельная сессия в памяти демона (fork(persist=False)). Ходы одной
+сессии выполняются по очереди, разных сессий — параллельно.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from agent import http_client
+from agent.agent import AgentSession
+from agent.config import SERVER_MAX_SESSIONS
+from agent.memory import flush_compaction
+
+# Сколько ждать завершения начатых ходов при остановке
+SHUTDOWN_GRACE_S = 30.0
+
+
+def _socket_in_use(path: Path) -> bool:
+    """Отвечает ли на сокете другой процесс."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+        except OSError:
+            return False
+    return True
+
+
+class AgentServer:
+    """Демон агента: одна прогретая сессия и именованные сессии клиентов."""
+
+    def __init__(
+        self,
+        session: AgentSession,
+        path: Path,
+        *,
+        idle_timeout: float = 0,
+        max_sessions: int = SERVER_MAX_SESSIONS,
+    ):
+        self.session = session
+        self.path = Path(path)
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._named: OrderedDict[str, AgentSession] = OrderedDict()
+        self._locks: dict[str | None, asyncio.Lock] = {}
+        self._active: dict[str, int] = {}  # имя сессии -> запросов в работе (в т.ч. ждущих lock)
+        self._clients: dict[asyncio.StreamWriter, bool] = {}  # writer -> выполняется ли запрос
+        self._last_activity = time.monotonic()
+        self._stop: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _session_for(self, name: str | None) -> AgentSession:
+        """
+        Сессия по имени; самые давно неиспользуемые вытесняются сверх max_sessions.
+
+        Сессии с запросами в работе не вытесняются (иначе новый запрос с тем же
+        именем получил бы свежую сессию и lock и шёл бы параллельно начатому);
+        лишние вытесняются, когда их запросы завершатся. Вызов учитывает запрос
+        в _active; _ask снимает его по завершении хода.
+        """
+        if name is None:
+            return self.session
+        session = self._named.get(name)
+        if session is None:
+            session = self.session.fork(persist=False)
+            self._named[name] = session
+        self._named.move_to_end(name)
+        self._active[name] = self._active.get(name, 0) + 1
+        self._evict()
+        return session
+
+    def _evict(self) -> None:
+        """Вытеснить давно неиспользуемые сессии без запросов в работе сверх max_sessions."""
+        idle = [name for name in self._named if not self._active.get(name)]
+        for name in idle[: max(len(self._named) - self.max_sessions, 0)]:
+            del self._named[name]
+            self._locks.pop(name, None)
+
+    def stop(self) -> None:
+        """
+        Начать остановку: новые запросы не принимаются, начатые доделываются.
+
+        Можно вызывать из любого потока.
+        """
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    async def _send(self, writer: asyncio.StreamWriter, message: dict) -> None:
+        writer.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+        await writer.drain()
+
+    async def _ask(self, request: dict, writer: asyncio.StreamWriter) -> None:
+        query = str(request.get("query") or "").strip()
+        if not query:
+            await self._send(writer, {"type": "error", "message": "Ошибка: пустой запрос."})
+            return
+        name = request.get("session")
+        session = self._session_for(name)
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        # dry_run клиента — только для этого хода и лишь добавляется к режиму демона
+        dry_run = bool(request.get("dry_run"))
+        try:
+            async with lock:
+                try:
+                    # aclosing: при обрыве соединения ход закрывается в этой же задаче
+                    # (иначе генератор добивает GC в чужом контексте и contextvars ломаются)
+                    async with contextlib.aclosing(session.astream(query, dry_run=dry_run)) as stream:
+                        async for token in stream:
+                            await self._send(writer, {"type": "token", "text": token})
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    await self._send(writer, {"type": "error", "message": f"Ошибка: {e}"})
+                    return
+                await self._send(writer, {"type": "done", "stats": session.last_stats})
+        finally:
+            if name is not None:
+                self._active[name] -= 1
+                if not self._active[name]:
+                    del self._active[name]
+                self._evict()
+
+    async def _dispatch(self, request: dict, writer: asyncio.StreamWriter) -> None:
+        op = request.get("op")
+        if op == "ask":
+            await self._ask(request, writer)
+        elif op == "ping":
+            await self._send(writer, {"type": "pong", "pid": os.getpid(), "sessions": len(self._named)})
+        elif op == "shutdown":
+            await self._send(writer, {"type": "bye"})
+            self.stop()
+        else:
+            await self._send(writer, {"type": "error", "message": f"Ошибка: неизвестная операция: {op}"})
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Соединение клиента: запросы выполняются по очереди до EOF или остановки."""
+        self._clients[writer] = False
+        try:
+            while not self._stop.is_set():
+                line = await reader.readline()
+                if not line:
+                    break
+                self._last_activity = time.monotonic()
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    request = None
+                if not isinstance(request, dict):
+                    await self._send(writer, {"type": "error", "message": "Ошибка: некорректный запрос."})
+                    continue
+                self._clients[writer] = True
+                try:
+                    await self._dispatch(request, writer)
+                finally:
+                    self._clients[writer] = False
+                    self._last_activity = time.monotonic()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.pop(writer, None)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    def _idle(self) -> bool:
+        return (
+            self.idle_timeout > 0
+            and not self._clients
+            and time.monotonic() - self._last_activity >= self.idle_timeout
+        )
+
+    def _prepare_path(self) -> None:
+        if self.path.exists():
+            if _socket_in_use(self.path):
+                raise RuntimeError(f"демон уже запущен: {self.path}")
+            self.path.unlink()  # сокет от упавшего процесса
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    async def serve(self, ready=None) -> None:
+        """
+        Принимать клиентов до stop(), SIGINT/SIGTERM или простоя idle_timeout.
+
+        ready — необязательный callback, вызывается, когда сокет готов.
+        """
+        self._stop = asyncio.Event()
+        self._loop = loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            # Обработчики сигналов ставятся только из главного потока
+            with contextlib.suppress(ValueError, RuntimeError, NotImplementedError):
+                loop.add_signal_handler(sig, self.stop)
+        self._prepare_path()
+        # Сокет создаётся сразу с правами 0600: только владелец может подключаться
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._handle, path=str(self.path))
+        finally:
+            os.umask(umask)
+        self._last_activity = time.monotonic()
+        if ready is not None:
+            ready()
+        try:
+            while not self._stop.is_set():
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._stop.wait(), timeout=1.0)
+                if self._idle():
+                    print("[serve] простой — выход", file=sys.stderr)
+                    break
+        finally:
+            self._stop.set()
+            server.close()
+            await self._drain_clients()
+            with contextlib.suppress(OSError):
+                self.path.unlink()
+            await asyncio.to_thread(flush_compaction)
+            await http_client.aclose()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                with contextlib.suppress(ValueError, RuntimeError, NotImplementedError):
+                    loop.remove_signal_handler(sig)
+
+    async def _drain_clients(self) -> None:
+        """Закрыть простаивающие соединения и дождаться начатых ходов."""
+        deadline = time.monotonic() + SHUTDOWN_GRACE_S
+        while self._clients and time.monotonic() < deadline:
+            for writer, busy in list(self._clients.items()):
+                if not busy:
+                    writer.close()
+            await asyncio.sleep(0.05)
+
+
+def main_serve(session: AgentSession, path: Path, *, idle_timeout: float = 0) -> int:
+    """Запустить демон; код возврата для CLI."""
+    server = AgentServer(session, path, idle_timeout=idle_timeout)
+
+    def ready():
+        print(f"[serve] слушаю {path} (pid {os.getpid()})", file=sys.stderr)
+
+    try:
+        asyncio.run(server.serve(ready))
+    except RuntimeError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    print("[serve] остановлен", file=sys.stderr)
+    return 0
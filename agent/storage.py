@@ -0,0 +1,189 @@
+"""
+Примитивы файлового хранилища памяти: межпроцессная блокировка,
+атомарная запись (tmp + rename) и group commit для дозаписи.
+
+Несколько агентов могут работать с одним AGENT_MEMORY_DIR: запись идёт под
+advisory-блокировкой (fcntl.flock на отдельном lock-файле), файлы целиком
+переписываются только через os.replace, поэтому читатели без блокировки
+видят либо старую, либо новую версию, но не смесь.
+"""
+
+import contextlib
+import os
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только внутри процесса
+    fcntl = None
+
+
+class FileLock:
+    """
+    Реентерабельная эксклюзивная блокировка: RLock внутри процесса и
+    flock между процессами (берётся при первом входе, снимается при последнем).
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd: int | None = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._rlock.acquire(blocking=blocking):
+            return False
+        if self._depth == 0:
+            try:
+                self._fd = self._lock_file(blocking)
+            except BaseException:
+                self._rlock.release()
+                raise
+            if self._fd is None:
+                self._rlock.release()
+                return False
+        self._depth += 1
+        return True
+
+    def _lock_file(self, blocking: bool) -> int | None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if fcntl is None:
+            return fd
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._rlock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+_locks: dict[Path, FileLock] = {}
+_locks_guard = threading.Lock()
+
+
+def lock_for(path: Path) -> FileLock:
+    """Общий для процесса FileLock по пути lock-файла."""
+    path = Path(path)
+    with _locks_guard:
+        lock = _locks.get(path)
+        if lock is None:
+            lock = _locks[path] = FileLock(path)
+        return lock
+
+
+def fsync_dir(path: Path) -> None:
+    """fsync каталога — чтобы переименование пережило сбой питания (где поддерживается)."""
+    with contextlib.suppress(OSError):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def atomic_write(path: Path, data: bytes, *, durable: bool = False, fsync: bool = True) -> None:
+    """
+    Записать файл целиком через временный файл и os.replace.
+
+    Содержимое временного файла сбрасывается на диск перед заменой
+    (fsync=False — для кэшей, которые можно потерять при сбое питания);
+    durable=True дополнительно делает fsync каталога.
+    """
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            tmp.unlink()
+        raise
+    if durable:
+        fsync_dir(path.parent)
+
+
+class GroupCommit:
+    """
+    Group commit для высокочастотной дозаписи.
+
+    Писатели ставят записи в очередь; первый из них становится лидером,
+    ждёт window секунд, пока подтянутся остальные, и передаёт всю пачку
+    в write_batch (одна блокировка и один fsync на пачку). submit
+    возвращается, когда запись сохранена, и пробрасывает ошибку пачки.
+    """
+
+    def __init__(self, write_batch: Callable[[list], None], window: float):
+        self.write_batch = write_batch
+        self.window = window
+        self._cond = threading.Condition()
+        self._pending: list[tuple[int, object]] = []
+        self._seq = 0
+        self._committed = 0
+        self._leading = False
+        self._errors: dict[int, Exception] = {}
+        self.batches = 0
+
+    def submit(self, item) -> None:
+        with self._cond:
+            self._seq += 1
+            ticket = self._seq
+            self._pending.append((ticket, item))
+            while self._committed < ticket:
+                if not self._leading:
+                    self._leading = True
+                    break
+                self._cond.wait()
+            else:
+                error = self._errors.pop(ticket, None)
+                if error is not None:
+                    raise error
+                return
+
+        if self.window > 0:
+            time.sleep(self.window)
+        with self._cond:
+            batch, self._pending = self._pending, []
+            upto = self._seq
+        error = None
+        try:
+            self.write_batch([item for _, item in batch])
+        except Exception as e:
+            error = e
+        with self._cond:
+            if error is not None:
+                for t, _ in batch:
+                    self._errors[t] = error
+            self.batches += 1
+            self._committed = upto
+            self._leading = False
+            self._cond.notify_all()
+            error = self._errors.pop(ticket, None)
+        if error is not None:
+            raise error
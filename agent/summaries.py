@@ -0,0 +1,111 @@
+"""
+Иерархическое скользящее резюме памяти.
+
+Каждая компакция добавляет резюме уровня 0 (кусок диалога). Когда резюме
+одного уровня в сумме превышают лимит токенов, они сливаются в одно резюме
+следующего уровня; на верхнем уровне резюме сливаются между собой. Так
+внедряемый в промпт контекст остаётся ограниченным (примерно лимит × число
+уровней), а каждое резюме хранит происхождение: сколько сообщений и какой
+промежуток времени оно покрывает и из каких резюме получено.
+
+Модуль не зависит от LLM: функция слияния передаётся снаружи (agent.memory).
+"""
+
+import uuid
+from collections.abc import Callable
+from datetime import datetime, timezone
+
+from agent.context import count_tokens
+
+# (тексты резюме по порядку, уровень результата) -> текст или None, если слить не удалось
+MergeFn = Callable[[list[str], int], str | None]
+
+
+def _node(level: int, text: str, *, messages: int, from_ts: str, to_ts: str, sources: list[str]) -> dict:
+    return {
+        "id": f"s{level}-{uuid.uuid4().hex[:10]}",
+        "level": level,
+        "text": text,
+        "tokens": count_tokens(text),
+        "messages": messages,
+        "from_ts": from_ts,
+        "to_ts": to_ts,
+        "sources": sources,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def chunk_summary(text: str, messages: list[dict]) -> dict:
+    """Резюме уровня 0 для куска диалога messages."""
+    return _node(
+        0,
+        text,
+        messages=len(messages),
+        from_ts=messages[0].get("ts", "") if messages else "",
+        to_ts=messages[-1].get("ts", "") if messages else "",
+        sources=[],
+    )
+
+
+def from_legacy(summary: str) -> list[dict]:
+    """Плоское резюме (старый memory.json или ручная правка) как один узел уровня 0."""
+    if not summary:
+        return []
+    node = _node(0, summary, messages=0, from_ts="", to_ts="", sources=[])
+    node["id"] = "legacy"
+    return [node]
+
+
+def _ordered(nodes: list[dict]) -> list[dict]:
+    """От старого к новому: старшие уровни покрывают более раннюю часть диалога."""
+    return sorted(nodes, key=lambda n: -n.get("level", 0))
+
+
+def render(nodes: list[dict]) -> str:
+    """Текст резюме для промпта: от старого к новому."""
+    return "\n".join(n["text"] for n in _ordered(nodes) if n.get("text"))
+
+
+def _merge(group: list[dict], level: int, merge_fn: MergeFn) -> dict | None:
+    text = merge_fn([n["text"] for n in group], level)
+    if not text:
+        return None
+    return _node(
+        level,
+        text,
+        messages=sum(n.get("messages", 0) for n in group),
+        from_ts=next((n["from_ts"] for n in group if n.get("from_ts")), ""),
+        to_ts=next((n["to_ts"] for n in reversed(group) if n.get("to_ts")), ""),
+        sources=[n["id"] for n in group],
+    )
+
+
+def add_summary(
+    nodes: list[dict],
+    node: dict,
+    merge_fn: MergeFn,
+    *,
+    level_tokens: int,
+    max_levels: int,
+) -> list[dict]:
+    """
+    Добавить резюме и слить переполненные уровни.
+
+    Уровень сливается, если в нём хотя бы два резюме и их токены в сумме
+    больше level_tokens. Если merge_fn не справилась (None), уровни
+    остаются как есть — слияние повторится при следующей компакции.
+
+    Returns:
+        Новый список узлов (исходный не меняется).
+    """
+    top = max(max_levels, 1) - 1
+    nodes = _ordered([*nodes, node])
+    for level in range(top + 1):
+        group = [n for n in nodes if n.get("level", 0) == level]
+        if len(group) < 2 or sum(n.get("tokens", 0) for n in group) <= level_tokens:
+            continue
+        merged = _merge(group, min(level + 1, top), merge_fn)
+        if merged is None:
+            break
+        nodes = _ordered([n for n in nodes if n.get("level", 0) != level] + [merged])
+    return nodes
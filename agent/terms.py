@@ -0,0 +1,31 @@
+"""
+Термы для локального поиска (архив диалога, факты): слова без стоп-слов,
+обрезанные до основы.
+"""
+
+import re
+
+# Грубый стемминг без словарей: слово обрезается до первых STEM_CHARS символов,
+# но у коротких слов отбрасывается до двух последних (окончание), не короче
+# MIN_STEM_CHARS: «погода/погоды», «орехи/орехов», «weather/weathers» совпадают
+STEM_CHARS = 5
+MIN_STEM_CHARS = 4
+
+_WORD = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне "
+    "было вот от меня еще нет о об из ему когда даже ну ли если уже или ни быть был до вас там "
+    "себя ей может они тут где есть для мы тебя их чем была сам без чего раз тоже себе под будет "
+    "тогда кто этот того этого какой здесь этом мой тем чтобы сейчас были можно при это эти "
+    "the a an and or of to in is it for on with as at by be this that are was i you what how".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Термы текста: слова в нижнем регистре без стоп-слов, обрезанные до основы."""
+    words = _WORD.findall(text.lower().replace("ё", "е"))
+    return [
+        w[:min(STEM_CHARS, max(MIN_STEM_CHARS, len(w) - 2))]
+        for w in words
+        if len(w) > 1 and w not in _STOPWORDS
+    ]
@@ -1,33 +1,100 @@
 """
-Инструменты агента: web search, HTTP, файлы, терминал, погода, крипта.
+Инструменты агента: web search, HTTP, файлы, терминал, погода, крипта, факты и задачи памяти.
 """
 
+import asyncio
+import contextvars
 import json
+import re
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
-import requests
-try:
-    from ddgs import DDGS
-except ModuleNotFoundError:
-    from duckduckgo_search import DDGS
-from langchain_core.tools import tool
-
+from agent import http_cache, http_client
+from agent.batcher import MicroBatcher
 from agent.config import (
+    COINGECKO_API_URL,
+    COINGECKO_COINS_FILE,
+    CRYPTO_BATCH_WINDOW_MS,
+    CRYPTO_COIN_INDEX_TTL,
+    CRYPTO_MAX_COINS,
+    CRYPTO_PRICE_TTL,
+    GEOCODE_CACHE_FILE,
     HTTP_MAX_BYTES,
-    HTTP_TIMEOUT,
+    HTTP_POOL_MAXSIZE,
+    OPEN_METEO_FORECAST_URL,
+    OPEN_METEO_GEOCODE_URL,
     TERMINAL_MAX_OUTPUT_CHARS,
     TERMINAL_TIMEOUT,
+    WEATHER_FORECAST_TTL,
+    WEATHER_GEOCODE_TTL,
+    WEATHER_MAX_CITIES,
     WORKSPACE_DIR,
     get_dry_run,
 )
+from agent.http_body import BodyReader, declared_length, decode_text, html_text, is_html, json_excerpt
 from agent.safety import is_allowed_command, is_safe_path, is_safe_url, validate_command_no_shell_injection
+from agent.tracing import current_span, span, traced
+from agent.ttl_cache import TTLCache
+
+# Тяжёлые зависимости (requests, httpx, ddgs, LangChain) импортируются при
+# первом вызове, а не при импорте модуля: --help и старт REPL их не ждут.
+
+
+class _LazyTool:
+    """
+    Запись реестра инструментов: функция, её async-версия и объект LangChain.
+
+    StructuredTool строится при первом обращении (resolve или любой атрибут
+    инструмента: invoke, ainvoke, args_schema...) — создание инструментов
+    тянет langchain_core.callbacks и tracers.
+    """
+
+    def __init__(self, func):
+        self.name = func.__name__
+        self.func = func
+        self.coroutine = None
+        self._tool = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        """Объект инструмента LangChain (создаётся один раз)."""
+        if self._tool is None:
+            with self._lock:
+                if self._tool is None:
+                    from langchain_core.tools import StructuredTool
+
+                    self._tool = StructuredTool.from_function(
+                        func=self.func, coroutine=self.coroutine, name=self.name
+                    )
+        return self._tool
+
+    def __getattr__(self, attr: str):
+        return getattr(self.resolve(), attr)
+
+
+_REGISTRY: dict[str, _LazyTool] = {}
+
+
+def tool(func) -> _LazyTool:
+    """Зарегистрировать функцию как инструмент агента (аналог langchain_core.tools.tool)."""
+    entry = _LazyTool(func)
+    _REGISTRY[entry.name] = entry
+    return entry
+
+
+def _async_client():
+    """Асинхронный HTTP-клиент для async-версий инструментов (общий пул текущего event loop)."""
+    return http_client.async_client()
 
 
 # --- Web Search ---
 
 
 @tool
+@traced("tool.web_search")
 def web_search(query: str) -> str:
     """Поиск в интернете через DuckDuckGo. Возвращает список результатов: title, url, snippet.
 
@@ -35,7 +102,11 @@ def web_search(query: str) -> str:
         query: Поисковый запрос
     """
     try:
-        with DDGS() as ddgs:
+        from ddgs import DDGS
+    except ModuleNotFoundError:
+        from duckduckgo_search import DDGS
+    try:
+        with span("ddgs.text"), DDGS() as ddgs:
             results = list(ddgs.text(query, max_results=5))
         output = []
         for r in results:
@@ -49,15 +120,26 @@ def web_search(query: str) -> str:
         return f"Ошибка поиска: {e}"
 
 
+async def _aweb_search(query: str) -> str:
+    # DDGS синхронный — выполняем в отдельном потоке
+    return await asyncio.to_thread(web_search.func, query)
+
+
+web_search.coroutine = _aweb_search
+
+
 # --- HTTP Request ---
 
 
 @tool
+@traced("tool.http_request")
 def http_request(
     url: str,
     method: str = "GET",
     headers: dict | None = None,
     body: str | None = None,
+    json_path: str = "",
+    text_only: bool = False,
 ) -> str:
     """Выполнить HTTP-запрос. Поддерживает GET и POST. Защита от SSRF (localhost, приватные сети запрещены).
 
@@ -66,44 +148,194 @@ def http_request(
         method: HTTP метод (GET или POST)
         headers: Опциональные заголовки
         body: Тело запроса для POST
+        json_path: Вернуть только значение по пути в JSON-ответе (например: data.items.0.name)
+        text_only: Для HTML вернуть только видимый текст страницы, без разметки
     """
-    if not is_safe_url(url):
-        return "Ошибка: URL запрещён (localhost, приватные сети)."
+    import requests
+
+    error = _check_http_request(url, method)
+    if error:
+        return error
     method = method.upper()
-    if method not in ("GET", "POST"):
-        return f"Ошибка: поддерживаются только GET и POST, получено: {method}"
+    cache, lookup = _http_cache_lookup(method, url, headers)
+    if lookup is not None and lookup.fresh:
+        cached = _cached_http_response(cache, lookup.entry, json_path, text_only)
+        if cached is not None:
+            return cached
+        lookup.entry = None
     try:
-        resp = requests.request(
+        sent = time.time()
+        with http_client.request(
             method,
             url,
-            headers=headers or {},
+            headers=lookup.request_headers(headers) if lookup is not None else headers or {},
             data=body,
-            timeout=HTTP_TIMEOUT,
             allow_redirects=True,
             stream=True,
-        )
-        content = b""
-        for chunk in resp.iter_content(chunk_size=8192):
-            content += chunk
-            if len(content) > HTTP_MAX_BYTES:
-                content = content[:HTTP_MAX_BYTES]
-                break
-        text = content.decode("utf-8", errors="replace")
-        result = {
-            "status_code": resp.status_code,
-            "headers": dict(resp.headers),
-            "body": text,
-            "truncated": len(content) >= HTTP_MAX_BYTES,
-        }
-        return json.dumps(result, ensure_ascii=False)
+        ) as resp:
+            if resp.status_code == 304 and lookup is not None and lookup.entry is not None:
+                return _revalidated_http_response(cache, lookup, resp.headers, sent, json_path, text_only)
+            reader = BodyReader(HTTP_MAX_BYTES, declared_length(resp.headers))
+            if not reader.complete:
+                for chunk in resp.iter_content(chunk_size=_HTTP_CHUNK):
+                    if not reader.feed(chunk):
+                        break  # остаток тела не читаем: with закроет соединение
+            if lookup is not None:
+                cache.store(lookup, resp.status_code, resp.headers, reader.getvalue(),
+                            truncated=reader.truncated, request_time=sent)
+            return _format_http_response(
+                resp.status_code, resp.headers, reader.getvalue(), reader.truncated, json_path, text_only
+            )
     except requests.RequestException as e:
         return f"Ошибка HTTP: {e}"
 
 
+# Размер чанка чтения тела: меньше вызовов на мегабайт, буфер всё равно общий
+_HTTP_CHUNK = 64 * 1024
+
+# Заголовки ответа, которые попадают в результат; остальные модели не нужны
+_HTTP_RESPONSE_HEADERS = (
+    "content-type", "content-length", "content-encoding", "location",
+    "last-modified", "etag", "cache-control", "retry-after",
+)
+
+
+def _check_http_request(url: str, method: str) -> str | None:
+    """Проверка URL и метода; текст ошибки или None."""
+    if not is_safe_url(url):
+        return "Ошибка: URL запрещён (localhost, приватные сети)."
+    method = method.upper()
+    if method not in ("GET", "POST"):
+        return f"Ошибка: поддерживаются только GET и POST, получено: {method}"
+    return None
+
+
+def _http_cache_lookup(method: str, url: str, headers: dict | None):
+    """
+    HTTP-кэш и запись для запроса; (None, None) — кэш не используется.
+
+    Вызывается после _check_http_request: кэш не обходит SSRF-проверку.
+    Кэшируются только GET.
+    """
+    cache = http_cache.get_cache() if method == "GET" else None
+    lookup = cache.lookup(url, headers) if cache is not None else None
+    return cache, lookup
+
+
+def _cached_http_response(cache, entry, json_path: str, text_only: bool, revalidated: bool = False) -> str | None:
+    """Ответ из кэша (тело через mmap); None — тело записи пропало."""
+    headers = {**entry.headers, "content-length": str(entry.size)}
+    try:
+        with cache.read(entry, HTTP_MAX_BYTES, revalidated=revalidated) as (body, truncated):
+            return _format_http_response(
+                entry.status, headers, body, truncated, json_path, text_only,
+                cache="revalidated" if revalidated else "hit",
+            )
+    except OSError:
+        return None
+
+
+def _revalidated_http_response(cache, lookup, response_headers, sent: float, json_path: str, text_only: bool) -> str:
+    """Ответ 304 на условный запрос: обновить запись и отдать тело из кэша."""
+    entry = cache.refresh(lookup, response_headers, sent)
+    result = _cached_http_response(cache, entry, json_path, text_only, revalidated=True)
+    if result is None:
+        return "Ошибка HTTP: запись кэша удалена во время перепроверки, повторите запрос"
+    return result
+
+
+def _format_http_response(
+    status_code: int,
+    headers,
+    body,
+    truncated: bool,
+    json_path: str = "",
+    text_only: bool = False,
+    cache: str = "",
+) -> str:
+    """
+    Сериализовать ответ http_request в JSON.
+
+    С json_path тело — значение по пути (JSON), с text_only — видимый текст HTML.
+    cache — hit/revalidated, если ответ отдан из HTTP-кэша.
+    """
+    content_type = headers.get("content-type", "")
+    text = decode_text(body, content_type, truncated)
+    if json_path:
+        try:
+            text = json.dumps(json_excerpt(text, json_path), ensure_ascii=False)
+        except ValueError:
+            return "Ошибка: ответ не JSON" + (" (тело обрезано по лимиту)" if truncated else "")
+        except KeyError:
+            return f"Ошибка: в JSON-ответе нет пути {json_path}"
+    elif text_only and is_html(content_type):
+        text = html_text(text)
+    result = {
+        "status_code": status_code,
+        "headers": {name: headers[name] for name in _HTTP_RESPONSE_HEADERS if name in headers},
+        "body": text,
+        "truncated": truncated,
+    }
+    if cache:
+        result["cache"] = cache
+    return json.dumps(result, ensure_ascii=False)
+
+
+@traced("tool.http_request")
+async def _ahttp_request(
+    url: str,
+    method: str = "GET",
+    headers: dict | None = None,
+    body: str | None = None,
+    json_path: str = "",
+    text_only: bool = False,
+) -> str:
+    import httpx
+
+    error = _check_http_request(url, method)
+    if error:
+        return error
+    method = method.upper()
+    # Файлы HTTP-кэша (метаданные, тело до HTTP_MAX_BYTES) — в потоке, не в event loop
+    cache, lookup = await asyncio.to_thread(_http_cache_lookup, method, url, headers)
+    if lookup is not None and lookup.fresh:
+        cached = await asyncio.to_thread(_cached_http_response, cache, lookup.entry, json_path, text_only)
+        if cached is not None:
+            return cached
+        lookup.entry = None
+    request_headers = lookup.request_headers(headers) if lookup is not None else headers or {}
+    try:
+        sent = time.time()
+        async with _async_client().stream(method, url, headers=request_headers, content=body) as resp:
+            if resp.status_code == 304 and lookup is not None and lookup.entry is not None:
+                return await asyncio.to_thread(
+                    _revalidated_http_response, cache, lookup, resp.headers, sent, json_path, text_only
+                )
+            reader = BodyReader(HTTP_MAX_BYTES, declared_length(resp.headers))
+            if not reader.complete:
+                async for chunk in resp.aiter_bytes(chunk_size=_HTTP_CHUNK):
+                    if not reader.feed(chunk):
+                        break
+            if lookup is not None:
+                await asyncio.to_thread(
+                    cache.store, lookup, resp.status_code, resp.headers, reader.getvalue(),
+                    truncated=reader.truncated, request_time=sent,
+                )
+            return _format_http_response(
+                resp.status_code, resp.headers, reader.getvalue(), reader.truncated, json_path, text_only
+            )
+    except httpx.HTTPError as e:
+        return f"Ошибка HTTP: {e}"
+
+
+http_request.coroutine = _ahttp_request
+
+
 # --- File IO ---
 
 
 @tool
+@traced("tool.read_file")
 def read_file(path: str) -> str:
     """Прочитать содержимое файла в пределах workspace.
 
@@ -122,6 +354,7 @@ def read_file(path: str) -> str:
 
 
 @tool
+@traced("tool.write_file")
 def write_file(path: str, content: str) -> str:
     """Записать содержимое в файл в пределах workspace. Создаёт директории при необходимости.
 
@@ -143,6 +376,7 @@ def write_file(path: str, content: str) -> str:
 
 
 @tool
+@traced("tool.list_files")
 def list_files(path: str = ".") -> str:
     """Список файлов и директорий в указанной папке workspace.
 
@@ -164,10 +398,32 @@ def list_files(path: str = ".") -> str:
         return f"Ошибка: {e}"
 
 
+# Файловые операции блокирующие — async-версии выносят их в поток.
+# asyncio.to_thread копирует contextvars, поэтому dry-run сохраняется.
+
+
+async def _aread_file(path: str) -> str:
+    return await asyncio.to_thread(read_file.func, path)
+
+
+async def _awrite_file(path: str, content: str) -> str:
+    return await asyncio.to_thread(write_file.func, path, content)
+
+
+async def _alist_files(path: str = ".") -> str:
+    return await asyncio.to_thread(list_files.func, path)
+
+
+read_file.coroutine = _aread_file
+write_file.coroutine = _awrite_file
+list_files.coroutine = _alist_files
+
+
 # --- Terminal Exec ---
 
 
 @tool
+@traced("tool.execute_terminal")
 def execute_terminal(command: str) -> str:
     """Выполнить команду в терминале. Разрешены: ls, cat, grep, head, tail, wc, python, pip, git status.
     Работает только в workspace. Shell отключён.
@@ -175,15 +431,10 @@ def execute_terminal(command: str) -> str:
     Args:
         command: Команда с аргументами (например: ls -la, git status)
     """
-    if get_dry_run():
-        return f"[DRY-RUN] Будет выполнено: {command}. Запустите без --dry-run для выполнения."
-    if not validate_command_no_shell_injection(command):
-        return "Ошибка: команда содержит недопустимые символы (|, ;, &&, $ и т.д.)."
-    if not is_allowed_command(command):
-        return f"Ошибка: команда '{command.split()[0] if command.split() else ''}' не в allowlist. Разрешены: ls, cat, grep, head, tail, wc, python, pip, git status."
+    error = _check_terminal_command(command)
+    if error:
+        return error
     args = command.split()
-    if not args:
-        return "Ошибка: пустая команда."
     try:
         result = subprocess.run(
             args,
@@ -193,16 +444,64 @@ def execute_terminal(command: str) -> str:
             timeout=TERMINAL_TIMEOUT,
             shell=False,
         )
-        out = (result.stdout or "") + (result.stderr or "")
-        if len(out) > TERMINAL_MAX_OUTPUT_CHARS:
-            out = out[:TERMINAL_MAX_OUTPUT_CHARS] + "\n... (обрезано)"
-        return f"exit_code={result.returncode}\n{out}"
+        return _format_terminal_output(result.returncode, result.stdout or "", result.stderr or "")
     except subprocess.TimeoutExpired:
         return f"Ошибка: timeout ({TERMINAL_TIMEOUT}s)"
     except OSError as e:
         return f"Ошибка выполнения: {e}"
 
 
+def _check_terminal_command(command: str) -> str | None:
+    """Dry-run и проверки безопасности команды; текст ответа или None."""
+    if get_dry_run():
+        return f"[DRY-RUN] Будет выполнено: {command}. Запустите без --dry-run для выполнения."
+    if not validate_command_no_shell_injection(command):
+        return "Ошибка: команда содержит недопустимые символы (|, ;, &&, $ и т.д.)."
+    if not is_allowed_command(command):
+        return f"Ошибка: команда '{command.split()[0] if command.split() else ''}' не в allowlist. Разрешены: ls, cat, grep, head, tail, wc, python, pip, git status."
+    if not command.split():
+        return "Ошибка: пустая команда."
+    return None
+
+
+def _format_terminal_output(returncode: int, stdout: str, stderr: str) -> str:
+    out = stdout + stderr
+    if len(out) > TERMINAL_MAX_OUTPUT_CHARS:
+        out = out[:TERMINAL_MAX_OUTPUT_CHARS] + "\n... (обрезано)"
+    return f"exit_code={returncode}\n{out}"
+
+
+@traced("tool.execute_terminal")
+async def _aexecute_terminal(command: str) -> str:
+    error = _check_terminal_command(command)
+    if error:
+        return error
+    args = command.split()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            cwd=str(WORKSPACE_DIR),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except OSError as e:
+        return f"Ошибка выполнения: {e}"
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=TERMINAL_TIMEOUT)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return f"Ошибка: timeout ({TERMINAL_TIMEOUT}s)"
+    return _format_terminal_output(
+        proc.returncode,
+        stdout.decode("utf-8", errors="replace"),
+        stderr.decode("utf-8", errors="replace"),
+    )
+
+
+execute_terminal.coroutine = _aexecute_terminal
+
+
 # --- Weather (Open-Meteo) ---
 
 
@@ -219,101 +518,750 @@ def _weather_code_description(code: int) -> str:
     return codes.get(code, "неизвестно")
 
 
+_GEOCODE_URL = OPEN_METEO_GEOCODE_URL
+_FORECAST_URL = OPEN_METEO_FORECAST_URL
+_GEOCODE_LANGUAGE = "ru"
+# Срок, на который запоминается «город не найден» (опечатки модель часто повторяет)
+_GEOCODE_MISS_TTL = 3600
+
+# Координаты городов — на диске, надолго; текущая погода по координатам — в памяти на минуты
+_geocode_cache = TTLCache(WEATHER_GEOCODE_TTL, max_entries=5000, path=GEOCODE_CACHE_FILE)
+_forecast_cache = TTLCache(WEATHER_FORECAST_TTL, max_entries=1000)
+
+
+def _geocode_params(city: str) -> dict:
+    return {"name": city, "count": 5, "language": _GEOCODE_LANGUAGE, "format": "json"}
+
+
+def _forecast_params(points: list[tuple[float, float]]) -> dict:
+    """Параметры прогноза; несколько точек — через запятую, одним запросом."""
+    return {
+        "latitude": ",".join(str(lat) for lat, _ in points),
+        "longitude": ",".join(str(lon) for _, lon in points),
+        "current_weather": "true",
+    }
+
+
+def _geocode_key(city: str) -> str:
+    """Ключ кэша геокодинга: название без регистра, пунктуации и лишних пробелов, ё = е, плюс язык."""
+    name = re.sub(r"[^\w\s-]", " ", city.casefold().replace("ё", "е"))
+    return f"{' '.join(name.split())}|{_GEOCODE_LANGUAGE}"
+
+
+def _coords_key(place: dict) -> str:
+    """Ключ кэша погоды: координаты, округлённые до 0.01° (~1 км)."""
+    return f"{round(place['latitude'], 2)},{round(place['longitude'], 2)}"
+
+
+def _pick_city(data: dict) -> dict | None:
+    """Из ответа геокодера выбрать город с наибольшим population, иначе первый."""
+    results = data.get("results") or []
+    if not results:
+        return None
+    return max(results, key=lambda r: r.get("population") or 0)
+
+
+def _remember_place(city: str, data: dict, save: bool) -> dict | None:
+    """Запомнить результат геокодинга ({} — не найден); вернуть {name, latitude, longitude} или None."""
+    best = _pick_city(data)
+    place = {} if best is None else {
+        "name": best.get("name", city), "latitude": best["latitude"], "longitude": best["longitude"],
+    }
+    _geocode_cache.set(_geocode_key(city), place, ttl=None if place else _GEOCODE_MISS_TTL, save=save)
+    return place or None
+
+
+def _geocode(city: str, save: bool = True) -> dict | None:
+    """
+    Город из кэша или геокодера; None — не найден.
+
+    Raises:
+        requests.RequestException: ошибка запроса к геокодеру.
+    """
+    place = _geocode_cache.get(_geocode_key(city))
+    if place is not None:
+        return place or None
+    with span("http.geocode", city=city):
+        resp = http_client.get(_GEOCODE_URL, params=_geocode_params(city))
+    resp.raise_for_status()
+    return _remember_place(city, resp.json(), save)
+
+
+async def _ageocode(client, city: str) -> dict | None:
+    """Async-версия _geocode; файл кэша не пишет — вызывающий делает _geocode_cache.asave()."""
+    await _geocode_cache.aload()
+    place = _geocode_cache.get(_geocode_key(city))
+    if place is not None:
+        return place or None
+    with span("http.geocode", city=city):
+        resp = await client.get(_GEOCODE_URL, params=_geocode_params(city))
+    resp.raise_for_status()
+    return _remember_place(city, resp.json(), save=False)
+
+
+def _cached_forecasts(places: list[dict]) -> tuple[dict[str, dict], dict[str, tuple[float, float]]]:
+    """Погода из кэша по координатам мест и координаты, которых в кэше нет (по ключу _coords_key)."""
+    current, missing = {}, {}
+    for place in places:
+        key = _coords_key(place)
+        if key in current or key in missing:
+            continue
+        curr = _forecast_cache.get(key)
+        if curr is None:
+            missing[key] = (place["latitude"], place["longitude"])
+        else:
+            current[key] = curr
+    return current, missing
+
+
+def _store_forecasts(missing: dict[str, tuple[float, float]], data) -> dict[str, dict]:
+    """
+    Разобрать ответ прогноза и закэшировать погоду по точкам.
+
+    Open-Meteo на одну точку отвечает объектом, на несколько — списком в порядке запроса.
+    """
+    items = data if isinstance(data, list) else [data]
+    if len(items) != len(missing):
+        raise ValueError(f"в ответе {len(items)} точек вместо {len(missing)}")
+    current = {}
+    for key, item in zip(missing, items):
+        current[key] = item.get("current_weather") or {}
+        if current[key]:
+            _forecast_cache.set(key, current[key])
+    return current
+
+
+def _forecasts(places: list[dict]) -> dict[str, dict]:
+    """
+    Текущая погода для мест: из кэша, недостающие точки — одним запросом.
+
+    Raises:
+        requests.RequestException, ValueError: ошибка запроса или ответа.
+    """
+    current, missing = _cached_forecasts(places)
+    if missing:
+        with span("http.forecast", points=len(missing)):
+            resp = http_client.get(_FORECAST_URL, params=_forecast_params(list(missing.values())))
+        resp.raise_for_status()
+        current.update(_store_forecasts(missing, resp.json()))
+    return current
+
+
+async def _aforecasts(client, places: list[dict]) -> dict[str, dict]:
+    current, missing = _cached_forecasts(places)
+    if missing:
+        with span("http.forecast", points=len(missing)):
+            resp = await client.get(_FORECAST_URL, params=_forecast_params(list(missing.values())))
+        resp.raise_for_status()
+        current.update(_store_forecasts(missing, resp.json()))
+    return current
+
+
+def _weather_record(name: str, curr: dict) -> dict:
+    code = curr.get("weathercode", 0)
+    return {
+        "city": name,
+        "temp_c": curr.get("temperature", 0),
+        "wind_kph": curr.get("windspeed", 0),
+        "weather_code": code,
+        "description": _weather_code_description(code),
+    }
+
+
+def _format_weather(name: str, curr: dict) -> str:
+    return json.dumps(_weather_record(name, curr), ensure_ascii=False)
+
+
 @tool
+@traced("tool.get_weather")
 def get_weather(city: str) -> str:
     """Получить текущую погоду в городе через Open-Meteo. При нескольких совпадениях выбирается самый населённый.
 
     Args:
         city: Название города (например: Berlin, Москва)
     """
-    geocode_url = "https://geocoding-api.open-meteo.com/v1/search"
+    import requests
+
     try:
-        gr = requests.get(
-            geocode_url,
-            params={"name": city, "count": 5, "language": "ru", "format": "json"},
-            timeout=HTTP_TIMEOUT,
-        )
-        gr.raise_for_status()
-        data = gr.json()
-        results = data.get("results") or []
-        if not results:
-            return f"Город не найден: {city}"
-        # Выбираем по population, иначе первый
-        best = max(results, key=lambda r: r.get("population") or 0)
-        lat = best["latitude"]
-        lon = best["longitude"]
-        name = best.get("name", city)
+        place = _geocode(city)
     except requests.RequestException as e:
         return f"Ошибка геокодинга: {e}"
+    if place is None:
+        return f"Город не найден: {city}"
 
-    forecast_url = "https://api.open-meteo.com/v1/forecast"
     try:
-        fr = requests.get(
-            forecast_url,
-            params={
-                "latitude": lat,
-                "longitude": lon,
-                "current_weather": "true",
-            },
-            timeout=HTTP_TIMEOUT,
-        )
-        fr.raise_for_status()
-        curr = fr.json().get("current_weather", {})
-    except requests.RequestException as e:
+        curr = _forecasts([place])[_coords_key(place)]
+    except (requests.RequestException, ValueError) as e:
         return f"Ошибка прогноза: {e}"
 
-    temp = curr.get("temperature", 0)
-    wind = curr.get("windspeed", 0)
-    code = curr.get("weathercode", 0)
-    return json.dumps({
-        "city": name,
-        "temp_c": temp,
-        "wind_kph": wind,
-        "weather_code": code,
-        "description": _weather_code_description(code),
-    }, ensure_ascii=False)
+    return _format_weather(place["name"], curr)
+
+
+@traced("tool.get_weather")
+async def _aget_weather(city: str) -> str:
+    import httpx
+
+    client = _async_client()
+    try:
+        place = await _ageocode(client, city)
+    except (httpx.HTTPError, ValueError) as e:
+        return f"Ошибка геокодинга: {e}"
+    await _geocode_cache.asave()
+    if place is None:
+        return f"Город не найден: {city}"
+
+    try:
+        curr = (await _aforecasts(client, [place]))[_coords_key(place)]
+    except (httpx.HTTPError, ValueError) as e:
+        return f"Ошибка прогноза: {e}"
+
+    return _format_weather(place["name"], curr)
+
+
+get_weather.coroutine = _aget_weather
+
+
+def _check_cities(cities: list[str]) -> list[str] | str:
+    """Города без повторов (по ключу геокодинга) в исходном порядке или текст ошибки."""
+    unique = {}
+    for city in cities:
+        if city.strip():
+            unique.setdefault(_geocode_key(city), city.strip())
+    if not unique:
+        return "Ошибка: список городов пуст"
+    if len(unique) > WEATHER_MAX_CITIES:
+        return f"Ошибка: не больше {WEATHER_MAX_CITIES} городов за вызов"
+    return list(unique.values())
+
+
+def _format_weather_many(cities: list[str], places: list, current: dict[str, dict]) -> str:
+    """JSON-список погоды в порядке городов; для ненайденных — {city, error}."""
+    out = []
+    for city, place in zip(cities, places):
+        if isinstance(place, Exception):
+            out.append({"city": city, "error": f"Ошибка геокодинга: {place}"})
+        elif place is None:
+            out.append({"city": city, "error": "Город не найден"})
+        else:
+            out.append(_weather_record(place["name"], current[_coords_key(place)]))
+    return json.dumps(out, ensure_ascii=False)
+
+
+@tool
+@traced("tool.get_weather_many")
+def get_weather_many(cities: list[str]) -> str:
+    """Получить текущую погоду сразу в нескольких городах (один запрос прогноза на все). Используй вместо нескольких вызовов get_weather.
+
+    Args:
+        cities: Названия городов (например: ["Berlin", "Москва", "Paris"])
+    """
+    import requests
+
+    cities = _check_cities(cities)
+    if isinstance(cities, str):
+        return cities
+    current_span().set(cities=len(cities))
+
+    def geocode(city: str):
+        try:
+            return _geocode(city, save=False)
+        except requests.RequestException as e:
+            return e
+
+    # Промахи кэша геокодинга — параллельно; span'ы потоков — в контексте вызова
+    with ThreadPoolExecutor(max_workers=min(len(cities), HTTP_POOL_MAXSIZE)) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, geocode, city) for city in cities]
+        places = [f.result() for f in futures]
+    _geocode_cache.save()
+
+    try:
+        current = _forecasts([p for p in places if isinstance(p, dict)])
+    except (requests.RequestException, ValueError) as e:
+        return f"Ошибка прогноза: {e}"
+    return _format_weather_many(cities, places, current)
+
+
+@traced("tool.get_weather_many")
+async def _aget_weather_many(cities: list[str]) -> str:
+    import httpx
+
+    cities = _check_cities(cities)
+    if isinstance(cities, str):
+        return cities
+    current_span().set(cities=len(cities))
+    client = _async_client()
+
+    async def geocode(city: str):
+        try:
+            return await _ageocode(client, city)
+        except (httpx.HTTPError, ValueError) as e:
+            return e
+
+    places = await asyncio.gather(*(geocode(city) for city in cities))
+    await _geocode_cache.asave()
+
+    try:
+        current = await _aforecasts(client, [p for p in places if isinstance(p, dict)])
+    except (httpx.HTTPError, ValueError) as e:
+        return f"Ошибка прогноза: {e}"
+    return _format_weather_many(cities, places, current)
+
+
+get_weather_many.coroutine = _aget_weather_many
 
 
 # --- Crypto (CoinGecko) ---
 
 
+_COINGECKO_PRICE_URL = f"{COINGECKO_API_URL}/simple/price"
+_COINGECKO_COINS_URL = f"{COINGECKO_API_URL}/coins/list"
+_COIN_INDEX_KEY = "coins"
+
+# Популярные символы и названия -> id CoinGecko: резолвятся без индекса монет
+_COIN_ALIASES = {
+    "btc": "bitcoin", "биткоин": "bitcoin", "биткойн": "bitcoin",
+    "eth": "ethereum", "эфир": "ethereum", "эфириум": "ethereum",
+    "usdt": "tether", "usdc": "usd-coin", "bnb": "binancecoin", "sol": "solana",
+    "xrp": "ripple", "doge": "dogecoin", "ada": "cardano", "trx": "tron",
+    "ton": "the-open-network", "dot": "polkadot", "ltc": "litecoin", "avax": "avalanche-2",
+    "link": "chainlink", "xmr": "monero", "bch": "bitcoin-cash", "shib": "shiba-inu",
+    "atom": "cosmos", "matic": "matic-network",
+}
+
+# Курсы (в памяти, секунды) и индекс монет /coins/list (на диске, сутки)
+_price_cache = TTLCache(CRYPTO_PRICE_TTL, max_entries=5000)
+_coin_index_cache = TTLCache(CRYPTO_COIN_INDEX_TTL, max_entries=1, path=COINGECKO_COINS_FILE)
+# Одновременные запросы курсов (параллельные вызовы инструментов) — одним запросом к API
+_price_batcher = MicroBatcher(CRYPTO_BATCH_WINDOW_MS / 1000, max_keys=100)
+
+
+def _build_coin_index(coins: list[dict]) -> dict:
+    """
+    Индекс из /coins/list: id -> символ и символ -> id.
+
+    У одного символа бывает много монет (форки, wrapped-токены); выбирается
+    самый короткий id — обычно это исходная монета. Популярные символы
+    задаются явно в _COIN_ALIASES.
+    """
+    ids, symbols = {}, {}
+    for coin in coins:
+        coin_id, symbol = coin.get("id"), (coin.get("symbol") or "").lower()
+        if not coin_id:
+            continue
+        ids[coin_id] = symbol
+        best = symbols.get(symbol)
+        if symbol and (best is None or (len(coin_id), coin_id) < (len(best), best)):
+            symbols[symbol] = coin_id
+    return {"ids": ids, "symbols": symbols}
+
+
+def _resolve_coins(coins: list[str], index: dict | None) -> dict[str, str]:
+    """id CoinGecko для каждой монеты (id, символ или название); неизвестное — как есть."""
+    ids = {}
+    for coin in coins:
+        key = coin.strip().lower()
+        if key in _COIN_ALIASES:
+            ids[coin] = _COIN_ALIASES[key]
+        elif index and key not in index["ids"]:
+            ids[coin] = index["symbols"].get(key, key)
+        else:
+            ids[coin] = key
+    return ids
+
+
+def _cached_prices(ids: set[str], currencies: list[str]) -> tuple[dict[str, dict], set[str]]:
+    """
+    Курсы из кэша {id: {валюта: цена}} и id, которых в кэше не хватает.
+
+    В кэше: "id" -> есть ли монета, "id|валюта" -> цена или False (валюты нет).
+    """
+    prices, missing = {}, set()
+    for coin_id in ids:
+        exists = _price_cache.get(coin_id)
+        if exists is None:
+            missing.add(coin_id)
+            continue
+        if not exists:
+            continue
+        coin_prices = prices.setdefault(coin_id, {})
+        for currency in currencies:
+            price = _price_cache.get(f"{coin_id}|{currency}")
+            if price is None:
+                missing.add(coin_id)
+            elif price is not False:
+                coin_prices[currency] = price
+    return prices, missing
+
+
+def _store_prices(data: dict, ids: set[str], currencies: set[str]) -> dict:
+    """Закэшировать ответ /simple/price по всем запрошенным парам (включая отсутствующие)."""
+    for coin_id in ids:
+        coin_prices = data.get(coin_id)
+        _price_cache.set(coin_id, isinstance(coin_prices, dict))
+        if isinstance(coin_prices, dict):
+            for currency in currencies:
+                _price_cache.set(f"{coin_id}|{currency}", coin_prices.get(currency, False))
+    return data
+
+
+def _merge_prices(prices: dict[str, dict], data: dict, ids: set[str], currencies: list[str]) -> None:
+    for coin_id in ids:
+        if isinstance(data.get(coin_id), dict):
+            coin_prices = prices.setdefault(coin_id, {})
+            coin_prices.update({c: data[coin_id][c] for c in currencies if c in data[coin_id]})
+
+
+def _price_params(ids: set[str], currencies: set[str]) -> dict:
+    return {"ids": ",".join(sorted(ids)), "vs_currencies": ",".join(sorted(currencies))}
+
+
+def _fetch_prices(ids: set[str], currencies: set[str]) -> dict:
+    with span("http.coingecko.price", coins=len(ids)):
+        r = http_client.get(_COINGECKO_PRICE_URL, params=_price_params(ids, currencies))
+    r.raise_for_status()
+    return _store_prices(r.json(), ids, currencies)
+
+
+async def _afetch_prices(ids: set[str], currencies: set[str]) -> dict:
+    with span("http.coingecko.price", coins=len(ids)):
+        r = await _async_client().get(_COINGECKO_PRICE_URL, params=_price_params(ids, currencies))
+    r.raise_for_status()
+    return _store_prices(r.json(), ids, currencies)
+
+
+def _load_coin_index() -> dict:
+    with span("http.coingecko.coins"):
+        r = http_client.get(_COINGECKO_COINS_URL)
+    r.raise_for_status()
+    index = _build_coin_index(r.json())
+    _coin_index_cache.set(_COIN_INDEX_KEY, index)
+    return index
+
+
+async def _aload_coin_index() -> dict:
+    with span("http.coingecko.coins"):
+        r = await _async_client().get(_COINGECKO_COINS_URL)
+    r.raise_for_status()
+    index = _build_coin_index(r.json())
+    _coin_index_cache.set(_COIN_INDEX_KEY, index, save=False)
+    await _coin_index_cache.asave()
+    return index
+
+
+def _prices(ids: set[str], currencies: list[str]) -> dict[str, dict]:
+    prices, missing = _cached_prices(ids, currencies)
+    if missing:
+        data = _price_batcher.run(_fetch_prices, missing, currencies)
+        _merge_prices(prices, data, missing, currencies)
+    return prices
+
+
+async def _aprices(ids: set[str], currencies: list[str]) -> dict[str, dict]:
+    prices, missing = _cached_prices(ids, currencies)
+    if missing:
+        data = await _price_batcher.arun(_afetch_prices, missing, currencies)
+        _merge_prices(prices, data, missing, currencies)
+    return prices
+
+
+def _crypto_prices(coins: list[str], currencies: list[str]) -> tuple[dict[str, str], dict[str, dict]]:
+    """
+    id монет и курсы {id: {валюта: цена}}: из кэша, недостающие — одним запросом.
+
+    Монета, не найденная как id или известный символ, резолвится по индексу
+    /coins/list; индекс загружается, только если его нет в кэше (раз в сутки).
+
+    Raises:
+        requests.RequestException: ошибка запроса курсов.
+    """
+    import requests
+
+    index = _coin_index_cache.get(_COIN_INDEX_KEY)
+    ids = _resolve_coins(coins, index)
+    prices = _prices(set(ids.values()), currencies)
+    unresolved = [coin for coin in coins if ids[coin] not in prices]
+    if unresolved and index is None:
+        try:
+            index = _load_coin_index()
+        except (requests.RequestException, ValueError):
+            return ids, prices
+        retry = _resolve_coins(unresolved, index)
+        ids.update(retry)
+        prices.update(_prices(set(retry.values()) - set(prices), currencies))
+    return ids, prices
+
+
+async def _acrypto_prices(coins: list[str], currencies: list[str]) -> tuple[dict[str, str], dict[str, dict]]:
+    import httpx
+
+    await _coin_index_cache.aload()
+    index = _coin_index_cache.get(_COIN_INDEX_KEY)
+    ids = _resolve_coins(coins, index)
+    prices = await _aprices(set(ids.values()), currencies)
+    unresolved = [coin for coin in coins if ids[coin] not in prices]
+    if unresolved and index is None:
+        try:
+            index = await _aload_coin_index()
+        except (httpx.HTTPError, ValueError):
+            return ids, prices
+        retry = _resolve_coins(unresolved, index)
+        ids.update(retry)
+        prices.update(await _aprices(set(retry.values()) - set(prices), currencies))
+    return ids, prices
+
+
+def _format_crypto(coin: str, currency: str, ids: dict[str, str], prices: dict[str, dict]) -> str:
+    coin_id = ids[coin]
+    if coin_id not in prices:
+        return f"Монета не найдена: {coin}. Проверьте id на coingecko.com"
+    if currency.lower() not in prices[coin_id]:
+        return f"Валюта не найдена: {currency}"
+    record = {"coin": coin, "currency": currency, "price": prices[coin_id][currency.lower()]}
+    if coin_id != coin.lower():
+        record["id"] = coin_id
+    return json.dumps(record, ensure_ascii=False)
+
+
 @tool
+@traced("tool.get_crypto_price")
 def get_crypto_price(coin: str, currency: str = "usd") -> str:
-    """Получить текущий курс криптовалюты. Поддерживаются id CoinGecko (bitcoin, ethereum и т.д.).
+    """Получить текущий курс криптовалюты. Поддерживаются id CoinGecko (bitcoin, ethereum и т.д.) и символы (BTC, ETH).
 
     Args:
-        coin: ID монеты (bitcoin, ethereum, etc.)
+        coin: ID или символ монеты (bitcoin, ethereum, BTC, etc.)
         currency: Валюта (usd, eur, rub и т.д.)
     """
-    url = "https://api.coingecko.com/api/v3/simple/price"
+    import requests
+
     try:
-        r = requests.get(
-            url,
-            params={"ids": coin.lower(), "vs_currencies": currency.lower()},
-            timeout=HTTP_TIMEOUT,
-        )
-        r.raise_for_status()
-        data = r.json()
-        if coin.lower() not in data:
-            return f"Монета не найдена: {coin}. Проверьте id на coingecko.com"
-        prices = data[coin.lower()]
-        if currency.lower() not in prices:
-            return f"Валюта не найдена: {currency}"
-        price = prices[currency.lower()]
-        return json.dumps({"coin": coin, "currency": currency, "price": price}, ensure_ascii=False)
+        ids, prices = _crypto_prices([coin], [currency.lower()])
+    except requests.RequestException as e:
+        return f"Ошибка API: {e}"
+    return _format_crypto(coin, currency, ids, prices)
+
+
+@traced("tool.get_crypto_price")
+async def _aget_crypto_price(coin: str, currency: str = "usd") -> str:
+    import httpx
+
+    try:
+        ids, prices = await _acrypto_prices([coin], [currency.lower()])
+    except (httpx.HTTPError, ValueError) as e:
+        return f"Ошибка API: {e}"
+    return _format_crypto(coin, currency, ids, prices)
+
+
+get_crypto_price.coroutine = _aget_crypto_price
+
+
+def _check_crypto_args(coins: list[str], currencies: list[str] | None) -> tuple[list[str], list[str]] | str:
+    """Монеты и валюты без повторов в исходном порядке или текст ошибки."""
+    coins = list(dict.fromkeys(c.strip() for c in coins if c.strip()))
+    currencies = list(dict.fromkeys(c.strip().lower() for c in (currencies or ["usd"]) if c.strip()))
+    if not coins:
+        return "Ошибка: список монет пуст"
+    if not currencies:
+        return "Ошибка: список валют пуст"
+    if len(coins) > CRYPTO_MAX_COINS or len(currencies) > CRYPTO_MAX_COINS:
+        return f"Ошибка: не больше {CRYPTO_MAX_COINS} монет и валют за вызов"
+    return coins, currencies
+
+
+def _format_crypto_many(coins: list[str], ids: dict[str, str], prices: dict[str, dict]) -> str:
+    """JSON-список {coin, id, prices: {валюта: цена}} в порядке монет; для ненайденных — {coin, error}."""
+    out = []
+    for coin in coins:
+        if ids[coin] in prices:
+            out.append({"coin": coin, "id": ids[coin], "prices": prices[ids[coin]]})
+        else:
+            out.append({"coin": coin, "error": "Монета не найдена"})
+    return json.dumps(out, ensure_ascii=False)
+
+
+@tool
+@traced("tool.get_crypto_prices")
+def get_crypto_prices(coins: list[str], currencies: list[str] | None = None) -> str:
+    """Курсы нескольких криптовалют в нескольких валютах одним запросом. Используй вместо нескольких вызовов get_crypto_price.
+
+    Args:
+        coins: ID или символы монет (например: ["bitcoin", "ETH", "solana"])
+        currencies: Валюты (например: ["usd", "eur"]); по умолчанию ["usd"]
+    """
+    import requests
+
+    checked = _check_crypto_args(coins, currencies)
+    if isinstance(checked, str):
+        return checked
+    coins, currencies = checked
+    current_span().set(coins=len(coins), currencies=len(currencies))
+    try:
+        ids, prices = _crypto_prices(coins, currencies)
     except requests.RequestException as e:
         return f"Ошибка API: {e}"
+    return _format_crypto_many(coins, ids, prices)
+
+
+@traced("tool.get_crypto_prices")
+async def _aget_crypto_prices(coins: list[str], currencies: list[str] | None = None) -> str:
+    import httpx
+
+    checked = _check_crypto_args(coins, currencies)
+    if isinstance(checked, str):
+        return checked
+    coins, currencies = checked
+    current_span().set(coins=len(coins), currencies=len(currencies))
+    try:
+        ids, prices = await _acrypto_prices(coins, currencies)
+    except (httpx.HTTPError, ValueError) as e:
+        return f"Ошибка API: {e}"
+    return _format_crypto_many(coins, ids, prices)
+
+
+get_crypto_prices.coroutine = _aget_crypto_prices
+
+
+# --- Память: факты и задачи ---
+# agent.memory импортируется при вызове: он тянет LLM-клиент (LangChain).
+
+
+@tool
+@traced("tool.remember_fact")
+def remember_fact(key: str, value: str) -> str:
+    """Запомнить устойчивый факт о пользователе или задаче (имя, город, предпочтения, договорённости).
+    Факт с тем же ключом заменяется.
+
+    Args:
+        key: Короткий ключ (например: город, язык_отчётов)
+        value: Значение факта
+    """
+    from agent import memory
+
+    key = key.strip()
+    if not key:
+        return "Ошибка: пустой ключ."
+    if get_dry_run():
+        return f"[DRY-RUN] Будет запомнено: {key} = {value}. Запустите без --dry-run для выполнения."
+    memory.set_fact(key, value)
+    return f"Запомнено: {key} = {value}"
+
+
+@tool
+@traced("tool.forget_fact")
+def forget_fact(key: str) -> str:
+    """Забыть факт по ключу.
+
+    Args:
+        key: Ключ факта
+    """
+    from agent import memory
+
+    if get_dry_run():
+        return f"[DRY-RUN] Будет удалён факт: {key}. Запустите без --dry-run для выполнения."
+    if not memory.delete_fact(key.strip()):
+        return f"Факт не найден: {key}"
+    return f"Факт удалён: {key}"
+
+
+@tool
+@traced("tool.list_facts")
+def list_facts(query: str = "") -> str:
+    """Показать сохранённые факты и задачи. С query — только относящиеся к нему.
+
+    Args:
+        query: Тема для отбора (пусто — все)
+    """
+    from agent import memory
+
+    if query.strip():
+        facts, todos = memory.relevant_facts(query, limit=50)
+    else:
+        facts, todos = memory.get_facts()
+    return json.dumps(
+        {
+            "facts": [{"key": f["key"], "value": f.get("value", "")} for f in facts],
+            "todos": [{"id": t["id"], "text": t.get("text", ""), "status": t.get("status", "")} for t in todos],
+        },
+        ensure_ascii=False,
+    )
+
+
+@tool
+@traced("tool.add_todo")
+def add_todo(text: str) -> str:
+    """Добавить задачу в список дел пользователя.
+
+    Args:
+        text: Формулировка задачи
+    """
+    from agent import memory
+
+    if not text.strip():
+        return "Ошибка: пустая задача."
+    if get_dry_run():
+        return f"[DRY-RUN] Будет добавлена задача: {text}. Запустите без --dry-run для выполнения."
+    return f"Задача добавлена: {memory.add_todo(text.strip())}"
+
+
+@tool
+@traced("tool.update_todo")
+def update_todo(todo_id: str, status: str) -> str:
+    """Отметить задачу выполненной (done) или снова открыть (open).
+
+    Args:
+        todo_id: id задачи (например: t3)
+        status: done или open
+    """
+    from agent import memory
+
+    if status not in memory.TODO_STATUSES:
+        return f"Ошибка: статус должен быть одним из: {', '.join(memory.TODO_STATUSES)}"
+    if get_dry_run():
+        return f"[DRY-RUN] Задача {todo_id} получит статус {status}. Запустите без --dry-run для выполнения."
+    if not memory.set_todo_status(todo_id.strip(), status):
+        return f"Задача не найдена: {todo_id}"
+    return f"Задача {todo_id}: {status}"
+
+
+# Запись идёт под файловой блокировкой памяти — async-версии выносят её в поток
+
+
+async def _aremember_fact(key: str, value: str) -> str:
+    return await asyncio.to_thread(remember_fact.func, key, value)
+
+
+async def _aforget_fact(key: str) -> str:
+    return await asyncio.to_thread(forget_fact.func, key)
+
+
+async def _alist_facts(query: str = "") -> str:
+    return await asyncio.to_thread(list_facts.func, query)
+
+
+async def _aadd_todo(text: str) -> str:
+    return await asyncio.to_thread(add_todo.func, text)
+
+
+async def _aupdate_todo(todo_id: str, status: str) -> str:
+    return await asyncio.to_thread(update_todo.func, todo_id, status)
+
+
+remember_fact.coroutine = _aremember_fact
+forget_fact.coroutine = _aforget_fact
+list_facts.coroutine = _alist_facts
+add_todo.coroutine = _aadd_todo
+update_todo.coroutine = _aupdate_todo
+
+
+def tool_names() -> list[str]:
+    """Имена зарегистрированных инструментов (без импорта LangChain)."""
+    return list(_REGISTRY)
+
+
+def get_tool(name: str):
+    """Инструмент LangChain по имени; KeyError, если такого нет."""
+    return _REGISTRY[name].resolve()
 
 
 def get_all_tools() -> list:
     """Возвращает список всех инструментов для агента."""
-    return [
-        web_search,
-        http_request,
-        read_file,
-        write_file,
-        list_files,
-        execute_terminal,
-        get_weather,
-        get_crypto_price,
-    ]
+    return [entry.resolve() for entry in _REGISTRY.values()]
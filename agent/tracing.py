@@ -0,0 +1,253 @@
+"""
+Трассировка хода агента: вложенные span'ы с длительностью, размерами и токенами.
+
+Трассировщик и текущий span передаются через contextvars (как dry-run),
+поэтому span'ы инструментов, выполняемых в потоках пула или asyncio-задачах,
+получают правильного родителя. Без активного трассировщика span() и
+traced() ничего не записывают.
+"""
+
+import collections
+import contextlib
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class Span:
+    """Интервал выполнения операции."""
+
+    __slots__ = ("name", "span_id", "parent_id", "root_id", "start", "end", "thread_id", "attrs")
+
+    def __init__(self, name: str, span_id: int, parent_id: int | None, attrs: dict, root_id: int | None = None):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.root_id = span_id if root_id is None else root_id
+        self.start = time.perf_counter()
+        self.end: float | None = None
+        self.thread_id = threading.get_ident()
+        self.attrs = dict(attrs)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def set(self, **attrs) -> None:
+        """Добавить атрибуты (размеры, токены и т.п.)."""
+        self.attrs.update(attrs)
+
+
+class _NullSpan:
+    """Заглушка, когда трассировка выключена."""
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Сборщик span'ов с отчётом по ходу и экспортом в JSONL / Chrome trace.
+
+    Хранятся span'ы последних max_roots деревьев (ходов): в REPL и демоне
+    с --profile старые ходы отбрасываются, память не растёт.
+    """
+
+    def __init__(self, max_roots: int = 100):
+        self.spans: list[Span] = []
+        self.max_roots = max_roots
+        self._finished_roots: collections.deque[int] = collections.deque()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def start_span(self, name: str, attrs: dict | None = None, parent: Span | None = None) -> Span:
+        with self._lock:
+            span_id = next(self._ids)
+        if parent is None:
+            return Span(name, span_id, None, attrs or {})
+        return Span(name, span_id, parent.span_id, attrs or {}, root_id=parent.root_id)
+
+    def finish_span(self, span: Span) -> None:
+        span.end = time.perf_counter()
+        with self._lock:
+            self.spans.append(span)
+            if span.parent_id is None:
+                self._finished_roots.append(span.span_id)
+                if len(self._finished_roots) > self.max_roots:
+                    self._drop_tree(self._finished_roots.popleft())
+
+    def _drop_tree(self, root_id: int) -> None:
+        """Удалить span'ы завершённого дерева. Под self._lock."""
+        self.spans = [s for s in self.spans if s.root_id != root_id]
+
+    def roots(self) -> list[Span]:
+        """Span'ы верхнего уровня (обычно — ходы) в порядке начала."""
+        with self._lock:
+            return sorted((s for s in self.spans if s.parent_id is None), key=lambda s: s.start)
+
+    def report(self, root: Span) -> str:
+        """Текстовая разбивка span'а по вложенным операциям."""
+        with self._lock:
+            children: dict[int, list[Span]] = {}
+            for s in self.spans:
+                if s.parent_id is not None:
+                    children.setdefault(s.parent_id, []).append(s)
+        lines = []
+
+        def walk(span: Span, depth: int) -> None:
+            attrs = " ".join(f"{k}={v}" for k, v in span.attrs.items())
+            label = "  " * depth + span.name
+            lines.append(f"{label:<40} {span.duration * 1000:9.1f} ms  {attrs}".rstrip())
+            for child in sorted(children.get(span.span_id, []), key=lambda s: s.start):
+                walk(child, depth + 1)
+
+        walk(root, 0)
+        return "\n".join(lines)
+
+    def _records(self) -> list[dict]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return [
+            {
+                "name": s.name,
+                "id": s.span_id,
+                "parent": s.parent_id,
+                "start_s": round(s.start - self._origin, 6),
+                "duration_s": round(s.duration, 6),
+                "thread": s.thread_id,
+                "attrs": s.attrs,
+            }
+            for s in spans
+        ]
+
+    def export_jsonl(self, path: Path) -> None:
+        """Записать span'ы в JSONL (по span'у на строку)."""
+        with open(path, "w", encoding="utf-8") as f:
+            for rec in self._records():
+                f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+
+    def export_chrome(self, path: Path) -> None:
+        """Записать trace в формате Chrome (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        events = [
+            {
+                "name": rec["name"],
+                "ph": "X",
+                "ts": round(rec["start_s"] * 1e6, 1),
+                "dur": round(rec["duration_s"] * 1e6, 1),
+                "pid": pid,
+                "tid": rec["thread"],
+                "args": rec["attrs"],
+            }
+            for rec in self._records()
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False, default=str)
+
+
+_tracer_ctx: contextvars.ContextVar[Tracer | None] = contextvars.ContextVar("tracer", default=None)
+_span_ctx: contextvars.ContextVar[Span | None] = contextvars.ContextVar("span", default=None)
+
+
+def get_tracer() -> Tracer | None:
+    """Активный трассировщик или None."""
+    return _tracer_ctx.get()
+
+
+def set_tracer(tracer: Tracer | None) -> contextvars.Token:
+    """Установить трассировщик. Возвращает token для reset."""
+    return _tracer_ctx.set(tracer)
+
+
+def reset_tracer(token: contextvars.Token) -> None:
+    """Сбросить трассировщик к предыдущему значению."""
+    _tracer_ctx.reset(token)
+
+
+def current_span():
+    """Текущий span (или заглушка, если трассировка выключена)."""
+    if _tracer_ctx.get() is None:
+        return NULL_SPAN
+    return _span_ctx.get() or NULL_SPAN
+
+
+def start_span(name: str, **attrs) -> tuple[Tracer, Span] | None:
+    """
+    Открыть span без with-блока (для callback'ов с парой start/end).
+
+    Родитель — текущий span. Закрывается через tracer.finish_span(span).
+    Возвращает None, если трассировка выключена.
+    """
+    tracer = _tracer_ctx.get()
+    if tracer is None:
+        return None
+    return tracer, tracer.start_span(name, attrs, _span_ctx.get())
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """Записать span вокруг блока кода; вложенные span'ы становятся дочерними."""
+    tracer = _tracer_ctx.get()
+    if tracer is None:
+        yield NULL_SPAN
+        return
+    s = tracer.start_span(name, attrs, _span_ctx.get())
+    token = _span_ctx.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.set(error=type(e).__name__)
+        raise
+    finally:
+        _span_ctx.reset(token)
+        tracer.finish_span(s)
+
+
+def _size_attrs(args: tuple, kwargs: dict) -> dict:
+    size = sum(len(v) for v in (*args, *kwargs.values()) if isinstance(v, str))
+    return {"in_chars": size} if size else {}
+
+
+def _result_attrs(s, result) -> None:
+    if isinstance(result, str):
+        s.set(out_chars=len(result))
+    elif isinstance(result, (list, dict)):
+        s.set(out_items=len(result))
+
+
+def traced(name: str):
+    """Декоратор: выполнять функцию (sync или async) внутри span(name) с размерами входа/выхода."""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def awrapper(*args, **kwargs):
+                if _tracer_ctx.get() is None:
+                    return await func(*args, **kwargs)
+                with span(name, **_size_attrs(args, kwargs)) as s:
+                    result = await func(*args, **kwargs)
+                    _result_attrs(s, result)
+                    return result
+            return awrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer_ctx.get() is None:
+                return func(*args, **kwargs)
+            with span(name, **_size_attrs(args, kwargs)) as s:
+                result = func(*args, **kwargs)
+                _result_attrs(s, result)
+                return result
+        return wrapper
+
+    return decorator
@@ -0,0 +1,118 @@
+"""
+Кэш значений с TTL для инструментов (геокодинг, прогнозы, курсы).
+
+Записи живут в памяти процесса, число ограничено (LRU). С path кэш
+сохраняется в JSON-файл и переживает перезапуск: файл читается при первом
+обращении, просроченные записи при этом отбрасываются. Запись файла
+атомарная; при нескольких процессах побеждает последний записавший — для
+кэша это допустимо. В async-коде файл читается и пишется через aload/asave
+(в потоке), чтобы дисковый ввод-вывод не блокировал event loop.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from agent.storage import atomic_write
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш: ключ -> (срок годности, значение)."""
+
+    def __init__(self, ttl: float, *, max_entries: int = 1000, path: Path | None = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = Path(path) if path is not None else None
+        self._entries: OrderedDict[str, tuple[float, Any]] | None = None
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._stats = {"hits": 0, "misses": 0}
+
+    def _load(self) -> OrderedDict:
+        """Записи (с диска при первом обращении). Под self._lock."""
+        if self._entries is None:
+            self._entries = OrderedDict()
+            if self.path is not None:
+                try:
+                    data = json.loads(self.path.read_text(encoding="utf-8"))
+                except (OSError, json.JSONDecodeError):
+                    data = {}
+                now = time.time()
+                for key, item in data.items() if isinstance(data, dict) else ():
+                    if isinstance(item, list) and len(item) == 2 and item[0] > now:
+                        self._entries[key] = (item[0], item[1])
+        return self._entries
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Значение или default, если записи нет или она просрочена."""
+        with self._lock:
+            entries = self._load()
+            item = entries.get(key)
+            if item is None or item[0] <= time.time():
+                if item is not None:
+                    del entries[key]
+                self._stats["misses"] += 1
+                return default
+            entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return item[1]
+
+    def set(self, key: str, value: Any, *, ttl: float | None = None, save: bool = True) -> None:
+        """
+        Запомнить значение на ttl секунд (по умолчанию self.ttl).
+
+        save=False — не писать файл сразу (для серии записей; затем save()).
+        """
+        with self._lock:
+            entries = self._load()
+            entries[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            self._dirty = True
+        if save:
+            self.save()
+
+    def save(self) -> None:
+        """Записать кэш в файл (если задан path и есть несохранённые изменения)."""
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            payload = json.dumps(
+                {key: [expires, value] for key, (expires, value) in self._load().items()},
+                ensure_ascii=False,
+            ).encode("utf-8")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.path, payload, fsync=False)
+
+    async def aload(self) -> None:
+        """Прочитать файл в потоке, если кэш ещё не загружен (до get/set из event loop)."""
+        if self.path is not None and self._entries is None:
+            await asyncio.to_thread(self._load_locked)
+
+    async def asave(self) -> None:
+        """save() в потоке, если есть несохранённые изменения."""
+        if self.path is not None and self._dirty:
+            await asyncio.to_thread(self.save)
+
+    def _load_locked(self) -> None:
+        with self._lock:
+            self._load()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = OrderedDict()
+            self._dirty = True
+        self.save()
+
+    def stats(self) -> dict:
+        """Счётчики попаданий/промахов и текущий размер."""
+        with self._lock:
+            return {**self._stats, "entries": len(self._load())}
@@ -0,0 +1,5 @@
+"""
+Офлайн-бенчмарки агента: фейковая LLM, локальные заглушки HTTP API.
+
+Запуск: python -m benchmarks.run [--quick] [--out FILE] [--baseline FILE]
+"""
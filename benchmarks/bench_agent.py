@@ -0,0 +1,156 @@
+"""
+Overhead хода агента и латентность инструментов на локальных заглушках.
+"""
+
+import contextlib
+import gc
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from agent import agent as agent_module
+from agent import http_client, memory, tools
+from agent.agent import AgentSession, process_query
+from agent.http_body import BodyReader
+from benchmarks.fakes import ScriptedChatModel
+from benchmarks.harness import timed, value
+
+
+@contextlib.contextmanager
+def allow_stand_in(base_url: str):
+    """Разрешить http_request к локальной заглушке (SSRF-проверка запрещает 127.0.0.1)."""
+    original = tools.is_safe_url
+    with mock.patch.object(tools, "is_safe_url", lambda url: url.startswith(base_url) or original(url)):
+        yield
+
+
+@contextlib.contextmanager
+def scripted_llm(model: ScriptedChatModel):
+    """Подставить фейковую модель в агент и в генерацию резюме при компакции."""
+    with mock.patch.object(agent_module, "get_llm", return_value=model), \
+            mock.patch.object(memory, "get_llm", return_value=model):
+        yield
+
+
+def _reset_conversation() -> None:
+    for path in (memory.CONVERSATION_FILE, memory.MEMORY_FILE):
+        path.unlink(missing_ok=True)
+
+
+def run(server, quick: bool) -> dict:
+    repeat = 10 if quick else 50
+    results = {}
+
+    # Overhead хода без инструментов: сессия vs пересборка всего на каждый запрос
+    with scripted_llm(ScriptedChatModel()):
+        _reset_conversation()
+        session = AgentSession()
+        results["turn.session_no_tools"] = timed(lambda: session.ask("Привет"), repeat=repeat)
+        _reset_conversation()
+        results["turn.process_query_no_tools"] = timed(lambda: process_query("Привет"), repeat=repeat)
+
+    # Ход с тремя параллельными вызовами инструментов
+    calls = [
+        {"name": "get_weather", "args": {"city": "Berlin"}},
+        {"name": "get_crypto_price", "args": {"coin": "bitcoin", "currency": "usd"}},
+        {"name": "http_request", "args": {"url": f"{server.base_url}/echo?size=4096"}},
+    ]
+    with scripted_llm(ScriptedChatModel(tool_calls=calls)), allow_stand_in(server.base_url):
+        _reset_conversation()
+        session = AgentSession()
+        results["turn.session_3_tools"] = timed(lambda: session.ask("Погода, курс и запрос"), repeat=repeat)
+
+    # Латентность отдельных инструментов (соединения к заглушке берутся из общего пула)
+    http_client.reset_stats()
+    with allow_stand_in(server.base_url):
+        results["tool.get_weather"] = timed(lambda: tools.get_weather.invoke({"city": "Berlin"}), repeat=repeat)
+        results["tool.get_crypto_price"] = timed(
+            lambda: tools.get_crypto_price.invoke({"coin": "bitcoin", "currency": "usd"}), repeat=repeat
+        )
+        for size in (1024, 100 * 1024):
+            url = f"{server.base_url}/echo?size={size}"
+            results[f"tool.http_request.{size // 1024}kb"] = timed(
+                lambda url=url: tools.http_request.invoke({"url": url}), repeat=repeat
+            )
+    pool = http_client.stats()
+    # Меньше — лучше: доля запросов, открывших новое соединение
+    results["http.new_connection_rate"] = value(1 - pool["reuse_rate"], "ratio")
+
+    # Погода без кэшей: один город и десять городов одним вызовом; запросов к API
+    # на десять городов с известными координатами (прогноз истёк)
+    cities = [f"Город {i}" for i in range(10)]
+
+    def cold(fn):
+        def call():
+            tools._geocode_cache.clear()
+            tools._forecast_cache.clear()
+            return fn()
+        return call
+
+    results["tool.get_weather.cold"] = timed(cold(lambda: tools.get_weather.invoke({"city": "Berlin"})), repeat=repeat)
+    results["tool.get_weather_many.10_cold"] = timed(
+        cold(lambda: tools.get_weather_many.invoke({"cities": cities})), repeat=repeat
+    )
+    results["tool.get_weather_many.10_warm"] = timed(
+        lambda: tools.get_weather_many.invoke({"cities": cities}), repeat=repeat
+    )
+    tools._forecast_cache.clear()
+    before = http_client.stats()["requests"]
+    tools.get_weather_many.invoke({"cities": cities})
+    results["tool.get_weather_many.10_upstream_calls"] = value(http_client.stats()["requests"] - before, "count")
+
+    # Курсы без кэша: десять монет одним вызовом и десять параллельных вызовов
+    # (как из исполнителя) — сколько запросов к API после микро-батчинга
+    coins = [f"coin-{i}" for i in range(10)]
+    results["tool.get_crypto_prices.10_cold"] = timed(
+        lambda: (tools._price_cache.clear(), tools.get_crypto_prices.invoke({"coins": coins})), repeat=repeat
+    )
+    tools._price_cache.clear()
+    before = http_client.stats()["requests"]
+    with ThreadPoolExecutor(max_workers=len(coins)) as pool:
+        list(pool.map(lambda coin: tools.get_crypto_price.invoke({"coin": coin}), coins))
+    results["tool.get_crypto_price.10_parallel_upstream_calls"] = value(
+        http_client.stats()["requests"] - before, "count"
+    )
+
+    # Тело вдвое больше лимита: чтение должно остановиться на лимите
+    with allow_stand_in(server.base_url):
+        for mb in (1, 10, 100):
+            url = f"{server.base_url}/echo?size={2 * mb << 20}"
+            with mock.patch.object(tools, "HTTP_MAX_BYTES", mb << 20):
+                results[f"tool.http_request.limit_{mb}mb"] = timed(
+                    lambda url=url: tools.http_request.invoke({"url": url}), repeat=3 if quick else 5
+                )
+
+    # Чтение тела в буфер без сети: чанки по 64 КБ до лимита
+    chunk = b"x" * (64 << 10)
+    for mb in (1, 10, 100):
+        limit = mb << 20
+        chunks = [chunk] * (2 * limit // len(chunk))
+
+        def read(limit=limit, chunks=chunks):
+            reader = BodyReader(limit)
+            for c in chunks:
+                if not reader.feed(c):
+                    break
+
+        results[f"http.body_read.{mb}mb"] = timed(read, repeat=5 if quick else 20)
+
+    # Рост памяти процесса в REPL: сессия на много ходов (с компакциями)
+    turns = 50 if quick else 300
+    with scripted_llm(ScriptedChatModel()):
+        _reset_conversation()
+        session = AgentSession()
+        for _ in range(20):
+            session.ask("Разогрев")
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(turns):
+            session.ask(f"Запрос номер {i}")
+        gc.collect()
+        after, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    results["repl.memory_growth_per_turn"] = value((after - before) / turns, "bytes")
+    results["repl.memory_peak"] = value(peak, "bytes")
+    return results
@@ -0,0 +1,110 @@
+"""
+Стоимость load_conversation и compact_if_needed на длинных conversation.jsonl,
+поиска по архиву (recall) на длинном archive.jsonl.
+"""
+
+import json
+import random
+import shutil
+import time
+from unittest import mock
+
+from agent import archive, memory, recall
+from benchmarks.fakes import ScriptedChatModel
+from benchmarks.harness import time_stats
+
+
+def _write_conversation(lines: int) -> None:
+    """Сгенерировать conversation.jsonl из lines сообщений."""
+    memory.CONVERSATION_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(memory.CONVERSATION_FILE, "w", encoding="utf-8") as f:
+        for i in range(lines):
+            role = "user" if i % 2 == 0 else "assistant"
+            content = f"Сообщение {i}: " + "текст диалога " * 8
+            f.write(json.dumps({"role": role, "content": content, "tokens": 40, "ts": "2025-01-01T00:00:00+00:00"},
+                               ensure_ascii=False) + "\n")
+    memory.MEMORY_FILE.unlink(missing_ok=True)
+
+
+def _write_archive(lines: int) -> list[str]:
+    """Архив из lines реплик с частотами слов по Ципфу; возвращает словарь."""
+    rng = random.Random(lines)
+    vocab = ["".join(rng.choice("абвгдежзиклмнопрстуфхцчшэюя") for _ in range(rng.randint(4, 10)))
+             for _ in range(20_000)]
+    weights = [1 / (i + 1) for i in range(len(vocab))]
+    root = memory.archive_dir()
+    shutil.rmtree(root, ignore_errors=True)
+    for start in range(0, lines, 1000):
+        batch = [{"role": "user", "content": " ".join(rng.choices(vocab, weights, k=25))}
+                 for _ in range(min(1000, lines - start))]
+        archive.append(root, batch, segment_bytes=memory.MEMORY_ARCHIVE_SEGMENT_KB * 1024, codec="auto")
+    recall._indexes.clear()
+    return vocab
+
+
+def _bench_recall(lines: int, repeat: int) -> dict:
+    vocab = _write_archive(lines)
+    rng = random.Random(0)
+    weights = [1 / (i + 1) for i in range(len(vocab))]
+    start = time.perf_counter()
+    recall.search("прогрев индекса", k=3)
+    build = time.perf_counter() - start
+    samples = []
+    for _ in range(repeat * 20):
+        query = " ".join(rng.choices(vocab, weights, k=6))
+        start = time.perf_counter()
+        recall.search(query, k=3)
+        samples.append(time.perf_counter() - start)
+    return {"index_build": time_stats([build]), "search": time_stats(samples)}
+
+
+def _measure(fn, repeat: int, *, cold: bool = False) -> dict:
+    """Время fn; cold — со сброшенным кэшем разобранных сообщений."""
+    samples = []
+    for _ in range(repeat):
+        if cold:
+            memory._cache.clear()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return time_stats(samples)
+
+
+def run(server, quick: bool) -> dict:
+    sizes = (1_000, 10_000) if quick else (1_000, 10_000, 100_000)
+    repeat = 3 if quick else 5
+    results = {}
+    model = ScriptedChatModel()
+    for lines in sizes:
+        label = f"{lines // 1000}k"
+        _write_conversation(lines)
+        results[f"memory.load_conversation.{label}"] = _measure(memory.load_conversation, repeat)
+        results[f"memory.load_conversation_cold.{label}"] = _measure(memory.load_conversation, repeat, cold=True)
+        results[f"memory.load_last_100.{label}"] = _measure(lambda: memory.load_conversation(last=100), repeat, cold=True)
+
+        # Компакция: файл пересоздаётся перед каждым замером, резюме — от фейковой модели
+        samples = []
+        with mock.patch.object(memory, "get_llm", return_value=model), \
+                mock.patch.object(memory, "MEMORY_MAX_MESSAGES", lines), \
+                mock.patch.object(memory, "MEMORY_MAX_SIZE_KB", 1 << 30):
+            for _ in range(repeat):
+                _write_conversation(lines)
+                start = time.perf_counter()
+                memory.compact_if_needed()
+                samples.append(time.perf_counter() - start)
+        results[f"memory.compact_if_needed.{label}"] = time_stats(samples)
+
+        # Проверка «нужна ли компакция» после каждого хода, когда она не нужна
+        _write_conversation(lines)
+        samples = []
+        with mock.patch.object(memory, "MEMORY_MAX_MESSAGES", lines * 10), \
+                mock.patch.object(memory, "MEMORY_MAX_SIZE_KB", 1 << 30):
+            for _ in range(repeat):
+                start = time.perf_counter()
+                memory.compact_if_needed()
+                samples.append(time.perf_counter() - start)
+        results[f"memory.compact_check_only.{label}"] = time_stats(samples)
+
+        for name, stats in _bench_recall(lines, repeat).items():
+            results[f"recall.{name}.{label}"] = stats
+    return results
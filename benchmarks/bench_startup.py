@@ -0,0 +1,66 @@
+"""
+Холодный старт CLI: время процесса и разбор -X importtime.
+
+Защита от регрессий ленивых импортов: --help и импорт agent.run
+не должны загружать LangChain, OpenAI и HTTP-клиенты.
+"""
+
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.harness import time_stats, value
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_PREFIXES = ("langchain", "langgraph", "langsmith", "openai", "requests", "httpx", "ddgs", "duckduckgo_search")
+
+
+def import_times(args: list[str]) -> dict[str, int]:
+    """
+    Запустить python -X importtime <args> и вернуть {модуль: cumulative мкс}.
+
+    Вывод -X importtime идёт в stderr строками
+    "import time: self [us] | cumulative | <отступ>имя".
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT, capture_output=True, text=True, timeout=120,
+    )
+    result = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        result[parts[2].strip()] = int(parts[1])
+    return result
+
+
+def heavy_modules(times: dict[str, int]) -> list[str]:
+    """Тяжёлые модули верхнего уровня среди импортированных."""
+    return sorted({name.split(".")[0] for name in times if name.startswith(HEAVY_PREFIXES)})
+
+
+def _wall(args: list[str], repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, timeout=120)
+        samples.append(time.perf_counter() - start)
+    return time_stats(samples)
+
+
+def run(server, quick: bool) -> dict:
+    repeat = 3 if quick else 10
+    results = {
+        "startup.help_wall": _wall(["-m", "agent.run", "--help"], repeat),
+        "startup.import_agent_agent_wall": _wall(["-c", "import agent.agent"], repeat),
+    }
+    help_times = import_times(["-m", "agent.run", "--help"])
+    results["startup.help_heavy_modules"] = value(len(heavy_modules(help_times)), "modules")
+    for module in ("agent.run", "agent.tools", "agent.memory", "agent.agent"):
+        times = import_times(["-c", f"import {module}"])
+        results[f"startup.importtime.{module}"] = value(times.get(module, 0) / 1e6, "s")
+    return results
@@ -0,0 +1,132 @@
+"""
+Детерминированная фейковая LLM и локальные заглушки Open-Meteo, CoinGecko и http_request.
+"""
+
+import itertools
+import json
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Модель по сценарию: на новый запрос пользователя выдаёт tool_calls
+    (если заданы), после ответов инструментов — финальный ответ.
+
+    Сценарий одинаков для каждого хода, поэтому модель подходит для
+    многоходовых замеров. Usage не отдаётся — замеряется только overhead агента.
+    """
+
+    tool_calls: list[dict] = []
+    answer: str = "Готово."
+    summary: str = "Краткое резюме."
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        last = messages[-1] if messages else None
+        if isinstance(last, ToolMessage) or not self.tool_calls:
+            msg = AIMessage(content=self.answer)
+        else:
+            msg = AIMessage(content="", tool_calls=[
+                {"name": c["name"], "args": c["args"], "id": f"call_{next(_ids)}"}
+                for c in self.tool_calls
+            ])
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    def invoke(self, input, config=None, **kwargs):
+        # Строковый промпт — это запрос резюме из memory._generate_summary
+        if isinstance(input, str):
+            return AIMessage(content=self.summary)
+        return super().invoke(input, config, **kwargs)
+
+
+_ids = itertools.count(1)
+
+
+# Тело /echo отдаётся блоками: мегабайтные ответы не собираются в памяти целиком
+_ECHO_BLOCK = b"x" * (1 << 20)
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Ответы в форматах Open-Meteo / CoinGecko и echo-тело заданного размера."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящих API
+    disable_nagle_algorithm = True  # заголовки и тело уходят без задержки ACK
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, data) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == "/v1/search":
+            name = params.get("name", ["City"])[0]
+            # Разные города — разные координаты (детерминированно по названию)
+            lat = 40 + zlib.crc32(name.encode("utf-8")) % 2000 / 100
+            self._json({"results": [{"name": name, "latitude": lat, "longitude": 13.41, "population": 1_000_000}]})
+        elif url.path == "/v1/forecast":
+            # Несколько точек через запятую — список, как у Open-Meteo
+            points = params.get("latitude", ["0"])[0].split(",")
+            items = [{"current_weather": {"temperature": 12.3, "windspeed": 4.5, "weathercode": 1}} for _ in points]
+            self._json(items if len(items) > 1 else items[0])
+        elif url.path == "/api/v3/simple/price":
+            ids = params.get("ids", ["bitcoin"])[0].split(",")
+            currencies = params.get("vs_currencies", ["usd"])[0].split(",")
+            self._json({coin: {cur: 50_000.0 for cur in currencies} for coin in ids})
+        elif url.path == "/api/v3/coins/list":
+            self._json([{"id": f"coin-{i}", "symbol": f"c{i}", "name": f"Coin {i}"} for i in range(1000)])
+        elif url.path == "/echo":
+            size = int(params.get("size", ["1024"])[0])
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            try:
+                for start in range(0, size, len(_ECHO_BLOCK)):
+                    self.wfile.write(_ECHO_BLOCK[:size - start])
+            except ConnectionError:
+                self.close_connection = True  # клиент дочитал до лимита и закрыл соединение
+        else:
+            self.send_error(404)
+
+
+class StandInServer:
+    """Локальный HTTP-сервер в фоновом потоке; base_url — http://127.0.0.1:<port>."""
+
+    def __init__(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "StandInServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,111 @@
+"""
+Замеры, статистика, формат результатов и сравнение с базовым прогоном.
+
+Формат файла результатов:
+    {"meta": {...}, "results": {"<имя>": {"unit": "s", "n": 20, "median": ..., ...}}}
+Для метрик времени сравнивается median, для остальных — value.
+"""
+
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+def timed(fn, *, repeat: int, warmup: int = 1) -> dict:
+    """Выполнить fn repeat раз (после warmup) и вернуть статистику по времени в секундах."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return time_stats(samples)
+
+
+def time_stats(samples: list[float]) -> dict:
+    """Статистика выборки времён."""
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "unit": "s",
+        "n": len(samples),
+        "min": round(ordered[0], 6),
+        "median": round(statistics.median(ordered), 6),
+        "p95": round(p95, 6),
+        "mean": round(statistics.fmean(ordered), 6),
+    }
+
+
+def value(v: float, unit: str) -> dict:
+    """Одиночная метрика (байты, штуки и т.п.)."""
+    return {"unit": unit, "value": round(v, 3)}
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5,
+            cwd=Path(__file__).resolve().parent,
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def meta() -> dict:
+    """Окружение прогона — чтобы понимать, сравнимы ли два файла."""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def save(results: dict, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta(), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+def load(path: Path) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def _metric(entry: dict) -> float:
+    return entry["median"] if "median" in entry else entry["value"]
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.10) -> tuple[str, list[str]]:
+    """
+    Сравнить результаты с базовыми.
+
+    Returns:
+        (таблица для печати, имена метрик, ухудшившихся больше чем на threshold)
+    """
+    lines = [f"{'метрика':<44} {'база':>12} {'сейчас':>12} {'изм.':>8}"]
+    regressions = []
+    for name in sorted(current):
+        if name not in baseline:
+            continue
+        base, cur = _metric(baseline[name]), _metric(current[name])
+        if base <= 0:
+            continue
+        ratio = cur / base
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  ▲"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            mark = "  ▼"
+        lines.append(f"{name:<44} {base:>12.6g} {cur:>12.6g} {ratio - 1:>+7.1%}{mark}")
+    return "\n".join(lines), regressions
@@ -0,0 +1,80 @@
+"""
+Точка входа бенчмарков.
+
+    python -m benchmarks.run                      # полный прогон, JSON в benchmarks/results/
+    python -m benchmarks.run --quick              # малые размеры, для быстрой проверки
+    python -m benchmarks.run --baseline old.json  # сравнение; код 1 при регрессии > --threshold
+
+Сеть и OpenAI не нужны: LLM — ScriptedChatModel, внешние API — локальный StandInServer.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.fakes import StandInServer
+from benchmarks.harness import compare, load, save
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Модули-наборы: у каждого run(server, quick) -> {имя метрики: результат}
+SUITES = ("benchmarks.bench_startup", "benchmarks.bench_agent", "benchmarks.bench_memory")
+
+
+def _isolate_env(tmp: Path, base_url: str) -> None:
+    """
+    Изолировать память/workspace и направить API на заглушку.
+
+    Вызывается до импорта модулей agent: пути и URL читаются из окружения
+    при импорте agent.config.
+    """
+    os.environ["AGENT_MEMORY_DIR"] = str(tmp / "memory")
+    os.environ["AGENT_WORKSPACE"] = str(tmp / "workspace")
+    os.environ["AGENT_OPEN_METEO_GEOCODE_URL"] = f"{base_url}/v1/search"
+    os.environ["AGENT_OPEN_METEO_FORECAST_URL"] = f"{base_url}/v1/forecast"
+    os.environ["AGENT_COINGECKO_API_URL"] = f"{base_url}/api/v3"
+    os.environ["AGENT_RESPONSE_CACHE"] = "0"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарки агента")
+    parser.add_argument("--quick", action="store_true", help="Малые размеры и меньше повторов")
+    parser.add_argument("--out", type=Path, help="Файл результатов (по умолчанию benchmarks/results/<время>.json)")
+    parser.add_argument("--baseline", type=Path, help="Результаты для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Допустимое ухудшение (доля, по умолчанию 0.10)")
+    parser.add_argument("--suite", action="append", help="Запустить только указанные наборы (startup, agent, memory)")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="agent-bench-") as tmp, StandInServer() as server:
+        _isolate_env(Path(tmp), server.base_url)
+        for name in SUITES:
+            short = name.rsplit(".", 1)[-1].removeprefix("bench_")
+            if args.suite and short not in args.suite:
+                continue
+            print(f"[bench] {short}...", file=sys.stderr)
+            suite = importlib.import_module(name)
+            results.update(suite.run(server, quick=args.quick))
+
+    out = args.out or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    save(results, out)
+    for name, entry in sorted(results.items()):
+        shown = entry["median"] if "median" in entry else entry["value"]
+        print(f"{name:<44} {shown:>12.6g} {entry['unit']}")
+    print(f"\nРезультаты: {out}")
+
+    if args.baseline:
+        table, regressions = compare(results, load(args.baseline), args.threshold)
+        print(f"\nСравнение с {args.baseline}:\n{table}")
+        if regressions:
+            print(f"\nРегрессии (> {args.threshold:.0%}): {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,38 @@ from pathlib import Path
 
 import pytest
 
+from agent.memory import flush_compaction
+
+
+@pytest.fixture(autouse=True)
+def tmp_http_cache(monkeypatch, tmp_path):
+    """HTTP-кэш http_request — во временном каталоге теста, а не в memory/."""
+    root = tmp_path / "http_cache"
+    monkeypatch.setattr("agent.http_cache.HTTP_CACHE_DIR", root)
+    return root
+
+
+@pytest.fixture(autouse=True)
+def tmp_weather_cache(monkeypatch, tmp_path):
+    """Кэши геокодинга и погоды — пустые в каждом тесте, файл геокодинга — во временном каталоге."""
+    from agent import tools
+    from agent.ttl_cache import TTLCache
+
+    monkeypatch.setattr(tools, "_geocode_cache", TTLCache(3600, path=tmp_path / "geocode_cache.json"))
+    monkeypatch.setattr(tools, "_forecast_cache", TTLCache(300))
+    return tmp_path / "geocode_cache.json"
+
+
+@pytest.fixture(autouse=True)
+def tmp_crypto_cache(monkeypatch, tmp_path):
+    """Кэш курсов и индекс монет — пустые в каждом тесте, файл индекса — во временном каталоге."""
+    from agent import tools
+    from agent.ttl_cache import TTLCache
+
+    monkeypatch.setattr(tools, "_price_cache", TTLCache(30))
+    monkeypatch.setattr(tools, "_coin_index_cache", TTLCache(3600, max_entries=1, path=tmp_path / "coins.json"))
+    return tmp_path / "coins.json"
+
 
 @pytest.fixture
 def tmp_workspace(monkeypatch):
@@ -28,9 +60,12 @@ def tmp_memory(monkeypatch):
         monkeypatch.setattr("agent.config.MEMORY_DIR", root)
         monkeypatch.setattr("agent.config.CONVERSATION_FILE", root / "conversation.jsonl")
         monkeypatch.setattr("agent.config.MEMORY_FILE", root / "memory.json")
+        monkeypatch.setattr("agent.config.USAGE_FILE", root / "usage.jsonl")
         monkeypatch.setattr("agent.memory.CONVERSATION_FILE", root / "conversation.jsonl")
         monkeypatch.setattr("agent.memory.MEMORY_FILE", root / "memory.json")
+        monkeypatch.setattr("agent.memory.USAGE_FILE", root / "usage.jsonl")
         yield root
+        flush_compaction()
 
 
 @pytest.fixture
@@ -0,0 +1,153 @@
+"""
+Тесты AgentSession: переиспользование LLM/графа и синхронизация с памятью.
+"""
+
+import asyncio
+import json
+import re
+from collections.abc import Iterator
+from unittest.mock import MagicMock
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from agent.agent import AgentSession, aprocess_query
+from agent.memory import append_message, load_conversation
+
+
+def _mock_agent(mocker, answers):
+    """Подменить create_agent: граф отвечает по списку answers и запоминает входы."""
+    calls = []
+    it = iter(answers)
+
+    def invoke(inputs):
+        calls.append(inputs["messages"])
+        return {"messages": [AIMessage(content=next(it))]}
+
+    agent = MagicMock()
+    agent.invoke = invoke
+    create = mocker.patch("agent.agent.create_agent", return_value=agent)
+    get_llm = mocker.patch("agent.agent.get_llm", return_value=MagicMock())
+    return calls, create, get_llm
+
+
+def test_session_builds_agent_once(tmp_memory, mocker):
+    """LLM и граф создаются один раз на сессию, а не на каждый запрос."""
+    calls, create, get_llm = _mock_agent(mocker, ["Ответ 1", "Ответ 2"])
+    session = AgentSession()
+    assert session.ask("Первый") == "Ответ 1"
+    assert session.ask("Второй") == "Ответ 2"
+    assert create.call_count == 1
+    assert get_llm.call_count == 1
+    # Второй ход видит первый обмен репликами
+    contents = [m.content for m in calls[1]]
+    assert "Первый" in contents and "Ответ 1" in contents
+    assert len(load_conversation()) == 4
+
+
+def test_session_picks_up_external_changes(tmp_memory, mocker):
+    """Изменения conversation.jsonl извне попадают в следующий ход."""
+    calls, _, _ = _mock_agent(mocker, ["Ок", "Ок"])
+    session = AgentSession()
+    session.ask("Раз")
+    append_message("user", "Внешняя реплика")
+    session.ask("Два")
+    contents = [m.content for m in calls[1]]
+    assert "Внешняя реплика" in contents
+    assert len(session.conversation) == 5
+
+
+def test_aprocess_query(tmp_memory, mocker):
+    """aprocess_query использует ainvoke и сохраняет обмен в память."""
+    agent = MagicMock()
+
+    async def ainvoke(inputs):
+        return {"messages": [AIMessage(content="Асинхронный ответ")]}
+
+    agent.ainvoke = ainvoke
+    mocker.patch("agent.agent.create_agent", return_value=agent)
+    mocker.patch("agent.agent.get_llm", return_value=MagicMock())
+
+    assert asyncio.run(aprocess_query("Привет")) == "Асинхронный ответ"
+    assert [m["role"] for m in load_conversation()] == ["user", "assistant"]
+
+
+class _StreamingFakeModel(BaseChatModel):
+    """Фейковая модель: стримит content по словам, tool_calls — одним чанком."""
+
+    messages: Iterator
+
+    @property
+    def _llm_type(self) -> str:
+        return "streaming-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=next(self.messages))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        msg = next(self.messages)
+        if msg.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                    for i, c in enumerate(msg.tool_calls)
+                ],
+            ))
+            return
+        for token in re.split(r"(\s)", msg.content):
+            if token:
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+                if run_manager:
+                    run_manager.on_llm_new_token(token, chunk=chunk)
+                yield chunk
+
+
+def test_stream_yields_tokens_and_persists_answer(tmp_memory, mocker):
+    """stream отдаёт ответ по частям, в память пишется полный текст."""
+    model = _StreamingFakeModel(messages=iter([AIMessage(content="Итог: всё хорошо")]))
+    mocker.patch("agent.agent.get_llm", return_value=model)
+    session = AgentSession()
+    tokens = list(session.stream("Как дела?"))
+    assert len(tokens) > 1
+    assert "".join(tokens) == "Итог: всё хорошо"
+    assert load_conversation()[-1]["content"] == "Итог: всё хорошо"
+    assert 0 <= session.last_stats["ttft_s"] <= session.last_stats["total_s"]
+
+
+def test_stream_verbose_reports_tool_calls(tmp_memory, tmp_workspace, mocker, capsys):
+    """--verbose: строки прогресса для вызовов инструментов."""
+    model = _StreamingFakeModel(messages=iter([
+        AIMessage(content="", tool_calls=[{"name": "list_files", "args": {"path": "."}, "id": "c1"}]),
+        AIMessage(content="Папка пуста"),
+    ]))
+    mocker.patch("agent.agent.get_llm", return_value=model)
+    session = AgentSession(verbose=True)
+    assert "".join(session.stream("Что в папке?")) == "Папка пуста"
+    out = capsys.readouterr().out
+    assert "[tool] → list_files" in out
+    assert "[tool] ← list_files" in out
+
+
+def test_background_compaction_summary_used_next_turn(tmp_memory, mocker):
+    """Ход не ждёт компакции; следующий ход видит новый summary и укороченную историю."""
+    from agent import memory
+
+    calls, _, _ = _mock_agent(mocker, [f"Ответ {i}" for i in range(8)])
+    summarizer = MagicMock()
+    summarizer.invoke.return_value = AIMessage(content="Сводка прошлых ходов")
+    mocker.patch.object(memory, "get_llm", return_value=summarizer)
+    mocker.patch.object(memory, "MEMORY_MAX_MESSAGES", 6)
+    mocker.patch.object(memory, "MEMORY_KEEP_RECENT", 2)
+    session = AgentSession()
+    for i in range(3):
+        session.ask(f"Вопрос {i}")
+    assert memory.flush_compaction(5)
+    session.ask("Ещё")
+    contents = [m.content for m in calls[-1]]
+    assert any("Сводка прошлых ходов" in c for c in contents)
+    assert "Вопрос 0" not in contents
@@ -0,0 +1,90 @@
+"""
+Тесты сегментированного архива (archive.py).
+"""
+
+import json
+
+import pytest
+from pytest_mock import MockerFixture
+
+from agent import archive, memory
+
+
+def _messages(start: int, count: int) -> list[dict]:
+    return [
+        {"role": "user", "content": f"сообщение {i} " + "x" * 40, "ts": f"2025-01-{i // 10 + 1:02d}T00:00:{i % 10:02d}+00:00"}
+        for i in range(start, start + count)
+    ]
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_rotation_and_streaming_read(tmp_path, codec):
+    """Активный сегмент запечатывается по размеру; чтение отдаёт всё по порядку."""
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    root = tmp_path / "archive"
+    for start in range(0, 100, 10):
+        archive.append(root, _messages(start, 10), segment_bytes=2000, codec=codec)
+    manifest = archive.load_manifest(root)
+    sealed = manifest["segments"]
+    assert len(sealed) >= 2
+    assert all((root / s["file"]).exists() and s["codec"] == codec for s in sealed)
+    assert all(s["bytes"] < s["raw_bytes"] for s in sealed)
+    assert not (root / archive.segment_name(sealed[0]["seq"])).exists()
+    assert sum(s["messages"] for s in sealed) + len(_read_active(root, manifest)) == 100
+    assert sealed[0]["from_ts"] == "2025-01-01T00:00:00+00:00"
+    assert [m["content"] for m in archive.iter_messages(root)] == [m["content"] for m in _messages(0, 100)]
+
+
+def _read_active(root, manifest) -> list[str]:
+    path = root / archive.segment_name(manifest["active"])
+    return path.read_text("utf-8").splitlines() if path.exists() else []
+
+
+def test_time_filter_skips_unrelated_segments(tmp_path, mocker: MockerFixture):
+    """Фильтр по времени не распаковывает сегменты вне диапазона."""
+    root = tmp_path / "archive"
+    for start in range(0, 100, 10):
+        archive.append(root, _messages(start, 10), segment_bytes=700, codec="gzip")
+    sealed = archive.load_manifest(root)["segments"]
+    assert len(sealed) > 3
+    opened = mocker.spy(archive, "_open_sealed")
+    got = list(archive.iter_messages(root, since="2025-01-05T00:00:00+00:00", until="2025-01-05T23:59:59+00:00"))
+    assert [m["content"].split()[1] for m in got] == [str(i) for i in range(40, 50)]
+    touched = [s for s in sealed if s["to_ts"] >= "2025-01-05" and s["from_ts"] <= "2025-01-05T23:59:59+00:00"]
+    assert opened.call_count == len(touched) < len(sealed)
+
+
+def test_legacy_archive_migrated_and_crash_leftovers_removed(tmp_path):
+    """Старый archive.jsonl переносится в первый сегмент; несжатая копия запечатанного удаляется."""
+    legacy = tmp_path / "archive.jsonl"
+    legacy.write_text("".join(json.dumps(m, ensure_ascii=False) + "\n" for m in _messages(0, 3)), encoding="utf-8")
+    root = tmp_path / "archive"
+    archive.append(root, _messages(3, 2), segment_bytes=10**6, codec="gzip")
+    assert not legacy.exists()
+    assert len(list(archive.iter_messages(root))) == 5
+
+    manifest = archive.load_manifest(root)
+    archive.seal(root, manifest, codec="gzip")
+    # Сбой после записи манифеста: несжатый файл остался рядом со сжатым
+    (root / archive.segment_name(1)).write_text("мусор\n", encoding="utf-8")
+    archive.append(root, _messages(5, 1), segment_bytes=10**6, codec="gzip")
+    assert not (root / archive.segment_name(1)).exists()
+    assert len(list(archive.iter_messages(root))) == 6
+
+
+def test_compaction_keeps_everything_in_archive(tmp_memory, mocker: MockerFixture):
+    """После многих компакций каждое вытесненное сообщение есть в архиве."""
+    llm = mocker.MagicMock()
+    llm.invoke.return_value = mocker.MagicMock(content="Резюме.")
+    mocker.patch.object(memory, "get_llm", return_value=llm)
+    mocker.patch.object(memory, "MEMORY_MAX_MESSAGES", 10)
+    mocker.patch.object(memory, "MEMORY_KEEP_RECENT", 2)
+    mocker.patch.object(memory, "MEMORY_ARCHIVE_SEGMENT_KB", 1)
+    for i in range(60):
+        memory.append_message("user", f"msg {i} " + "y" * 30)
+        memory.compact_if_needed()
+    archived = [m["content"].split()[1] for m in memory.iter_archive()]
+    live = [m["content"].split()[1] for m in memory.load_conversation()]
+    assert archived + live == [str(i) for i in range(60)]
+    assert archive.load_manifest(memory.archive_dir())["segments"]
@@ -0,0 +1,130 @@
+"""
+Тесты пакетного режима (--batch).
+"""
+
+import io
+import json
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent import memory, recall
+from agent.agent import AgentSession
+from agent.batch import load_tasks, run_batch
+from agent.memory import load_conversation
+
+
+@pytest.fixture
+def echo_session(tmp_memory, mocker):
+    """Сессия, где граф отвечает "echo:<запрос>" и видит историю; задача "slow" идёт дольше."""
+    seen = []
+    seen_facts = []
+
+    def invoke(inputs):
+        msgs = inputs["messages"]
+        query = msgs[-1].content
+        seen.append([m.content for m in msgs if isinstance(m, HumanMessage)])
+        if query == "slow":
+            time.sleep(0.2)
+        if query == "boom":
+            raise RuntimeError("сбой")
+        if query == "stop":
+            raise KeyboardInterrupt
+        if query.startswith("remember "):
+            memory.set_fact("задача", query)
+        seen_facts.append([m.content for m in msgs if "Известные факты" in str(m.content)])
+        return {"messages": [AIMessage(content=f"echo:{query}")]}
+
+    agent = MagicMock()
+    agent.invoke = invoke
+    mocker.patch("agent.agent.create_agent", return_value=agent)
+    mocker.patch("agent.agent.get_llm", return_value=MagicMock())
+    session = AgentSession()
+    session.seen = seen
+    session.seen_facts = seen_facts
+    return session
+
+
+def _tasks(*texts):
+    return [{"id": str(i), "task": t} for i, t in enumerate(texts)]
+
+
+def _results(buf):
+    return [json.loads(line) for line in buf.getvalue().splitlines()]
+
+
+def test_load_tasks(tmp_path):
+    """id по умолчанию — номер строки, поддерживается поле query."""
+    f = tmp_path / "tasks.jsonl"
+    f.write_text('{"id": "a", "task": "x"}\n\n{"query": "y"}\n', encoding="utf-8")
+    assert load_tasks(f) == [{"id": "a", "task": "x"}, {"id": "3", "task": "y"}]
+
+
+def test_batch_input_order_and_isolation(echo_session):
+    """Результаты в порядке входа; задачи не видят друг друга и не пишут в память."""
+    out = io.StringIO()
+    stats = run_batch(echo_session, _tasks("slow", "b", "c"), out, workers=3)
+    results = _results(out)
+    assert [r["id"] for r in results] == ["0", "1", "2"]
+    assert [r["answer"] for r in results] == ["echo:slow", "echo:b", "echo:c"]
+    assert all(len(h) == 1 for h in echo_session.seen)
+    assert stats["ok"] == 3
+    assert load_conversation() == []
+
+
+def test_batch_completion_order(echo_session):
+    """--order completion: медленная задача оказывается последней."""
+    out = io.StringIO()
+    run_batch(echo_session, _tasks("slow", "b", "c"), out, workers=3, ordered=False)
+    assert [r["id"] for r in _results(out)][-1] == "0"
+
+
+def test_batch_errors_and_resume(echo_session, tmp_path):
+    """Ошибка задачи попадает в результат; повторный запуск пропускает выполненное."""
+    ckpt = tmp_path / "done.txt"
+    ckpt.write_text("0\n", encoding="utf-8")
+    out = io.StringIO()
+    stats = run_batch(echo_session, _tasks("a", "boom", "c"), out, workers=2, checkpoint=ckpt)
+    results = _results(out)
+    assert [r["id"] for r in results] == ["1", "2"]
+    assert results[0]["ok"] is False and "сбой" in results[0]["error"]
+    assert stats["skipped"] == 1 and stats["failed"] == 1
+    assert ckpt.read_text(encoding="utf-8").split() == ["0", "1", "2"]
+
+    out = io.StringIO()
+    stats = run_batch(echo_session, _tasks("a", "boom", "c"), out, checkpoint=ckpt)
+    assert out.getvalue() == ""
+    assert stats["skipped"] == 3
+
+
+def test_batch_shared_memory(echo_session):
+    """--shared-memory: задачи пишут в общую историю диалога."""
+    out = io.StringIO()
+    run_batch(echo_session, _tasks("a", "b"), out, workers=1, shared=True)
+    assert [m["content"] for m in load_conversation()] == ["a", "echo:a", "b", "echo:b"]
+    assert echo_session.seen[1] == ["a", "b"]
+
+
+def test_batch_interrupt_leaves_queue_not_started(echo_session, tmp_path):
+    """Ctrl-C: дожидаются только задачи в полёте (не больше workers), очередь не запускается."""
+    ckpt = tmp_path / "done.txt"
+    out = io.StringIO()
+    with pytest.raises(KeyboardInterrupt):
+        run_batch(echo_session, _tasks("stop", *["slow"] * 9), out, workers=2, checkpoint=ckpt)
+    assert len(echo_session.seen) == 2
+    assert out.getvalue() == ""
+
+
+def test_batch_isolated_from_shared_facts_and_archive(echo_session, mocker):
+    """Задачи не видят общие факты и архив; факты, записанные в задаче, не попадают в facts.log."""
+    memory.set_fact("город", "Москва")
+    search = mocker.spy(recall, "search")
+    out = io.StringIO()
+    run_batch(echo_session, _tasks("remember раз", "город?"), out, workers=1)
+    assert all(r["ok"] for r in _results(out))
+    assert echo_session.seen_facts == [[], []]
+    search.assert_not_called()
+    facts, _ = memory.get_facts()
+    assert [f["key"] for f in facts] == ["город"]
@@ -0,0 +1,74 @@
+"""
+Тесты микро-батчинга (batcher.py).
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from agent.batcher import MicroBatcher
+
+
+def test_error_reaches_all_waiters():
+    """Ошибка fetch получают все вызовы батча."""
+    batcher = MicroBatcher(0.05)
+    barrier = threading.Barrier(3)
+    errors = []
+
+    def fetch(keys):
+        raise ValueError(",".join(sorted(keys)))
+
+    def call(key):
+        barrier.wait()
+        try:
+            batcher.run(fetch, [key])
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call, args=(k,)) for k in "abc"]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == ["a,b,c"] * 3
+
+
+def test_max_keys_splits_batches():
+    """Ключи сверх max_keys уходят в новый батч; window=0 — без ожидания."""
+    batcher = MicroBatcher(0, max_keys=2)
+    assert batcher.run(lambda keys, extra: (sorted(keys), sorted(extra)), ["a", "b"], ["x"]) == (["a", "b"], ["x"])
+
+    async def run():
+        fetched = []
+
+        async def fetch(keys):
+            fetched.append(sorted(keys))
+            await asyncio.sleep(0)
+            return len(keys)
+
+        slow = MicroBatcher(0.02, max_keys=2)
+        results = await asyncio.gather(*(slow.arun(fetch, [k]) for k in "abc"))
+        return results, fetched, slow.stats()
+
+    results, fetched, stats = asyncio.run(run())
+    assert results == [2, 2, 1] and fetched == [["a", "b"], ["c"]]
+    assert stats == {"calls": 3, "batches": 2}
+
+
+def test_cancelled_leader_fails_followers():
+    async def run():
+        batcher = MicroBatcher(0.05)
+
+        async def fetch(keys):
+            return keys
+
+        leader = asyncio.create_task(batcher.arun(fetch, ["a"]))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(batcher.arun(fetch, ["b"]))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(RuntimeError):
+            await follower
+
+    asyncio.run(run())
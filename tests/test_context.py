@@ -0,0 +1,72 @@
+"""
+Тесты бюджета контекста: подсчёт токенов и отбор истории.
+"""
+
+import json
+
+from agent import context
+from agent.context import build_context, count_tokens, message_tokens
+from agent.memory import append_message, load_conversation
+
+
+def _conv(n):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"сообщение номер {i}", "tokens": 10}
+        for i in range(n)
+    ]
+
+
+def test_append_stores_token_count(tmp_memory):
+    """Число токенов сохраняется рядом с сообщением в conversation.jsonl."""
+    append_message("user", "Какая погода в Берлине?")
+    line = json.loads((tmp_memory / "conversation.jsonl").read_text(encoding="utf-8"))
+    assert line["tokens"] == count_tokens("Какая погода в Берлине?") > 0
+
+
+def test_message_tokens_uses_stored_value(mocker):
+    """Сохранённое значение не пересчитывается; отсутствующее считается один раз."""
+    spy = mocker.spy(context, "count_tokens")
+    assert message_tokens({"content": "abc", "tokens": 7}) == 7 + context.MESSAGE_OVERHEAD_TOKENS
+    assert spy.call_count == 0
+    legacy = {"content": "старое сообщение"}
+    message_tokens(legacy)
+    message_tokens(legacy)
+    assert spy.call_count == 1
+    assert "tokens" in legacy
+
+
+def test_legacy_lines_without_tokens(sample_conversation):
+    """Старые строки без tokens тоже укладываются в бюджет."""
+    kept, stats = build_context(load_conversation(), budget=10_000)
+    assert stats["kept_messages"] == 2
+    assert stats["kept_tokens"] > 0
+
+
+def test_build_context_keeps_newest_within_budget():
+    """Заполнение с новых сообщений; отчёт о сохранённых и отброшенных токенах."""
+    conv = _conv(10)
+    per_msg = 10 + context.MESSAGE_OVERHEAD_TOKENS
+    kept, stats = build_context(conv, fixed_tokens=20, budget=20 + per_msg * 4)
+    assert kept == conv[-4:]
+    assert stats["kept_messages"] == 4
+    assert stats["kept_tokens"] == per_msg * 4
+    assert stats["dropped_messages"] == 6
+    assert stats["dropped_tokens"] == per_msg * 6
+
+
+def test_build_context_does_not_start_with_assistant():
+    """Ответ ассистента без своего вопроса не попадает в начало истории."""
+    conv = _conv(10)
+    per_msg = 10 + context.MESSAGE_OVERHEAD_TOKENS
+    kept, stats = build_context(conv, budget=per_msg * 5)
+    assert kept[0]["role"] == "user"
+    assert len(kept) == 4
+    assert stats["dropped_messages"] == 6
+
+
+def test_build_context_unlimited():
+    """Бюджет 0 — вся история."""
+    conv = _conv(6)
+    kept, stats = build_context(conv, budget=0)
+    assert kept == conv
+    assert stats["dropped_messages"] == 0
@@ -0,0 +1,114 @@
+"""
+Тесты параллельного выполнения инструментов (ToolExecutor).
+"""
+
+import asyncio
+import time
+
+from langchain.agents import create_agent
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+
+from agent.config import reset_dry_run, set_dry_run
+from agent.executor import ToolExecutor
+from agent.tools import write_file
+
+DELAY = 0.2
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Модель, которая возвращает заранее заданные сообщения по очереди."""
+
+    responses: list
+    index: int = 0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        msg = self.responses[self.index]
+        self.index += 1
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+@tool
+def slow_echo(text: str) -> str:
+    """Вернуть текст с задержкой.
+
+    Args:
+        text: Текст
+    """
+    time.sleep(DELAY)
+    return text
+
+
+async def _aslow_echo(text: str) -> str:
+    await asyncio.sleep(DELAY)
+    return text
+
+
+slow_echo.coroutine = _aslow_echo
+
+
+def _model(calls):
+    tool_calls = [{"name": name, "args": args, "id": f"call_{i}"} for i, (name, args) in enumerate(calls)]
+    return ScriptedChatModel(responses=[AIMessage(content="", tool_calls=tool_calls), AIMessage(content="Готово")])
+
+
+def _tool_outputs(result):
+    return [(m.tool_call_id, m.content) for m in result["messages"] if isinstance(m, ToolMessage)]
+
+
+def test_tool_calls_run_concurrently_in_order():
+    """Время хода — самый медленный инструмент, порядок результатов сохраняется."""
+    executor = ToolExecutor(max_concurrency=4, limits={})
+    calls = [("slow_echo", {"text": t}) for t in ("a", "b", "c")]
+    agent = create_agent(_model(calls), executor.wrap_all([slow_echo]))
+    start = time.perf_counter()
+    result = agent.invoke({"messages": [("user", "go")]})
+    elapsed = time.perf_counter() - start
+    assert _tool_outputs(result) == [("call_0", "a"), ("call_1", "b"), ("call_2", "c")]
+    assert elapsed < DELAY * 2.5
+
+
+def test_per_tool_limit_serializes():
+    """Лимит 1 для инструмента выполняет его вызовы последовательно."""
+    executor = ToolExecutor(max_concurrency=4, limits={"slow_echo": 1})
+    calls = [("slow_echo", {"text": t}) for t in ("a", "b", "c")]
+    agent = create_agent(_model(calls), executor.wrap_all([slow_echo]))
+    start = time.perf_counter()
+    result = agent.invoke({"messages": [("user", "go")]})
+    assert time.perf_counter() - start >= DELAY * 3
+    assert [c for _, c in _tool_outputs(result)] == ["a", "b", "c"]
+
+
+def test_async_tool_calls_run_concurrently():
+    """ainvoke: вызовы выполняются через asyncio с тем же общим пределом."""
+    executor = ToolExecutor(max_concurrency=2, limits={})
+    calls = [("slow_echo", {"text": t}) for t in ("a", "b", "c", "d")]
+    agent = create_agent(_model(calls), executor.wrap_all([slow_echo]))
+    start = time.perf_counter()
+    result = asyncio.run(agent.ainvoke({"messages": [("user", "go")]}))
+    elapsed = time.perf_counter() - start
+    assert [c for _, c in _tool_outputs(result)] == ["a", "b", "c", "d"]
+    assert DELAY * 2 <= elapsed < DELAY * 3.5
+
+
+def test_dry_run_reaches_parallel_tools(tmp_workspace):
+    """Dry-run виден в инструментах, выполняемых в потоках пула."""
+    executor = ToolExecutor()
+    calls = [("write_file", {"path": f"f{i}.txt", "content": "x"}) for i in range(3)]
+    agent = create_agent(_model(calls), executor.wrap_all([write_file]))
+    token = set_dry_run(True)
+    try:
+        result = agent.invoke({"messages": [("user", "go")]})
+    finally:
+        reset_dry_run(token)
+    assert all("DRY-RUN" in c for _, c in _tool_outputs(result))
+    assert not any(tmp_workspace.iterdir())
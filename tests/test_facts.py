@@ -0,0 +1,137 @@
+"""
+Тесты фактов и задач: журнал изменений, снимки, инструменты, отбор в промпт.
+"""
+
+import json
+from unittest.mock import MagicMock
+
+from langchain_core.messages import AIMessage
+from pytest_mock import MockerFixture
+
+from agent import memory
+from agent.agent import AgentSession
+from agent.config import reset_dry_run, set_dry_run
+from agent.facts import FactIndex
+from agent.tools import add_todo, forget_fact, list_facts, remember_fact, update_todo
+
+
+def test_upsert_appends_to_log_without_rewriting_snapshot(tmp_memory):
+    """set_fact/delete_fact дописывают строку в facts.log, memory.json не трогают."""
+    memory.update_memory(summary="Резюме", facts=[], todos=[])
+    snapshot = (tmp_memory / "memory.json").read_bytes()
+    memory.set_fact("город", "Казань")
+    memory.set_fact("город", "Пермь")
+    memory.set_fact("язык", "русский")
+    assert memory.delete_fact("язык") is True
+    assert memory.delete_fact("нет такого") is False
+    assert (tmp_memory / "memory.json").read_bytes() == snapshot
+    assert len((tmp_memory / "facts.log").read_text("utf-8").splitlines()) == 4
+    m = memory.load_memory()
+    assert [(f["key"], f["value"]) for f in m["facts"]] == [("город", "Пермь")]
+    assert m["summary"] == "Резюме"
+
+
+def test_log_replayed_incrementally(tmp_memory, mocker: MockerFixture):
+    """Повторное чтение применяет только новые операции журнала."""
+    for i in range(10):
+        memory.set_fact(f"k{i}", "v")
+    memory.load_memory()
+    apply = mocker.spy(FactIndex, "apply")
+    memory.set_fact("k10", "v")
+    assert len(memory.load_memory()["facts"]) == 11
+    assert apply.call_count == 1
+    # Другой процесс (холодный кэш) видит то же состояние
+    memory._facts_cached = None
+    assert len(memory.get_facts()[0]) == 11
+
+
+def test_snapshot_folds_log(tmp_memory, mocker: MockerFixture):
+    """Раз в MEMORY_FACTS_SNAPSHOT_EVERY операций журнал сворачивается в memory.json."""
+    mocker.patch.object(memory, "MEMORY_FACTS_SNAPSHOT_EVERY", 5)
+    memory.update_memory(summary="Резюме", facts=[], todos=[])
+    for i in range(5):
+        memory.set_fact(f"k{i}", str(i))
+    assert (tmp_memory / "facts.log").read_bytes() == b""
+    data = json.loads((tmp_memory / "memory.json").read_text("utf-8"))
+    assert [f["key"] for f in data["facts"]] == [f"k{i}" for i in range(5)]
+    assert data["summary"] == "Резюме"
+    memory.set_fact("k0", "new")
+    assert [(f["key"], f["value"]) for f in memory.load_memory()["facts"]][:2] == [("k0", "new"), ("k1", "1")]
+
+
+def test_replay_after_interrupted_snapshot_is_idempotent(tmp_memory):
+    """Сбой между записью снимка и очисткой журнала не меняет состояние."""
+    memory.set_fact("a", "1")
+    memory.set_fact("b", "2")
+    assert memory.delete_fact("a")
+    log = (tmp_memory / "facts.log").read_bytes()
+    facts, todos = memory.get_facts()
+    memory.update_memory(summary="", facts=facts, todos=todos)
+    (tmp_memory / "facts.log").write_bytes(log)  # журнал «не успели» очистить
+    assert [(f["key"], f["value"]) for f in memory.load_memory()["facts"]] == [("b", "2")]
+
+
+def test_legacy_todos_get_ids(tmp_memory):
+    """Задачи старого memory.json без id получают id по порядку; новые — следующие."""
+    (tmp_memory / "memory.json").write_text(json.dumps({
+        "summary": "", "facts": [{"key": "k", "value": "v"}],
+        "todos": [{"text": "купить хлеб", "status": "open"}, {"text": "позвонить", "status": "done"}],
+    }, ensure_ascii=False), encoding="utf-8")
+    assert [t["id"] for t in memory.load_memory()["todos"]] == ["t1", "t2"]
+    assert memory.add_todo("оплатить счёт") == "t3"
+    assert memory.set_todo_status("t1", "done") is True
+    assert memory.set_todo_status("t9", "done") is False
+    statuses = {t["id"]: t["status"] for t in memory.load_memory()["todos"]}
+    assert statuses == {"t1": "done", "t2": "done", "t3": "open"}
+
+
+def test_relevant_facts(tmp_memory):
+    """В отбор попадают факты и открытые задачи с общими термами, закрытые задачи — нет."""
+    memory.set_fact("город", "Живу в Новосибирске")
+    memory.set_fact("кофе", "Пью без сахара")
+    done = memory.add_todo("узнать погоду в Новосибирске на выходные")
+    memory.set_todo_status(done, "done")
+    memory.add_todo("проверить прогноз погоды для Новосибирска")
+    facts, todos = memory.relevant_facts("какая погода в Новосибирске?")
+    assert [f["key"] for f in facts] == ["город"]
+    assert [t["text"] for t in todos] == ["проверить прогноз погоды для Новосибирска"]
+    assert memory.relevant_facts("погода", limit=0) == ([], [])
+
+
+def test_fact_tools(tmp_memory):
+    """Инструменты памяти: запись, просмотр, задачи, dry-run."""
+    assert "Запомнено" in remember_fact.invoke({"key": "имя", "value": "Аня"})
+    token = set_dry_run(True)
+    try:
+        assert remember_fact.invoke({"key": "город", "value": "Омск"}).startswith("[DRY-RUN]")
+    finally:
+        reset_dry_run(token)
+    assert "t1" in add_todo.invoke({"text": "написать отчёт"})
+    assert update_todo.invoke({"todo_id": "t1", "status": "done"}) == "Задача t1: done"
+    assert "Ошибка" in update_todo.invoke({"todo_id": "t1", "status": "later"})
+    listed = json.loads(list_facts.invoke({}))
+    assert listed["facts"] == [{"key": "имя", "value": "Аня"}]
+    assert listed["todos"] == [{"id": "t1", "text": "написать отчёт", "status": "done"}]
+    assert forget_fact.invoke({"key": "город"}) == "Факт не найден: город"
+    assert forget_fact.invoke({"key": "имя"}) == "Факт удалён: имя"
+
+
+def test_only_relevant_facts_injected(tmp_memory, mocker: MockerFixture):
+    """В промпт попадают только факты, относящиеся к запросу."""
+    memory.set_fact("аллергия", "аллергия на орехи")
+    memory.set_fact("машина", "синяя тойота")
+    calls = []
+
+    def invoke(inputs):
+        calls.append(inputs["messages"])
+        return {"messages": list(inputs["messages"]) + [AIMessage(content="ok")]}
+
+    agent = MagicMock()
+    agent.invoke = invoke
+    mocker.patch("agent.agent.create_agent", return_value=agent)
+    mocker.patch("agent.agent.get_llm", return_value=MagicMock())
+    session = AgentSession()
+    session.ask("посоветуй десерт без орехов")
+    tail = calls[0][-2].content
+    assert "аллергия на орехи" in tail and "тойота" not in tail
+    assert session.last_context["facts"] == 1
@@ -0,0 +1,209 @@
+"""
+Тесты дискового HTTP-кэша http_request (http_cache.py).
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from email.utils import formatdate
+
+import httpx
+import responses
+
+from agent import http_cache, tools
+from agent.http_cache import Entry, HttpCache
+from agent.tools import http_request
+
+URL = "https://api.example.com/data"
+
+
+def _get(url: str = URL, **args) -> dict | str:
+    out = http_request.invoke({"url": url, **args})
+    return json.loads(out) if out.startswith("{") else out
+
+
+@responses.activate
+def test_fresh_response_served_from_disk():
+    """max-age: повторный GET не идёт в сеть; тело читается из кэша."""
+    responses.add(responses.GET, URL, json={"v": 1}, headers={"Cache-Control": "max-age=60"})
+    first = _get()
+    second = _get()
+    assert len(responses.calls) == 1
+    assert "cache" not in first and second["cache"] == "hit"
+    assert json.loads(second["body"]) == {"v": 1}
+    assert second["headers"]["content-type"] == "application/json"
+    stats = http_cache.get_cache().stats()
+    assert (stats["hits"], stats["misses"], stats["stores"], stats["entries"]) == (1, 1, 1, 1)
+
+
+@responses.activate
+def test_etag_revalidation_304():
+    """Ответ только с ETag перепроверяется; 304 отдаёт тело из кэша и обновляет заголовки."""
+    seen = []
+
+    def callback(request):
+        seen.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return 304, {"ETag": '"v1"', "Cache-Control": "max-age=60"}, ""
+        return 200, {"ETag": '"v1"', "Content-Type": "text/plain"}, "тело"
+
+    responses.add_callback(responses.GET, URL, callback=callback)
+    assert _get()["body"] == "тело"
+    revalidated = _get()
+    assert revalidated["cache"] == "revalidated" and revalidated["body"] == "тело"
+    # После 304 с max-age запись свежая — третий запрос без сети
+    assert _get()["cache"] == "hit"
+    assert seen == [None, '"v1"']
+    assert http_cache.get_cache().stats()["revalidations"] == 1
+
+
+@responses.activate
+def test_last_modified_and_changed_resource():
+    """If-Modified-Since; изменённый ресурс (200) заменяет запись."""
+    modified = formatdate(time.time() - 3600, usegmt=True)
+    bodies = iter(["старое", "новое"])
+
+    def callback(request):
+        assert request.headers.get("If-Modified-Since") in (None, modified)
+        return 200, {"Last-Modified": modified, "Content-Type": "text/plain"}, next(bodies)
+
+    responses.add_callback(responses.GET, URL, callback=callback)
+    assert _get()["body"] == "старое"
+    assert _get()["body"] == "новое"
+    assert len(list(http_cache.get_cache().root.glob("*.body"))) == 1
+
+
+@responses.activate
+def test_not_cached_cases():
+    """no-store, POST, no-cache в запросе и истёкший Expires."""
+    responses.add(responses.GET, f"{URL}/nostore", body="x", headers={"Cache-Control": "no-store, max-age=60"})
+    responses.add(responses.POST, f"{URL}/post", body="x", headers={"Cache-Control": "max-age=60"})
+    responses.add(responses.GET, f"{URL}/expired", body="x", headers={
+        "Date": formatdate(time.time(), usegmt=True), "Expires": formatdate(time.time() - 10, usegmt=True),
+    })
+    responses.add(responses.GET, f"{URL}/fresh", body="x", headers={"Cache-Control": "max-age=60"})
+    for _ in range(2):
+        _get(f"{URL}/nostore")
+        _get(f"{URL}/post", method="POST", body="{}")
+        _get(f"{URL}/expired")
+        assert "cache" not in _get(f"{URL}/fresh", headers={"Cache-Control": "no-cache"})
+    assert len(responses.calls) == 8
+    assert "cache" not in _get(f"{URL}/fresh", headers={"Cache-Control": "no-store"})
+
+
+@responses.activate
+def test_truncated_body_not_stored(monkeypatch):
+    monkeypatch.setattr(tools, "HTTP_MAX_BYTES", 4)
+    responses.add(responses.GET, URL, body="длинное тело", headers={"Cache-Control": "max-age=60"})
+    assert _get()["truncated"] is True
+    assert "cache" not in _get()
+    assert http_cache.get_cache().stats()["stores"] == 0
+
+
+@responses.activate
+def test_vary_and_age():
+    """Запись с Vary подходит только к тем же заголовкам; Age уменьшает свежесть."""
+    responses.add(responses.GET, URL, body="ru", headers={"Cache-Control": "max-age=60", "Vary": "Accept-Language"})
+    responses.add(responses.GET, f"{URL}/old", body="x", headers={"Cache-Control": "max-age=60", "Age": "100"})
+    _get(headers={"Accept-Language": "ru"})
+    assert _get(headers={"Accept-Language": "ru"})["cache"] == "hit"
+    assert "cache" not in _get(headers={"Accept-Language": "en"})
+    _get(f"{URL}/old")
+    assert "cache" not in _get(f"{URL}/old")
+
+
+@responses.activate
+def test_cache_does_not_bypass_ssrf_check(monkeypatch):
+    """Закэшированный URL всё равно проходит is_safe_url."""
+    responses.add(responses.GET, URL, body="x", headers={"Cache-Control": "max-age=60"})
+    _get()
+    monkeypatch.setattr(tools, "is_safe_url", lambda url: False)
+    assert "запрещён" in _get()
+
+
+def test_async_revalidation(monkeypatch):
+    """Async-версия использует тот же кэш: 304 отдаёт тело с диска."""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.headers.get("if-none-match"))
+        if request.headers.get("if-none-match") == '"a"':
+            return httpx.Response(304, headers={"ETag": '"a"'})
+        return httpx.Response(200, headers={"ETag": '"a"'}, json={"ok": True})
+
+    monkeypatch.setattr(tools, "_async_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    first = json.loads(asyncio.run(http_request.ainvoke({"url": URL})))
+    second = json.loads(asyncio.run(http_request.ainvoke({"url": URL, "json_path": "ok"})))
+    assert "cache" not in first and second["cache"] == "revalidated" and second["body"] == "true"
+    assert calls == [None, '"a"']
+
+
+def test_async_cache_io_off_loop(monkeypatch):
+    """Async: чтение, запись и обновление записей кэша идут не в потоке event loop."""
+    threads = {}
+    for name in ("lookup", "read", "refresh", "store"):
+        original = getattr(HttpCache, name)
+
+        def record(self, *args, _name=name, _original=original, **kwargs):
+            threads.setdefault(_name, set()).add(threading.current_thread())
+            return _original(self, *args, **kwargs)
+
+        monkeypatch.setattr(HttpCache, name, record)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.headers.get("if-none-match") == '"a"':
+            return httpx.Response(304, headers={"ETag": '"a"'})
+        return httpx.Response(200, headers={"ETag": '"a"'}, json={"ok": True})
+
+    monkeypatch.setattr(tools, "_async_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    asyncio.run(http_request.ainvoke({"url": URL}))
+    assert json.loads(asyncio.run(http_request.ainvoke({"url": URL})))["cache"] == "revalidated"
+    assert set(threads) == {"lookup", "read", "refresh", "store"}
+    assert all(threading.main_thread() not in used for used in threads.values())
+
+
+def test_lru_eviction(tmp_path):
+    """При превышении размера удаляются давно не использованные записи; LRU переживает перезапуск."""
+    cache = HttpCache(tmp_path, max_bytes=3000)
+    now = time.time()
+    headers = {"Cache-Control": "max-age=600"}
+
+    def put(url):
+        cache.store(cache.lookup(url), 200, headers, b"x" * 600, truncated=False, request_time=now)
+
+    for name in ("a", "b", "c"):
+        put(f"https://x/{name}")
+    lookup = cache.lookup("https://x/a")
+    with cache.read(lookup.entry, 10_000) as (body, truncated):
+        assert bytes(body) == b"x" * 600 and not truncated
+    put("https://x/d")
+    assert cache.lookup("https://x/b").entry is None
+    assert all(cache.lookup(f"https://x/{n}").fresh for n in "acd")
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["bytes"] <= 3000
+
+    # Давно не использованная запись (mtime meta-файла в прошлом)
+    old = cache.lookup("https://x/c").key
+    os.utime(tmp_path / f"{old}.meta", (now - 3600, now - 3600))
+    restarted = HttpCache(tmp_path, max_bytes=3000)
+    assert restarted.stats()["entries"] == 3
+    restarted.store(restarted.lookup("https://x/e"), 200, headers, b"y" * 600, truncated=False, request_time=now)
+    assert restarted.lookup("https://x/c").entry is None
+
+
+def test_freshness_rules():
+    """Срок жизни: max-age важнее Expires; некорректный Expires — устарел."""
+    now = time.time()
+    date = formatdate(now, usegmt=True)
+
+    def entry(**headers):
+        return Entry(url=URL, status=200, headers=headers, body="", size=0, request_time=now, response_time=now)
+
+    assert entry(**{"cache-control": "max-age=30", "expires": formatdate(now + 3600, usegmt=True)}).freshness_lifetime() == 30
+    assert 3590 < entry(date=date, expires=formatdate(now + 3600, usegmt=True)).freshness_lifetime() <= 3600
+    assert entry(expires="0").freshness_lifetime() == 0
+    fresh = entry(**{"cache-control": "max-age=60"})
+    assert fresh.is_fresh({}) and not fresh.is_fresh({"max-age": "0"}) and not fresh.is_fresh({"no-cache": None})
+    assert not fresh.is_fresh({}, now=now + 61)
@@ -0,0 +1,111 @@
+"""
+Тесты общего HTTP-клиента (http_client.py): keep-alive пулы, распаковка, метрики.
+"""
+
+import asyncio
+import gzip
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from agent import http_client, tools
+from agent.tracing import Tracer, reset_tracer, set_tracer, span
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = json.dumps({"path": self.path, "cookie": self.headers.get("Cookie")}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if self.path == "/gzip":
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        if self.path == "/cookie":
+            self.send_header("Set-Cookie", "sid=secret; Path=/")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    srv.daemon_threads = True
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    http_client.reset_stats()
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_sync_requests_reuse_connection(server):
+    """Повторные запросы к хосту идут по одному соединению; gzip распаковывается."""
+    for i in range(5):
+        assert http_client.get(f"{server}/r{i}").json()["path"] == f"/r{i}"
+    assert http_client.get(f"{server}/gzip").json()["path"] == "/gzip"
+    stats = http_client.stats()
+    assert stats["requests"] == 6
+    assert stats["connections"] == 1 and stats["reused"] == 5
+    assert stats["tls_handshakes"] == 0
+    assert stats["reuse_rate"] == round(5 / 6, 4)
+
+
+def test_concurrent_threads_share_pool(server):
+    """Потоки исполнителя используют общий пул; соединений не больше, чем потоков."""
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        paths = list(pool.map(lambda i: http_client.get(f"{server}/t{i}").json()["path"], range(40)))
+    assert paths == [f"/t{i}" for i in range(40)]
+    stats = http_client.stats()
+    assert stats["requests"] == 40
+    assert stats["connections"] <= 4
+
+
+def test_cookies_not_shared_between_calls(server):
+    """Set-Cookie одного ответа не уходит в следующие запросы."""
+    http_client.get(f"{server}/cookie")
+    assert http_client.get(f"{server}/check").json()["cookie"] is None
+
+
+def test_async_client_per_loop(server):
+    """Async-клиент общий в пределах event loop и переиспользует соединение."""
+
+    async def run():
+        client = http_client.async_client()
+        assert http_client.async_client() is client
+        results = [(await client.get(f"{server}/a{i}")).json()["path"] for i in range(3)]
+        results.append((await client.get(f"{server}/gzip")).json()["path"])
+        await http_client.aclose()
+        assert client.is_closed
+        return results
+
+    assert asyncio.run(run()) == ["/a0", "/a1", "/a2", "/gzip"]
+    stats = http_client.stats()
+    assert stats["requests"] == 4
+    assert stats["connections"] == 1 and stats["reused"] == 3
+
+
+def test_tools_go_through_pool(server, monkeypatch):
+    """http_request использует общий пул; span получает conn=new/reused."""
+    monkeypatch.setattr(tools, "is_safe_url", lambda url: True)
+    tracer = Tracer()
+    token = set_tracer(tracer)
+    try:
+        with span("turn"):
+            for _ in range(3):
+                out = json.loads(tools.http_request.invoke({"url": f"{server}/tool"}))
+                assert out["status_code"] == 200
+    finally:
+        reset_tracer(token)
+    conns = [s.attrs.get("conn") for s in tracer.spans if s.name == "tool.http_request"]
+    assert conns == ["new", "reused", "reused"]
+    assert http_client.stats()["connections"] == 1
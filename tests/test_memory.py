@@ -3,11 +3,13 @@
 """
 
 import json
+import threading
 
 import pytest
 from pytest_mock import MockerFixture
 
 from agent import memory
+from agent.context import count_tokens
 from agent.memory import append_message, compact_if_needed, load_conversation, load_memory, update_memory
 
 
@@ -67,5 +69,199 @@ def test_compact_reduces_messages(tmp_memory, mocker: MockerFixture):
 
     conv = load_conversation()
     assert len(conv) <= 4
+    assert memory.conversation_stats()["messages"] == len(conv)
     m = load_memory()
     assert m["summary"] == "Краткое резюме диалога."
+
+
+def _index(tmp_memory) -> list[int]:
+    data = (tmp_memory / "conversation.jsonl.idx").read_bytes()
+    return [int.from_bytes(data[i:i + 8], "little") for i in range(0, len(data), 8)]
+
+
+def test_index_tracks_line_ends(tmp_memory):
+    """append_message дописывает в индекс смещение конца каждой строки."""
+    for i in range(5):
+        append_message("user", f"msg {i}")
+    conv_file = tmp_memory / "conversation.jsonl"
+    ends = _index(tmp_memory)
+    assert len(ends) == 5
+    assert ends[-1] == conv_file.stat().st_size
+    lines = conv_file.read_bytes().splitlines(keepends=True)
+    assert ends == [sum(len(line) for line in lines[:i + 1]) for i in range(5)]
+
+
+def test_load_last_seeks_from_end(tmp_memory):
+    """last=N возвращает последние N сообщений, не читая файл целиком."""
+    for i in range(50):
+        append_message("user", f"msg {i}")
+    assert [m["content"] for m in load_conversation(last=3)] == ["msg 47", "msg 48", "msg 49"]
+    assert len(load_conversation(last=500)) == 50
+    assert load_conversation(last=0) == []
+
+
+def test_index_rebuilt_after_external_edit(tmp_memory):
+    """Строки, дописанные в обход append_message, видны и попадают в индекс."""
+    append_message("user", "раз")
+    conv_file = tmp_memory / "conversation.jsonl"
+    with open(conv_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"role": "assistant", "content": "извне"}, ensure_ascii=False) + "\n")
+    assert [m["content"] for m in load_conversation(last=1)] == ["извне"]
+    append_message("user", "два")
+    assert len(_index(tmp_memory)) == 3
+    assert [m["content"] for m in load_conversation(last=2)] == ["извне", "два"]
+
+
+def test_incremental_load_parses_only_new_lines(tmp_memory, mocker: MockerFixture):
+    """Повторная загрузка разбирает только дописанные строки."""
+    for i in range(20):
+        append_message("user", f"msg {i}")
+    assert len(load_conversation()) == 20
+    parse = mocker.spy(memory, "_parse_lines")
+    append_message("assistant", "новое")
+    conv = load_conversation()
+    assert len(conv) == 21 and conv[-1]["content"] == "новое"
+    assert parse.call_args_list[0].args[0].count(b"\n") == 1
+    # Без изменений файла — ничего не разбирается
+    parse.reset_mock()
+    load_conversation()
+    assert parse.call_count == 0
+
+
+def test_cache_detects_rewrite(tmp_memory):
+    """Переписанный файл (не только дописанный) разбирается заново."""
+    for i in range(5):
+        append_message("user", f"msg {i}")
+    load_conversation()
+    conv_file = tmp_memory / "conversation.jsonl"
+    lines = [{"role": "user", "content": f"другое содержимое, заметно длиннее прежнего {i}"} for i in range(5)]
+    conv_file.write_text("".join(json.dumps(m, ensure_ascii=False) + "\n" for m in lines), encoding="utf-8")
+    assert [m["content"] for m in load_conversation()] == [m["content"] for m in lines]
+
+
+def test_compaction_check_does_not_read_conversation(tmp_memory, mocker: MockerFixture):
+    """Проверка лимитов — по индексу и os.stat, без чтения conversation.jsonl."""
+    for i in range(30):
+        append_message("user", f"msg {i}")
+    mocker.patch.object(memory, "MEMORY_MAX_MESSAGES", 31)
+    rebuild = mocker.spy(memory, "_rebuild_index")
+    parse = mocker.spy(memory, "_parse_lines")
+    assert memory.conversation_stats() == {
+        "messages": 30, "bytes": (tmp_memory / "conversation.jsonl").stat().st_size,
+    }
+    assert memory._should_compact() is False
+    append_message("assistant", "ещё")
+    assert memory._should_compact() is True
+    assert rebuild.call_count == 0 and parse.call_count == 0
+
+
+def test_compaction_counters_rebuilt_after_external_change(tmp_memory):
+    """Файл, переписанный извне, пересчитывается."""
+    for i in range(10):
+        append_message("user", f"msg {i}")
+    conv_file = tmp_memory / "conversation.jsonl"
+    lines = conv_file.read_text(encoding="utf-8").splitlines(keepends=True)
+    conv_file.write_text("".join(lines[:3]), encoding="utf-8")
+    assert memory.conversation_stats()["messages"] == 3
+
+
+def _summary_llm(mocker: MockerFixture, on_invoke=None):
+    """LLM для резюме; on_invoke вызывается во время «генерации»."""
+    llm = mocker.MagicMock()
+
+    def invoke(prompt):
+        if on_invoke:
+            on_invoke()
+        return mocker.MagicMock(content="Резюме.")
+
+    llm.invoke.side_effect = invoke
+    mocker.patch.object(memory, "get_llm", return_value=llm)
+    mocker.patch.object(memory, "MEMORY_MAX_MESSAGES", 10)
+    mocker.patch.object(memory, "MEMORY_KEEP_RECENT", 2)
+
+
+def test_compaction_keeps_messages_appended_during_summary(tmp_memory, mocker: MockerFixture):
+    """Сообщения, дописанные пока генерируется резюме, не теряются при замене файла."""
+    _summary_llm(mocker, on_invoke=lambda: append_message("user", "во время компакции"))
+    for i in range(12):
+        append_message("user", f"msg {i}")
+    assert compact_if_needed() is True
+    assert [m["content"] for m in load_conversation()] == ["msg 10", "msg 11", "во время компакции"]
+    assert memory.conversation_stats()["messages"] == 3
+    assert load_memory()["summary"] == "Резюме."
+
+
+def test_background_compaction(tmp_memory, mocker: MockerFixture):
+    """Фоновая компакция не блокирует вызывающего; flush дожидается результата."""
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+
+    _summary_llm(mocker, on_invoke=slow)
+    for i in range(12):
+        append_message("user", f"msg {i}")
+    assert memory.compact_in_background() is True
+    assert started.wait(5)
+    assert memory.compaction_running()
+    assert memory.compact_in_background() is False  # уже идёт
+    append_message("user", "пока идёт компакция")
+    assert load_memory()["summary"] == ""
+    release.set()
+    assert memory.flush_compaction(5) is True
+    assert load_memory()["summary"] == "Резюме."
+    assert [m["content"] for m in load_conversation()] == ["msg 10", "msg 11", "пока идёт компакция"]
+
+
+def test_rolling_summary_is_bounded(tmp_memory, mocker: MockerFixture):
+    """Резюме уровня сливаются при превышении лимита: summary не растёт с числом компакций."""
+    merges = []
+
+    def invoke(prompt):
+        if prompt.startswith("Объедини"):
+            merges.append(prompt)
+            return mocker.MagicMock(content="Слияние.")
+        return mocker.MagicMock(content="Резюме куска диалога. " * 5)
+
+    llm = mocker.MagicMock()
+    llm.invoke.side_effect = invoke
+    mocker.patch.object(memory, "get_llm", return_value=llm)
+    mocker.patch.object(memory, "MEMORY_MAX_MESSAGES", 6)
+    mocker.patch.object(memory, "MEMORY_KEEP_RECENT", 2)
+    mocker.patch.object(memory, "MEMORY_SUMMARY_LEVEL_TOKENS", 60)
+    mocker.patch.object(memory, "MEMORY_SUMMARY_MAX_LEVELS", 2)
+
+    chunk = count_tokens("Резюме куска диалога. " * 5)
+    sizes = []
+    for round_ in range(12):
+        for i in range(6):
+            append_message("user", f"r{round_} msg {i}")
+        assert compact_if_needed() is True
+        sizes.append(count_tokens(load_memory()["summary"]))
+
+    m = load_memory()
+    assert merges
+    # Каждый уровень держится в пределах лимита плюс последнее добавленное резюме
+    assert max(sizes) <= 2 * (60 + chunk)
+    assert {n["level"] for n in m["summaries"]} <= {0, 1}
+    assert sum(n["tokens"] for n in m["summaries"] if n["level"] == 0) <= 60 + m["summaries"][-1]["tokens"]
+    # Происхождение: верхний узел покрывает все вытесненные сообщения и ссылается на исходные
+    top = m["summaries"][0]
+    assert top["level"] == 1 and top["sources"]
+    assert sum(n["messages"] for n in m["summaries"]) == 12 * 6 - 2
+    assert top["from_ts"] <= top["to_ts"]
+    assert m["summary"].startswith(top["text"])
+
+
+def test_legacy_summary_migrated(tmp_memory):
+    """memory.json без узлов: плоский summary становится узлом уровня 0 и сохраняется при записи."""
+    (tmp_memory / "memory.json").write_text(
+        json.dumps({"summary": "Старое резюме", "facts": [], "todos": []}, ensure_ascii=False), encoding="utf-8",
+    )
+    m = load_memory()
+    assert [(n["level"], n["text"]) for n in m["summaries"]] == [(0, "Старое резюме")]
+    update_memory(summary=m["summary"], facts=[{"key": "k", "value": "v"}], todos=[])
+    assert load_memory()["summaries"][0]["text"] == "Старое резюме"
+    update_memory(summary="Другое", facts=[], todos=[])
+    assert [n["text"] for n in load_memory()["summaries"]] == ["Другое"]
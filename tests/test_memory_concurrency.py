@@ -0,0 +1,112 @@
+"""
+Стресс-тест памяти: несколько процессов и потоков пишут в один AGENT_MEMORY_DIR.
+"""
+
+import json
+import multiprocessing
+import threading
+from pathlib import Path
+
+import pytest
+
+from agent import memory
+
+WRITERS = 4
+MESSAGES = 60
+
+
+class _EchoLLM:
+    """«Резюме» — сам промпт: так проверяется, что каждое сообщение либо в истории, либо в summary."""
+
+    def invoke(self, prompt):
+        class _Response:
+            content = prompt
+        return _Response()
+
+
+def _use_dir(root: Path, *, max_messages: int, group_commit_ms: float) -> None:
+    memory.CONVERSATION_FILE = root / "conversation.jsonl"
+    memory.MEMORY_FILE = root / "memory.json"
+    memory.MEMORY_MAX_MESSAGES = max_messages
+    memory.MEMORY_KEEP_RECENT = 5
+    memory.MEMORY_GROUP_COMMIT_MS = group_commit_ms
+    memory._group_commit = None
+    memory.get_llm = _EchoLLM
+
+
+def _writer(root: str, writer: int, max_messages: int, group_commit_ms: float) -> None:
+    """Процесс-писатель: несколько потоков дописывают сообщения и иногда компактируют."""
+    _use_dir(Path(root), max_messages=max_messages, group_commit_ms=group_commit_ms)
+
+    def run(thread: int):
+        for i in range(MESSAGES // 2):
+            memory.append_message("user", f"w{writer}-t{thread}-m{i}")
+            if i % 10 == 9:
+                memory.compact_if_needed()
+
+    threads = [threading.Thread(target=run, args=(t,)) for t in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def _run_writers(root: Path, *, max_messages: int, group_commit_ms: float = 0) -> None:
+    ctx = multiprocessing.get_context("fork")
+    procs = [
+        ctx.Process(target=_writer, args=(str(root), w, max_messages, group_commit_ms))
+        for w in range(WRITERS)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+
+
+def _expected() -> set[str]:
+    return {f"w{w}-t{t}-m{i}" for w in range(WRITERS) for t in range(2) for i in range(MESSAGES // 2)}
+
+
+@pytest.mark.parametrize("group_commit_ms", [0, 2])
+def test_concurrent_appends_lose_nothing(tmp_memory, group_commit_ms):
+    """Без компакции все строки на месте, целые, индекс согласован с файлом."""
+    _run_writers(tmp_memory, max_messages=10**9, group_commit_ms=group_commit_ms)
+    conv_file = tmp_memory / "conversation.jsonl"
+    lines = conv_file.read_text(encoding="utf-8").splitlines()
+    contents = [json.loads(line)["content"] for line in lines]
+    assert sorted(contents) == sorted(_expected())
+    assert memory.conversation_stats() == {"messages": len(lines), "bytes": conv_file.stat().st_size}
+    # Порядок сообщений одного потока сохраняется
+    for w in range(WRITERS):
+        for t in range(2):
+            own = [c for c in contents if c.startswith(f"w{w}-t{t}-")]
+            assert own == [f"w{w}-t{t}-m{i}" for i in range(MESSAGES // 2)]
+
+
+def test_concurrent_appends_with_compaction(tmp_memory):
+    """С компакциями каждое сообщение остаётся либо в истории, либо в summary."""
+    _run_writers(tmp_memory, max_messages=30)
+    history = [m["content"] for m in memory.load_conversation()]
+    summary = memory.load_memory()["summary"]
+    missing = [c for c in _expected() if c not in history and f"user: {c}\n" not in summary + "\n"]
+    assert missing == []
+    assert len(history) == len(set(history))
+    assert memory.conversation_stats()["messages"] == len(history)
+    assert not list(tmp_memory.glob("*.tmp"))
+
+
+def test_group_commit_batches_appends(tmp_memory, monkeypatch):
+    """Group commit: конкурентные дозаписи уходят пачками, но каждая сохранена."""
+    monkeypatch.setattr(memory, "MEMORY_GROUP_COMMIT_MS", 5)
+    monkeypatch.setattr(memory, "_group_commit", None)
+    threads = [
+        threading.Thread(target=lambda t=t: [memory.append_message("user", f"{t}-{i}") for i in range(20)])
+        for t in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(memory.load_conversation()) == 160
+    assert memory._group_commit.batches < 160
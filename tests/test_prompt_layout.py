@@ -0,0 +1,77 @@
+"""
+Тесты раскладки промпта под prefix-кэш и учёта cached tokens.
+"""
+
+import json
+from unittest.mock import MagicMock
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from agent.agent import SYSTEM_PROMPT, AgentSession, _conversation_to_messages
+from agent.memory import update_memory
+
+
+def _usage(input_tokens, cached, output_tokens=10):
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+        "input_token_details": {"cache_read": cached},
+    }
+
+
+def _session(mocker, replies):
+    calls = []
+    it = iter(replies)
+
+    def invoke(inputs):
+        calls.append(inputs["messages"])
+        return {"messages": list(inputs["messages"]) + [next(it)]}
+
+    agent = MagicMock()
+    agent.invoke = invoke
+    mocker.patch("agent.agent.create_agent", return_value=agent)
+    mocker.patch("agent.agent.get_llm", return_value=MagicMock())
+    return AgentSession(), calls
+
+
+def test_static_prompt_first_summary_last():
+    """SYSTEM_PROMPT — первый, summary — после истории."""
+    conv = [{"role": "user", "content": "q"}, {"role": "assistant", "content": "a"}]
+    msgs = _conversation_to_messages(conv, "Резюме")
+    assert isinstance(msgs[0], SystemMessage) and msgs[0].content == SYSTEM_PROMPT
+    assert [type(m) for m in msgs[1:3]] == [HumanMessage, AIMessage]
+    assert isinstance(msgs[-1], SystemMessage) and "Резюме" in msgs[-1].content
+
+
+def test_prefix_stable_across_turns_and_summary_changes(tmp_memory, mocker):
+    """Запрос следующего хода начинается с того же префикса, даже если summary изменился."""
+    session, calls = _session(mocker, [AIMessage(content="a1"), AIMessage(content="a2")])
+    update_memory(summary="Старое резюме", facts=[], todos=[])
+    session.ask("q1")
+    update_memory(summary="Новое резюме", facts=[], todos=[])
+    session.ask("q2")
+    first, second = calls
+    # Всё, кроме хвоста (summary + запрос), совпадает побайтно
+    stable = first[:-2]
+    assert [m.content for m in second[: len(stable)]] == [m.content for m in stable]
+    assert second[len(stable)].content == "q1"
+
+
+def test_cached_tokens_recorded_per_turn(tmp_memory, mocker):
+    """cached_tokens из usage_metadata суммируются по вызовам модели и пишутся в usage.jsonl."""
+    tool_call = AIMessage(content="", tool_calls=[{"name": "x", "args": {}, "id": "1"}], usage_metadata=_usage(1000, 0))
+    final = AIMessage(content="ok", usage_metadata=_usage(1200, 1024))
+
+    session, _ = _session(mocker, [final])
+    agent_invoke = session.agent.invoke
+    session.agent.invoke = lambda inputs: {"messages": [tool_call] + agent_invoke(inputs)["messages"]}
+    session.ask("q")
+
+    assert session.last_usage["model_calls"] == 2
+    assert session.last_usage["input_tokens"] == 2200
+    assert session.last_usage["cached_tokens"] == 1024
+    assert session.last_usage["cache_hit_rate"] == round(1024 / 2200, 4)
+    assert session.usage_totals["turns"] == 1
+    lines = (tmp_memory / "usage.jsonl").read_text(encoding="utf-8").splitlines()
+    assert json.loads(lines[0])["cached_tokens"] == 1024
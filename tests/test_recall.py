@@ -0,0 +1,125 @@
+"""
+Тесты поиска по архиву диалога (recall.py).
+"""
+
+import shutil
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_core.messages import AIMessage, SystemMessage
+from pytest_mock import MockerFixture
+
+from agent import archive, memory, recall
+from agent.agent import AgentSession
+
+
+def _archive(tmp_memory, contents: list[str], segment_bytes: int = 1 << 20) -> None:
+    messages = [{"role": "user", "content": c, "ts": f"2025-01-0{i % 9 + 1}"} for i, c in enumerate(contents)]
+    archive.append(tmp_memory / "archive", messages, segment_bytes=segment_bytes, codec="gzip")
+
+
+def test_compaction_archives_evicted_messages(tmp_memory, mocker: MockerFixture):
+    """Сообщения, вытесненные компакцией, попадают в архив и находятся поиском."""
+    llm = MagicMock()
+    llm.invoke.return_value = MagicMock(content="Резюме.")
+    mocker.patch.object(memory, "get_llm", return_value=llm)
+    mocker.patch.object(memory, "MEMORY_MAX_MESSAGES", 10)
+    mocker.patch.object(memory, "MEMORY_KEEP_RECENT", 2)
+    memory.append_message("user", "Мой номер заказа 48213, доставка в Казань")
+    for i in range(11):
+        memory.append_message("user", f"сообщение {i}")
+    assert memory.compact_if_needed() is True
+    archived = [m["content"] for m in memory.iter_archive()]
+    assert len(archived) == 10 and archived[0].startswith("Мой номер заказа")
+    found = recall.search("куда доставка заказа?", k=1)
+    assert [m["content"] for m in found] == ["Мой номер заказа 48213, доставка в Казань"]
+
+
+def test_bm25_ranks_relevant_first(tmp_memory):
+    """Реплика с редкими термами запроса — выше реплик с частыми; формы слов совпадают."""
+    _archive(tmp_memory, [f"обычный разговор про погоду номер {i}" for i in range(50)]
+             + ["прогноз погоды в Новосибирске на выходные"])
+    found = recall.search("погода в новосибирске", k=3)
+    assert found[0]["content"] == "прогноз погоды в Новосибирске на выходные"
+    assert found[0]["score"] >= found[1]["score"]
+    assert recall.search("квантовая хромодинамика", k=3) == []
+    assert recall.search("погода", k=0) == []
+
+
+def test_index_is_incremental(tmp_memory, mocker: MockerFixture):
+    """Повторный поиск индексирует только строки, дописанные в архив."""
+    _archive(tmp_memory, [f"реплика {i}" for i in range(20)])
+    recall.search("реплика", k=1)
+    add = mocker.spy(recall._Index, "_add")
+    _archive(tmp_memory, ["новая реплика про биткоин"])
+    assert recall.search("биткоин", k=1)[0]["content"] == "новая реплика про биткоин"
+    assert add.call_count == 1
+    # Архив пересоздан — индекс строится заново
+    shutil.rmtree(tmp_memory / "archive")
+    _archive(tmp_memory, ["другой архив про эфир"])
+    assert recall.search("биткоин", k=1) == []
+    assert recall.search("эфир", k=1)[0]["content"] == "другой архив про эфир"
+
+
+def test_vectors_fused_with_bm25(tmp_memory, monkeypatch):
+    """С numpy и AGENT_MEMORY_RECALL_VECTORS=1 работает гибридный поиск."""
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(recall, "MEMORY_RECALL_VECTORS", True)
+    recall._indexes.clear()
+    _archive(tmp_memory, [f"разговор номер {i} ни о чём" for i in range(2000)] + ["курс биткоина вырос до рекорда"])
+    index = recall._index_for(memory.archive_dir())
+    assert recall.search("курс биткоина", k=1)[0]["content"] == "курс биткоина вырос до рекорда"
+    assert index.vectors is not None and index.vectors.count == 2001
+    recall._indexes.clear()
+
+
+def test_recalled_turns_injected_into_prompt(tmp_memory, mocker: MockerFixture):
+    """Релевантные реплики из архива идут в хвостовой SystemMessage, перед запросом."""
+    _archive(tmp_memory, ["Пароль от wi-fi в офисе: зелёный-слон", "разговор про кино"])
+    calls = []
+
+    def invoke(inputs):
+        calls.append(inputs["messages"])
+        return {"messages": list(inputs["messages"]) + [AIMessage(content="ok")]}
+
+    agent = MagicMock()
+    agent.invoke = invoke
+    mocker.patch("agent.agent.create_agent", return_value=agent)
+    mocker.patch("agent.agent.get_llm", return_value=MagicMock())
+    session = AgentSession()
+    session.ask("какой пароль от wi-fi?")
+    tail = calls[0][-2]
+    assert isinstance(tail, SystemMessage)
+    assert "зелёный-слон" in tail.content and "кино" not in tail.content
+    assert session.last_context["recalled"] == 1
+
+
+def test_search_spans_sealed_segments(tmp_memory, mocker: MockerFixture):
+    """Реплики находятся и читаются и из сжатых сегментов; запечатывание не переиндексирует."""
+    _archive(tmp_memory, ["первая реплика про вулканы Камчатки"], segment_bytes=200)
+    assert recall.search("вулканы", k=1)[0]["content"] == "первая реплика про вулканы Камчатки"
+    add = mocker.spy(recall._Index, "_add")
+    _archive(tmp_memory, [f"заполнитель номер {i}" for i in range(10)], segment_bytes=200)
+    assert archive.load_manifest(tmp_memory / "archive")["segments"]
+    assert recall.search("камчатка вулканы", k=1)[0]["content"] == "первая реплика про вулканы Камчатки"
+    assert add.call_count == 10
+
+
+def test_index_persisted_between_processes(tmp_memory, mocker: MockerFixture):
+    """Новый процесс поднимает индекс запечатанных сегментов из recall.idx и разбирает только хвост."""
+    root = tmp_memory / "archive"
+    _archive(tmp_memory, ["реплика про вулканы Камчатки"] + [f"заполнитель номер {i}" for i in range(10)],
+             segment_bytes=200)
+    recall.search("вулканы", k=1)
+    assert (root / recall.INDEX_FILE).exists()
+    _archive(tmp_memory, ["хвост про гейзеры"], segment_bytes=1 << 20)
+    recall._indexes.clear()  # как после перезапуска
+    add = mocker.spy(recall._Index, "_add")
+    assert recall.search("камчатка вулканы", k=1)[0]["content"] == "реплика про вулканы Камчатки"
+    assert recall.search("гейзеры", k=1)[0]["content"] == "хвост про гейзеры"
+    assert add.call_count == 1  # только активный сегмент
+    # Повреждённый файл не мешает: индекс строится заново
+    (root / recall.INDEX_FILE).write_bytes(b'{"version": 1}\n')
+    recall._indexes.clear()
+    assert recall.search("вулканы", k=1)[0]["content"] == "реплика про вулканы Камчатки"
+    recall._indexes.clear()
@@ -0,0 +1,158 @@
+"""
+Тесты кэша ответов: ключи, TTL по инструментам, LRU, обход для побочных эффектов.
+"""
+
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from agent.agent import AgentSession
+from agent.memory import load_conversation, update_memory
+from agent.response_cache import ResponseCache, normalize_query
+
+
+def test_normalize_query():
+    """Регистр, ё, пробелы и пунктуация не влияют на ключ."""
+    assert normalize_query("  Погода  в Берлине? ") == normalize_query("погода в берлине")
+    assert normalize_query("Ёлка!") == "елка"
+
+
+def test_key_depends_on_memory_and_history():
+    """Ключ меняется вместе с summary/facts и историей диалога."""
+    mem = {"summary": "", "facts": [], "todos": []}
+    history = [{"role": "user", "content": "курс btc"}, {"role": "assistant", "content": "50000"}]
+    assert ResponseCache.key("q", mem) == ResponseCache.key("Q?", dict(mem))
+    assert ResponseCache.key("q", mem) != ResponseCache.key("q", {**mem, "summary": "s"})
+    assert ResponseCache.key("q", mem, history) == ResponseCache.key("q", mem, [dict(m) for m in history])
+    assert ResponseCache.key("q", mem, history) != ResponseCache.key("q", mem)
+    assert ResponseCache.key("q", mem, history) != ResponseCache.key("q", mem, history[:1])
+    # Более ранние ходы ключ не меняют; повтор того же вопроса пропускается
+    earlier = [{"role": "user", "content": "привет"}, {"role": "assistant", "content": "здравствуйте"}]
+    assert ResponseCache.key("q", mem, earlier + history) == ResponseCache.key("q", mem, history)
+    repeat = [{"role": "user", "content": "Q!"}, {"role": "assistant", "content": "ответ"}]
+    assert ResponseCache.key("q", mem, history + repeat + repeat) == ResponseCache.key("q", mem, history)
+
+
+def test_ttl_per_tool_and_expiry(tmp_path, monkeypatch):
+    """TTL — минимальный среди инструментов; истёкшая запись — промах."""
+    cache = ResponseCache(tmp_path / "c.json", tool_ttls={"get_crypto_price": 5, "web_search": 3600}, default_ttl=100)
+    assert cache.ttl_for(set()) == 100
+    assert cache.ttl_for({"get_crypto_price", "web_search"}) == 5
+    cache.put("k", "ответ", {"get_crypto_price"})
+    assert cache.get("k") == "ответ"
+    now = time.time()
+    monkeypatch.setattr("agent.response_cache.time.time", lambda: now + 10)
+    assert cache.get("k") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_side_effect_tools_bypass(tmp_path):
+    """Ответы с write_file/execute_terminal не кэшируются."""
+    cache = ResponseCache(tmp_path / "c.json")
+    assert cache.put("k", "x", {"write_file", "get_weather"}) is False
+    assert cache.get("k") is None
+    assert cache.stats()["bypassed"] == 1
+
+
+def test_lru_eviction_and_persistence(tmp_path):
+    """LRU вытесняет давно не использованные записи; кэш переживает перезапуск."""
+    path = tmp_path / "c.json"
+    cache = ResponseCache(path, max_entries=2)
+    cache.put("a", "A", set())
+    cache.put("b", "B", set())
+    cache.get("a")
+    cache.put("c", "C", set())
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+    reloaded = ResponseCache(path, max_entries=2)
+    assert reloaded.get("a") == "A"
+    assert reloaded.get("c") == "C"
+
+
+def test_save_keeps_entries_of_other_processes(tmp_path):
+    """Запись не затирает то, что другой процесс сохранил после нашего чтения; clear — затирает."""
+    path = tmp_path / "c.json"
+    first, second = ResponseCache(path), ResponseCache(path)
+    first.put("a", "A", set())
+    second.put("b", "B", set())
+    first.put("c", "C", set())
+    assert first.get("b") == "B"
+    reloaded = ResponseCache(path)
+    assert [reloaded.get(k) for k in "abc"] == ["A", "B", "C"]
+    reloaded.clear()
+    assert ResponseCache(path).stats()["entries"] == 0
+
+
+@pytest.fixture
+def weather_session(tmp_memory, mocker):
+    """Сессия с кэшем ответов; граф отвечает по последнему запросу и считает вызовы."""
+    calls = []
+
+    def invoke(inputs):
+        calls.append([m.content for m in inputs["messages"] if isinstance(m, HumanMessage)])
+        return {"messages": [
+            ToolMessage(content="{}", name="get_weather", tool_call_id="1"),
+            AIMessage(content=f"ответ на: {inputs['messages'][-1].content}"),
+        ]}
+
+    agent = MagicMock()
+    agent.invoke = invoke
+    mocker.patch("agent.agent.create_agent", return_value=agent)
+    mocker.patch("agent.agent.get_llm", return_value=MagicMock())
+    session = AgentSession(response_cache=ResponseCache(tmp_memory / "response_cache.json"))
+    session.calls = calls
+    return session
+
+
+def _first_turn(session: AgentSession) -> AgentSession:
+    """Сессия с памятью с диска, но пустой историей — контекст первого хода."""
+    fork = session.fork()
+    fork.reload()
+    fork._conversation = []
+    return fork
+
+
+def test_session_uses_cache(weather_session):
+    """Повтор запроса в том же контексте отвечается из кэша без вызова агента, но пишется в историю."""
+    session = weather_session
+    assert session.ask("Погода в Берлине?") == "ответ на: Погода в Берлине?"
+    assert _first_turn(session).ask("погода в берлине") == "ответ на: Погода в Берлине?"
+    assert len(session.calls) == 1
+    assert len(load_conversation()) == 4
+    assert session.response_cache.stats()["hits"] == 1
+
+    # Изменилась память — другой ключ, промах
+    update_memory(summary="Новое", facts=[], todos=[])
+    _first_turn(session).ask("погода в берлине")
+    assert len(session.calls) == 2
+
+
+def test_same_query_after_different_history_misses(weather_session):
+    """Уточнение зависит от предыдущих реплик: после разных ходов — промах, а не чужой ответ."""
+    first = weather_session.fork(persist=False)
+    second = weather_session.fork(persist=False)
+    first.ask("Курс биткоина в долларах")
+    second.ask("Сколько стоит билет в Париж")
+    assert first.ask("а в евро?") == "ответ на: а в евро?"
+    assert second.ask("а в евро?") == "ответ на: а в евро?"
+    assert len(weather_session.calls) == 4
+    assert weather_session.calls[-1] == ["Сколько стоит билет в Париж", "а в евро?"]
+    assert weather_session.response_cache.stats()["hits"] == 0
+    # Повтор в том же контексте — попадание
+    third = weather_session.fork(persist=False)
+    third.ask("Курс биткоина в долларах")
+    assert third.ask("А в евро") == "ответ на: а в евро?"
+    assert weather_session.response_cache.stats()["hits"] == 2
+
+
+def test_repeat_in_same_session_hits(weather_session):
+    """Повтор вопроса в той же сессии (REPL, повторный --task) — попадание, несмотря на растущую историю."""
+    session = weather_session
+    session.ask("Привет")
+    session.ask("Погода в Берлине?")
+    assert session.ask("погода в берлине") == "ответ на: Погода в Берлине?"
+    assert session.ask("Погода в Берлине") == "ответ на: Погода в Берлине?"
+    assert len(session.calls) == 2
+    assert session.response_cache.stats()["hits"] == 2
@@ -0,0 +1,189 @@
+"""
+Тесты резидентного режима: демон на Unix-сокете и тонкий клиент.
+"""
+
+import asyncio
+import gc
+import json
+import logging
+import socket
+import stat
+import struct
+import tempfile
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from agent.agent import AgentSession
+from agent.client import AgentClient, DaemonError
+from agent.config import get_dry_run
+from agent.memory import load_conversation
+from agent.server import AgentServer
+
+
+def _mock_agent(mocker, delay: float = 0.0):
+    """Граф отвечает «Эхо: <запрос>» по словам; запоминает входные сообщения."""
+    calls = []
+
+    async def astream(inputs, stream_mode=None):
+        calls.append(inputs["messages"])
+        text = f"Эхо: {inputs['messages'][-1].content}"
+        for word in text.split(" "):
+            await asyncio.sleep(delay)
+            yield "messages", (AIMessageChunk(content=word + " "), {"langgraph_node": "model"})
+        yield "values", {"messages": [AIMessage(content=text)]}
+
+    agent = MagicMock()
+    agent.astream = astream
+    mocker.patch("agent.agent.create_agent", return_value=agent)
+    mocker.patch("agent.agent.get_llm", return_value=MagicMock())
+    return calls
+
+
+@pytest.fixture
+def daemon(tmp_memory, mocker):
+    """Запустить AgentServer в фоновом потоке; вернуть (server, path, calls)."""
+    calls = _mock_agent(mocker, delay=0.01)
+    path = Path(tempfile.mkdtemp()) / "agent.sock"
+    session = AgentSession()
+    session.warm()
+    server = AgentServer(session, path)
+    ready = threading.Event()
+    thread = threading.Thread(target=asyncio.run, args=(server.serve(ready.set),), daemon=True)
+    thread.start()
+    assert ready.wait(5)
+    yield server, path, calls
+    server.stop()
+    thread.join(5)
+    assert not path.exists()
+
+
+def test_ask_streams_answer_and_persists(daemon):
+    """Ответ приходит по частям; основная сессия пишет диалог на диск."""
+    _, path, _ = daemon
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+    with AgentClient(path) as client:
+        tokens = list(client.ask("привет"))
+    assert len(tokens) > 1
+    assert "".join(tokens).strip() == "Эхо: привет"
+    assert [m["role"] for m in load_conversation()] == ["user", "assistant"]
+
+
+def test_named_sessions_are_isolated_and_concurrent(daemon):
+    """Именованные сессии не видят чужих реплик и обслуживаются параллельно."""
+    _, path, calls = daemon
+    results = {}
+
+    def run(name):
+        with AgentClient(path, session=name) as client:
+            results[name] = [("".join(client.ask(f"{name}-{i}"))).strip() for i in range(2)]
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in ("a", "b", "c")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert results == {n: [f"Эхо: {n}-0", f"Эхо: {n}-1"] for n in ("a", "b", "c")}
+    for msgs in calls:
+        name = msgs[-1].content.split("-")[0]
+        assert all(name in m.content for m in msgs[1:] if m.type in ("human", "ai"))
+    assert load_conversation() == []
+
+
+def test_busy_session_not_evicted(daemon):
+    """Сессия с ходом в работе не вытесняется: повтор её имени ждёт ход, а не идёт параллельно."""
+    server, path, calls = daemon
+    server.max_sessions = 1
+    started = threading.Event()
+
+    def slow():
+        with AgentClient(path, session="a") as client:
+            for _ in client.ask("a-0 " + "слово " * 30):
+                started.set()
+
+    thread = threading.Thread(target=slow)
+    thread.start()
+    assert started.wait(5)
+    with AgentClient(path, session="b") as client:
+        "".join(client.ask("b-0"))
+    with AgentClient(path, session="a") as client:
+        assert "".join(client.ask("a-1")).strip() == "Эхо: a-1"
+    thread.join(10)
+    assert [m.content for m in calls[-1] if m.type == "human"][0].startswith("a-0")
+    for _ in range(100):  # «done» уходит клиенту чуть раньше, чем сервер снимает учёт запроса
+        if not server._active:
+            break
+        threading.Event().wait(0.01)
+    assert list(server._named) == ["a"] and server._active == {}
+
+
+def test_client_cannot_relax_daemon_dry_run(daemon):
+    """dry_run клиента действует на один ход и не отключает dry-run демона."""
+    server, path, _ = daemon
+    agent = server.session.agent
+    original, seen = agent.astream, []
+
+    async def astream(inputs, stream_mode=None):
+        seen.append(get_dry_run())
+        async for item in original(inputs, stream_mode):
+            yield item
+
+    agent.astream = astream
+    with AgentClient(path, dry_run=True) as client:
+        "".join(client.ask("план"))
+    with AgentClient(path) as client:
+        "".join(client.ask("обычный"))
+    assert seen == [True, False] and server.session.dry_run is False
+    server.session.dry_run = True  # демон запущен с --dry-run
+    with AgentClient(path) as client:
+        "".join(client.ask("обычный"))
+    with AgentClient(path, session="s") as client:
+        "".join(client.ask("обычный"))
+    assert seen[2:] == [True, True]
+
+
+def test_ping_and_shutdown(daemon):
+    """ping отвечает; shutdown останавливает демон и удаляет сокет."""
+    _, path, _ = daemon
+    with AgentClient(path) as client:
+        assert client.ping()["type"] == "pong"
+        client.shutdown()
+    for _ in range(100):
+        if not path.exists():
+            break
+        threading.Event().wait(0.05)
+    assert not path.exists()
+
+
+def test_client_reports_missing_daemon(tmp_path):
+    with pytest.raises(DaemonError):
+        AgentClient(tmp_path / "nope.sock").connect()
+
+
+def test_idle_timeout_stops_server(tmp_memory, mocker):
+    _mock_agent(mocker)
+    path = Path(tempfile.mkdtemp()) / "agent.sock"
+    server = AgentServer(AgentSession(), path, idle_timeout=0.2)
+    asyncio.run(asyncio.wait_for(server.serve(), timeout=5))
+    assert not path.exists()
+
+
+def test_client_disconnect_mid_stream(daemon, caplog):
+    """Клиент оборвал соединение посреди ответа: ход закрывается в той же задаче, демон работает дальше."""
+    _, path, _ = daemon
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(str(path))
+    query = " ".join(f"слово{i}" for i in range(200))
+    sock.sendall((json.dumps({"op": "ask", "query": query}) + "\n").encode("utf-8"))
+    assert json.loads(sock.makefile("rb").readline())["type"] == "token"
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))  # RST
+    sock.close()
+    with caplog.at_level(logging.ERROR, logger="asyncio"):
+        with AgentClient(path) as client:
+            assert "".join(client.ask("снова")).strip() == "Эхо: снова"
+        gc.collect()
+    assert not [r for r in caplog.records if r.name == "asyncio"]
+    assert [m["content"] for m in load_conversation()] == ["снова", "Эхо: снова"]
@@ -0,0 +1,54 @@
+"""
+Тесты холодного старта: ленивые импорты и реестр инструментов.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+from agent import tools
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY = ("langchain", "langgraph", "langsmith", "openai", "requests", "httpx", "ddgs", "duckduckgo_search")
+
+
+def _imported_modules(args: list[str]) -> set[str]:
+    """Модули, загруженные процессом python -X importtime <args>."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT, capture_output=True, text=True, timeout=60,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    return {
+        line.split("|")[-1].strip()
+        for line in proc.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+
+
+def test_help_does_not_import_heavy_dependencies():
+    """--help отвечает без LangChain, OpenAI и HTTP-клиентов."""
+    modules = _imported_modules(["-m", "agent.run", "--help"])
+    assert not [m for m in modules if m.startswith(HEAVY)]
+
+
+def test_tools_import_is_lazy():
+    """Импорт agent.tools не тянет LangChain и HTTP-клиенты — только реестр."""
+    modules = _imported_modules(["-c", "import agent.tools"])
+    assert not [m for m in modules if m.startswith(HEAVY)]
+
+
+def test_daemon_client_is_light():
+    """Клиент демона (--connect) не загружает LangChain."""
+    modules = _imported_modules(["-c", "import agent.client"])
+    assert not [m for m in modules if m.startswith(HEAVY)]
+
+
+def test_registry_resolves_tools_once():
+    """Инструмент строится при первом обращении и дальше переиспользуется."""
+    assert tools.tool_names()[:2] == ["web_search", "http_request"]
+    first = tools.get_tool("read_file")
+    assert first is tools.get_tool("read_file")
+    assert first.name == "read_file"
+    assert first.coroutine is not None
+    assert [t.name for t in tools.get_all_tools()] == tools.tool_names()
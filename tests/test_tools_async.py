@@ -0,0 +1,100 @@
+"""
+Тесты async-версий инструментов (ainvoke).
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from agent import tools
+from agent.config import reset_dry_run, set_dry_run
+from agent.tools import (
+    execute_terminal,
+    get_crypto_price,
+    get_weather,
+    http_request,
+    list_files,
+    read_file,
+    write_file,
+)
+
+
+@pytest.fixture
+def mock_http(monkeypatch):
+    """Подменить async HTTP-клиент на MockTransport; handler задаётся тестом."""
+    handlers = {}
+
+    def transport_handler(request: httpx.Request) -> httpx.Response:
+        key = f"{request.url.scheme}://{request.url.host}{request.url.path}"
+        return handlers[key](request)
+
+    def client():
+        return httpx.AsyncClient(transport=httpx.MockTransport(transport_handler), follow_redirects=True)
+
+    monkeypatch.setattr(tools, "_async_client", client)
+    return handlers
+
+
+def test_aget_weather(mock_http):
+    """Async погода: геокодинг + прогноз."""
+    mock_http["https://geocoding-api.open-meteo.com/v1/search"] = lambda r: httpx.Response(
+        200, json={"results": [{"name": "Berlin", "latitude": 52.52, "longitude": 13.41, "population": 1}]}
+    )
+    mock_http["https://api.open-meteo.com/v1/forecast"] = lambda r: httpx.Response(
+        200, json={"current_weather": {"temperature": 7.5, "windspeed": 3.0, "weathercode": 3}}
+    )
+    data = json.loads(asyncio.run(get_weather.ainvoke({"city": "Berlin"})))
+    assert data["city"] == "Berlin"
+    assert data["temp_c"] == 7.5
+    assert data["description"] == "пасмурно"
+
+
+def test_aget_crypto_price(mock_http):
+    """Async курс крипты."""
+    mock_http["https://api.coingecko.com/api/v3/simple/price"] = lambda r: httpx.Response(
+        200, json={"bitcoin": {"usd": 50000.0}}
+    )
+    data = json.loads(asyncio.run(get_crypto_price.ainvoke({"coin": "bitcoin", "currency": "usd"})))
+    assert data["price"] == 50000.0
+
+
+def test_ahttp_request(mock_http):
+    """Async HTTP-запрос и SSRF-проверка."""
+    mock_http["https://httpbin.org/get"] = lambda r: httpx.Response(200, json={"ok": True})
+    data = json.loads(asyncio.run(http_request.ainvoke({"url": "https://httpbin.org/get"})))
+    assert data["status_code"] == 200
+    assert json.loads(data["body"]) == {"ok": True}
+    out = asyncio.run(http_request.ainvoke({"url": "http://127.0.0.1/"}))
+    assert "запрещён" in out
+
+
+def test_afile_tools(tmp_workspace):
+    """Async read/write/list через thread offload."""
+    out = asyncio.run(write_file.ainvoke({"path": "a/b.txt", "content": "hi"}))
+    assert "Записано" in out
+    assert asyncio.run(read_file.ainvoke({"path": "a/b.txt"})) == "hi"
+    names = [e["name"] for e in json.loads(asyncio.run(list_files.ainvoke({"path": "a"})))]
+    assert names == ["b.txt"]
+
+
+def test_awrite_file_dry_run(tmp_workspace):
+    """Dry-run передаётся в поток через contextvars."""
+    token = set_dry_run(True)
+    try:
+        out = asyncio.run(write_file.ainvoke({"path": "x.txt", "content": "x"}))
+    finally:
+        reset_dry_run(token)
+    assert "DRY-RUN" in out
+    assert not (tmp_workspace / "x.txt").exists()
+
+
+def test_aexecute_terminal(tmp_workspace):
+    """Async subprocess и проверки allowlist."""
+    (tmp_workspace / "f.txt").write_text("")
+    out = asyncio.run(execute_terminal.ainvoke({"command": "ls"}))
+    assert out.startswith("exit_code=0")
+    assert "f.txt" in out
+    out = asyncio.run(execute_terminal.ainvoke({"command": "rm -rf /"}))
+    assert "allowlist" in out
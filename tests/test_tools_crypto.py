@@ -1,13 +1,23 @@
 """
-Тесты инструмента get_crypto_price (CoinGecko).
+Тесты инструментов get_crypto_price и get_crypto_prices (CoinGecko).
 """
 
+import asyncio
 import json
+import threading
+from urllib.parse import parse_qs, urlparse
 
+import httpx
 import pytest
 import responses
 
-from agent.tools import get_crypto_price
+from agent import tools
+from agent.batcher import MicroBatcher
+from agent.tools import get_crypto_price, get_crypto_prices
+
+PRICE_URL = "https://api.coingecko.com/api/v3/simple/price"
+COINS_URL = "https://api.coingecko.com/api/v3/coins/list"
+_PRICES = {"bitcoin": 50000.0, "ethereum": 3000.0, "solana": 150.0, "arbitrum": 1.2}
 
 
 @responses.activate
@@ -49,3 +59,134 @@ def test_get_crypto_price_eur():
     data = json.loads(out)
     assert data["currency"] == "eur"
     assert data["price"] == 3000.0
+
+
+def _price_response(url: str) -> dict:
+    query = parse_qs(urlparse(url).query)
+    currencies = query["vs_currencies"][0].split(",")
+    return {
+        coin: {cur: _PRICES[coin] * (2 if cur == "rub" else 1) for cur in currencies if cur in ("usd", "rub")}
+        for coin in query["ids"][0].split(",") if coin in _PRICES
+    }
+
+
+def _price_callback(request):
+    return 200, {}, json.dumps(_price_response(request.url))
+
+
+@responses.activate
+def test_get_crypto_prices_batch_and_cache():
+    """Несколько монет и валют — один запрос; символ из известных резолвится без индекса; повтор — из кэша."""
+    responses.add_callback(responses.GET, PRICE_URL, callback=_price_callback)
+    out = json.loads(get_crypto_prices.invoke({"coins": ["BTC", "ethereum", "btc"], "currencies": ["USD", "rub"]}))
+    assert out == [
+        {"coin": "BTC", "id": "bitcoin", "prices": {"usd": 50000.0, "rub": 100000.0}},
+        {"coin": "ethereum", "id": "ethereum", "prices": {"usd": 3000.0, "rub": 6000.0}},
+        {"coin": "btc", "id": "bitcoin", "prices": {"usd": 50000.0, "rub": 100000.0}},
+    ]
+    assert len(responses.calls) == 1
+    query = parse_qs(urlparse(responses.calls[0].request.url).query)
+    assert query["ids"] == ["bitcoin,ethereum"] and query["vs_currencies"] == ["rub,usd"]
+
+    assert json.loads(get_crypto_price.invoke({"coin": "ETH", "currency": "rub"}))["price"] == 6000.0
+    assert "Валюта не найдена" in get_crypto_price.invoke({"coin": "bitcoin", "currency": "eur"})
+    # Курс eur не был в кэше — один дополнительный запрос; теперь и его отсутствие закэшировано
+    assert "Валюта не найдена" in get_crypto_price.invoke({"coin": "bitcoin", "currency": "eur"})
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_unknown_symbol_resolved_by_coin_index(tmp_crypto_cache):
+    """Неизвестное как id — загружается индекс /coins/list (один раз), символ резолвится по нему."""
+    responses.add_callback(responses.GET, PRICE_URL, callback=_price_callback)
+    responses.add(responses.GET, COINS_URL, json=[
+        {"id": "arbitrum", "symbol": "arb", "name": "Arbitrum"},
+        {"id": "arbitrum-bridged-wrapped", "symbol": "arb", "name": "Bridged Arbitrum"},
+        {"id": "solana", "symbol": "sol", "name": "Solana"},
+    ])
+    out = json.loads(get_crypto_prices.invoke({"coins": ["ARB", "sol", "nosuchcoin"]}))
+    assert out[0] == {"coin": "ARB", "id": "arbitrum", "prices": {"usd": 1.2}}
+    assert out[1]["prices"] == {"usd": 150.0}
+    assert out[2] == {"coin": "nosuchcoin", "error": "Монета не найдена"}
+    assert sum(c.request.url.startswith(COINS_URL) for c in responses.calls) == 1
+    assert "arb" in tmp_crypto_cache.read_text(encoding="utf-8")
+
+    # Индекс в кэше — символ резолвится сразу, без запросов
+    calls = len(responses.calls)
+    assert json.loads(get_crypto_price.invoke({"coin": "arb"}))["id"] == "arbitrum"
+    assert len(responses.calls) == calls
+
+
+def test_get_crypto_prices_limits(monkeypatch):
+    assert "пуст" in get_crypto_prices.invoke({"coins": [" "]})
+    monkeypatch.setattr(tools, "CRYPTO_MAX_COINS", 1)
+    assert "не больше 1" in get_crypto_prices.invoke({"coins": ["btc", "eth"]})
+
+
+@responses.activate
+def test_concurrent_calls_coalesced(monkeypatch):
+    """Параллельные вызовы get_crypto_price из потоков в пределах окна — один запрос к API."""
+    monkeypatch.setattr(tools, "_price_batcher", MicroBatcher(0.1))
+    responses.add_callback(responses.GET, PRICE_URL, callback=_price_callback)
+    coins = list(_PRICES)
+    barrier = threading.Barrier(len(coins))
+    results = {}
+
+    def call(coin):
+        barrier.wait()
+        results[coin] = json.loads(get_crypto_price.invoke({"coin": coin}))["price"]
+
+    threads = [threading.Thread(target=call, args=(coin,)) for coin in coins]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == _PRICES
+    assert len(responses.calls) == 1
+    assert tools._price_batcher.stats() == {"calls": len(coins), "batches": 1}
+
+
+def test_async_calls_coalesced(monkeypatch):
+    """Async: одновременные вызовы в одном event loop — один запрос."""
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        return httpx.Response(200, json=_price_response(str(request.url)))
+
+    monkeypatch.setattr(tools, "_price_batcher", MicroBatcher(0.05))
+    monkeypatch.setattr(tools, "_async_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def run():
+        return await asyncio.gather(
+            get_crypto_price.ainvoke({"coin": "btc"}),
+            get_crypto_prices.ainvoke({"coins": ["eth", "sol"], "currencies": ["rub"]}),
+        )
+
+    single, many = asyncio.run(run())
+    assert json.loads(single)["price"] == 50000.0
+    assert [r["prices"] for r in json.loads(many)] == [{"rub": 6000.0}, {"rub": 300.0}]
+    assert seen == ["/api/v3/simple/price"]
+
+
+def test_async_coin_index_saved_off_loop(monkeypatch, tmp_crypto_cache):
+    """Async: индекс монет загружается и сохраняется на диск не в потоке event loop."""
+    writers = []
+    save = tools.TTLCache.save
+
+    def record(self):
+        if self.path is not None:
+            writers.append(threading.current_thread())
+        save(self)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/coins/list"):
+            return httpx.Response(200, json=[{"id": "arbitrum", "symbol": "arb", "name": "Arbitrum"}])
+        return httpx.Response(200, json=_price_response(str(request.url)))
+
+    monkeypatch.setattr(tools.TTLCache, "save", record)
+    monkeypatch.setattr(tools, "_async_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    out = json.loads(asyncio.run(get_crypto_prices.ainvoke({"coins": ["ARB"]})))
+    assert out == [{"coin": "ARB", "id": "arbitrum", "prices": {"usd": 1.2}}]
+    assert "arb" in tmp_crypto_cache.read_text(encoding="utf-8")
+    assert writers and threading.main_thread() not in writers
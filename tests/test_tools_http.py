@@ -2,8 +2,12 @@
 Тесты инструмента http_request (SSRF защита).
 """
 
+import json
+
 import responses
 
+from agent import tools
+from agent.http_body import BodyReader, declared_length
 from agent.tools import http_request
 
 
@@ -20,3 +24,61 @@ def test_http_safe_url():
     out = http_request.invoke({"url": "https://httpbin.org/get", "method": "GET"})
     # Должен выполниться запрос (с responses)
     assert "status_code" in out or "200" in out or "ok" in out.lower()
+
+
+@responses.activate
+def test_http_body_truncated_at_limit(monkeypatch):
+    """Тело режется по лимиту; неполный последний символ отбрасывается."""
+    monkeypatch.setattr(tools, "HTTP_MAX_BYTES", 7)
+    responses.add(responses.GET, "https://example.com/ru", body="привет мир".encode("utf-8"),
+                  content_type="text/plain; charset=utf-8")
+    data = json.loads(http_request.invoke({"url": "https://example.com/ru"}))
+    assert data["body"] == "при" and data["truncated"] is True
+
+    responses.add(responses.GET, "https://example.com/cp", body="привет".encode("cp1251"),
+                  content_type="text/plain; charset=windows-1251")
+    data = json.loads(http_request.invoke({"url": "https://example.com/cp"}))
+    assert data["body"] == "привет" and data["truncated"] is False
+
+
+@responses.activate
+def test_http_excerpts_and_headers():
+    """json_path и text_only возвращают выдержку; в заголовках — только полезные."""
+    responses.add(responses.GET, "https://example.com/api", json={"data": {"items": [{"name": "a"}, {"name": "b"}]}},
+                  headers={"X-Request-Id": "123", "ETag": '"v1"'})
+    data = json.loads(http_request.invoke({"url": "https://example.com/api", "json_path": "data.items[1].name"}))
+    assert data["body"] == '"b"'
+    assert data["headers"] == {"content-type": "application/json", "etag": '"v1"'}
+    out = http_request.invoke({"url": "https://example.com/api", "json_path": "data.missing"})
+    assert out == "Ошибка: в JSON-ответе нет пути data.missing"
+
+    page = "<html><head><title>Заголовок</title><style>p{}</style></head><body><p>Первый  абзац</p>" \
+           "<script>var x = 1;</script><div>Второй</div></body></html>"
+    responses.add(responses.GET, "https://example.com/page", body=page, content_type="text/html; charset=utf-8")
+    data = json.loads(http_request.invoke({"url": "https://example.com/page", "text_only": True}))
+    assert data["body"] == "Заголовок\nПервый абзац\nВторой"
+
+
+def test_body_reader_stops_early():
+    """BodyReader останавливает чтение на лимите и на объявленной длине."""
+    consumed = []
+
+    def chunks():
+        for i in range(100):
+            consumed.append(i)
+            yield b"x" * 1000
+
+    reader = BodyReader(2500)
+    for chunk in chunks():
+        if not reader.feed(chunk):
+            break
+    assert bytes(reader.getvalue()) == b"x" * 2500 and reader.truncated
+    assert len(consumed) == 3
+
+    exact = BodyReader(10_000, content_length=3000)
+    assert len(exact._buf) == 3000  # буфер сразу нужного размера
+    for chunk in (b"y" * 1000 for _ in range(3)):
+        exact.feed(chunk)
+    assert exact.complete and not exact.truncated
+    assert BodyReader(1000, content_length=5000).truncated
+    assert declared_length({"content-length": "10", "content-encoding": "gzip"}) is None
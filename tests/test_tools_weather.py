@@ -1,13 +1,18 @@
 """
-Тесты инструмента get_weather (Open-Meteo).
+Тесты инструментов get_weather и get_weather_many (Open-Meteo).
 """
 
+import asyncio
 import json
+import threading
+from urllib.parse import parse_qs, urlparse
 
+import httpx
 import pytest
 import responses
 
-from agent.tools import get_weather
+from agent import tools
+from agent.tools import get_weather, get_weather_many
 
 
 @responses.activate
@@ -77,3 +82,106 @@ def test_get_weather_city_not_found():
     )
     out = get_weather.invoke({"city": "NonExistentCity123"})
     assert "не найден" in out.lower() or "not found" in out.lower()
+
+
+GEOCODE_URL = "https://geocoding-api.open-meteo.com/v1/search"
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+_COORDS = {"berlin": (52.52, 13.41), "москва": (55.75, 37.62), "paris": (48.85, 2.35)}
+
+
+def _geocode_callback(request):
+    name = parse_qs(urlparse(str(request.url)).query)["name"][0]
+    coords = _COORDS.get(name.casefold())
+    results = [{"name": name.title(), "latitude": coords[0], "longitude": coords[1]}] if coords else []
+    return 200, {}, json.dumps({"results": results})
+
+
+def _forecast_callback(request):
+    query = parse_qs(urlparse(str(request.url)).query)
+    lats = query["latitude"][0].split(",")
+    items = [{"current_weather": {"temperature": float(lat), "windspeed": 1.0, "weathercode": 0}} for lat in lats]
+    return 200, {}, json.dumps(items if len(items) > 1 else items[0])
+
+
+def _calls(url: str) -> int:
+    return sum(1 for c in responses.calls if c.request.url.startswith(url))
+
+
+@responses.activate
+def test_get_weather_caches_geocode_and_forecast(tmp_weather_cache):
+    """Повтор (в другом написании) не ходит ни в геокодер, ни за прогнозом; геокодинг сохраняется на диск."""
+    responses.add_callback(responses.GET, GEOCODE_URL, callback=_geocode_callback)
+    responses.add_callback(responses.GET, FORECAST_URL, callback=_forecast_callback)
+    first = json.loads(get_weather.invoke({"city": "Berlin"}))
+    second = json.loads(get_weather.invoke({"city": "  BERLIN! "}))
+    assert first == second and first["temp_c"] == 52.52
+    assert _calls(GEOCODE_URL) == 1 and _calls(FORECAST_URL) == 1
+    assert "berlin|ru" in json.loads(tmp_weather_cache.read_text(encoding="utf-8"))
+
+    # Сброс кэша погоды (истёк TTL): геокодинг из кэша, прогноз — заново
+    tools._forecast_cache.clear()
+    get_weather.invoke({"city": "berlin"})
+    assert _calls(GEOCODE_URL) == 1 and _calls(FORECAST_URL) == 2
+
+
+@responses.activate
+def test_get_weather_many_single_forecast_request():
+    """Несколько городов — один запрос прогноза с координатами через запятую; порядок сохраняется."""
+    responses.add_callback(responses.GET, GEOCODE_URL, callback=_geocode_callback)
+    responses.add_callback(responses.GET, FORECAST_URL, callback=_forecast_callback)
+    out = json.loads(get_weather_many.invoke({"cities": ["Paris", "Москва", "Atlantis", "paris", "Berlin"]}))
+    assert [r["city"] for r in out] == ["Paris", "Москва", "Atlantis", "Berlin"]
+    assert [r.get("temp_c") for r in out] == [48.85, 55.75, None, 52.52]
+    assert out[2]["error"] == "Город не найден"
+    assert _calls(GEOCODE_URL) == 4 and _calls(FORECAST_URL) == 1
+
+    # Всё в кэше (включая «не найден») — без запросов
+    again = json.loads(get_weather_many.invoke({"cities": ["Berlin", "Atlantis", "Paris"]}))
+    assert [r["city"] for r in again] == ["Berlin", "Atlantis", "Paris"]
+    assert len(responses.calls) == 5
+
+
+def test_get_weather_many_limits(monkeypatch):
+    assert "пуст" in get_weather_many.invoke({"cities": [" "]})
+    monkeypatch.setattr(tools, "WEATHER_MAX_CITIES", 2)
+    assert "не больше 2" in get_weather_many.invoke({"cities": ["a", "b", "c"]})
+
+
+def test_aget_weather_many(monkeypatch):
+    """Async: геокодинг параллельно, прогноз одним запросом."""
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        status, _, body = (_geocode_callback if request.url.path == "/v1/search" else _forecast_callback)(request)
+        return httpx.Response(status, content=body.encode("utf-8"))
+
+    monkeypatch.setattr(tools, "_async_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    out = json.loads(asyncio.run(get_weather_many.ainvoke({"cities": ["Berlin", "Москва", "Paris"]})))
+    assert [r["temp_c"] for r in out] == [52.52, 55.75, 48.85]
+    assert seen.count("/v1/search") == 3 and seen.count("/v1/forecast") == 1
+
+
+def test_aget_weather_disk_cache_off_loop(monkeypatch, tmp_weather_cache):
+    """Async: файл кэша геокодинга читается и пишется не в потоке event loop."""
+    threads = []
+    _load = tools.TTLCache._load
+    for name in ("_load", "save"):
+        original = getattr(tools.TTLCache, name)
+
+        def record(self, *args, _original=original, **kwargs):
+            if self.path is not None and (_original is not _load or self._entries is None):
+                threads.append(threading.current_thread())
+            return _original(self, *args, **kwargs)
+
+        monkeypatch.setattr(tools.TTLCache, name, record)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        status, _, body = (_geocode_callback if request.url.path == "/v1/search" else _forecast_callback)(request)
+        return httpx.Response(status, content=body.encode("utf-8"))
+
+    monkeypatch.setattr(tools, "_async_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    out = json.loads(asyncio.run(get_weather.ainvoke({"city": "Berlin"})))
+    assert out["temp_c"] == 52.52
+    assert "berlin|ru" in json.loads(tmp_weather_cache.read_text(encoding="utf-8"))
+    assert threads and threading.main_thread() not in threads
@@ -0,0 +1,134 @@
+"""
+Тесты трассировки: вложенность span'ов, потоки, экспорт, покрытие хода агента.
+"""
+
+import contextvars
+import json
+import threading
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from agent.agent import AgentSession
+from agent.llm_client import TracingCallbackHandler
+from agent.tracing import NULL_SPAN, Tracer, reset_tracer, set_tracer, span, traced
+
+
+class _FakeToolModel(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def _names(tracer):
+    return {s.name for s in tracer.spans}
+
+
+def test_span_noop_without_tracer():
+    """Без трассировщика span — заглушка, ничего не записывается."""
+    with span("x") as s:
+        assert s is NULL_SPAN
+
+
+def test_nested_spans_and_threads():
+    """Дочерние span'ы, в т.ч. из потока с скопированным контекстом."""
+    def work():
+        with span("in_thread"):
+            pass
+
+    tracer = Tracer()
+    token = set_tracer(tracer)
+    try:
+        with span("root") as root:
+            with span("child"):
+                pass
+            ctx = contextvars.copy_context()
+            t = threading.Thread(target=ctx.run, args=(work,))
+            t.start()
+            t.join()
+    finally:
+        reset_tracer(token)
+    by_name = {s.name: s for s in tracer.spans}
+    assert by_name["child"].parent_id == root.span_id
+    assert by_name["in_thread"].parent_id == root.span_id
+    assert by_name["in_thread"].thread_id != root.thread_id
+    assert tracer.roots() == [root]
+    assert "child" in tracer.report(root)
+
+
+def test_tracer_keeps_last_roots():
+    """Хранятся только деревья последних max_roots ходов."""
+    tracer = Tracer(max_roots=2)
+    token = set_tracer(tracer)
+    try:
+        for i in range(5):
+            with span(f"turn{i}"):
+                with span(f"child{i}"):
+                    pass
+    finally:
+        reset_tracer(token)
+    assert [r.name for r in tracer.roots()] == ["turn3", "turn4"]
+    assert _names(tracer) == {"turn3", "child3", "turn4", "child4"}
+
+
+def test_traced_records_sizes():
+    """traced: размеры входа и выхода."""
+    @traced("op")
+    def op(text: str) -> str:
+        return text * 3
+
+    tracer = Tracer()
+    token = set_tracer(tracer)
+    try:
+        assert op("ab") == "ababab"
+    finally:
+        reset_tracer(token)
+    assert tracer.spans[0].attrs == {"in_chars": 2, "out_chars": 6}
+
+
+def test_export_formats(tmp_path):
+    """Экспорт в JSONL и Chrome trace."""
+    tracer = Tracer()
+    token = set_tracer(tracer)
+    try:
+        with span("root", k="v"):
+            with span("child"):
+                pass
+    finally:
+        reset_tracer(token)
+    tracer.export_jsonl(tmp_path / "t.jsonl")
+    lines = [json.loads(x) for x in (tmp_path / "t.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert [r["name"] for r in lines] == ["root", "child"]
+    assert lines[1]["parent"] == lines[0]["id"]
+    tracer.export_chrome(tmp_path / "t.json")
+    events = json.loads((tmp_path / "t.json").read_text(encoding="utf-8"))["traceEvents"]
+    assert {e["ph"] for e in events} == {"X"}
+    assert events[0]["args"] == {"k": "v"}
+
+
+def test_session_turn_is_traced(tmp_memory, tmp_workspace, mocker):
+    """Ход агента: память, контекст, вызовы модели и инструмента — внутри span'а turn."""
+    model = _FakeToolModel(
+        messages=iter([
+            AIMessage(content="", tool_calls=[{"name": "list_files", "args": {"path": "."}, "id": "c1"}]),
+            AIMessage(content="Пусто"),
+        ]),
+        callbacks=[TracingCallbackHandler()],
+    )
+    mocker.patch("agent.agent.get_llm", return_value=model)
+    tracer = Tracer()
+    session = AgentSession(tracer=tracer)
+    assert session.ask("Что в папке?") == "Пусто"
+
+    names = _names(tracer)
+    for expected in (
+        "turn", "agent.invoke", "context.build", "llm.call", "tool.list_files",
+        "memory.load_conversation", "memory.append_message", "memory.should_compact",
+    ):
+        assert expected in names, expected
+    (turn,) = tracer.roots()
+    tool_span = next(s for s in tracer.spans if s.name == "tool.list_files")
+    invoke_span = next(s for s in tracer.spans if s.name == "agent.invoke")
+    assert tool_span.parent_id == invoke_span.span_id
+    assert invoke_span.parent_id == turn.span_id
+    assert sum(1 for s in tracer.spans if s.name == "llm.call") == 2
+    assert "tool.list_files" in tracer.report(turn)
@@ -0,0 +1,38 @@
+"""
+Тесты кэша с TTL (ttl_cache.py).
+"""
+
+import json
+import time
+
+from agent.ttl_cache import TTLCache
+
+
+def test_expiry_and_lru():
+    cache = TTLCache(60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=-1)  # уже просрочена
+    assert cache.get("a") == 1 and cache.get("b") is None
+    cache.set("c", 3)
+    cache.get("a")
+    cache.set("d", 4)  # вытесняет c: a использовалась позже
+    assert cache.get("c", "нет") == "нет" and cache.get("a") == 1
+    assert cache.stats() == {"hits": 3, "misses": 2, "entries": 2}
+
+
+def test_persisted_between_instances(tmp_path):
+    """Файл читается при первом обращении; просроченные записи отбрасываются; без изменений файл не пишется."""
+    path = tmp_path / "c.json"
+    cache = TTLCache(60, path=path)
+    cache.set("город", {"lat": 1.5}, save=False)
+    assert not path.exists()
+    cache.set("старое", 1, ttl=1)
+    data = json.loads(path.read_text(encoding="utf-8"))
+    data["старое"][0] = time.time() - 1
+    path.write_text(json.dumps(data), encoding="utf-8")
+
+    reloaded = TTLCache(60, path=path)
+    assert reloaded.get("город") == {"lat": 1.5} and reloaded.get("старое") is None
+    mtime = path.stat().st_mtime_ns
+    reloaded.save()
+    assert path.stat().st_mtime_ns == mtime